@@ -1,4 +1,4 @@
 from .catalog_client.geonetwork.models.model import AvisoCatalog, AvisoProduct
-from .core import details, get, summary
+from .core import details, estimate, get, summary
 
-__all__ = ["summary", "details", "get", "AvisoProduct", "AvisoCatalog"]
+__all__ = ["summary", "details", "get", "estimate", "AvisoProduct", "AvisoCatalog"]
@@ -0,0 +1,193 @@
+import logging
+import pathlib as pl
+import sqlite3
+import threading
+import time
+from typing import Sequence
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from .. import metrics
+
+logger = logging.getLogger(__name__)
+
+# Default time to live of the cached catalogs in seconds, by level in the
+# catalogs tree. The last value applies to the deeper levels. Catalogs older
+# than their time to live are revalidated with a conditional request
+DEFAULT_CATALOG_TTLS = (0.0,)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalogs (
+    url TEXT PRIMARY KEY,
+    final_url TEXT NOT NULL,
+    content BLOB NOT NULL,
+    content_type TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    checked REAL NOT NULL
+)
+"""
+
+
+class CatalogCache:
+    """SQLite file caching THREDDS catalog documents, keyed by url.
+
+    A cached catalog younger than the time to live of its level is used
+    without requesting the server. An older one is revalidated with a
+    conditional request (If-None-Match and If-Modified-Since headers built from
+    its ETag and Last-Modified headers): the server only sends the catalog
+    again if it has changed. The cache can be shared by threads and processes.
+
+    Parameters
+    ----------
+    path: str | pl.Path
+        path of the cache file, created if it does not exist
+    ttls: Sequence[float]
+        time to live in seconds of the catalogs of each level of the tree,
+        starting with the root catalog of the product. The last value applies
+        to the deeper levels. For instance, (0, 0, 86400) always revalidates the
+        product and version catalogs, and uses the cycle catalogs for a day
+        without requesting the server
+
+    Raises
+    ------
+    ValueError
+        In case no time to live is given, or one is negative
+    """
+
+    def __init__(
+        self, path: str | pl.Path, ttls: Sequence[float] = DEFAULT_CATALOG_TTLS
+    ):
+        if not ttls or any(ttl < 0 for ttl in ttls):
+            msg = f"Invalid catalog TTLs {ttls}: expected non-negative durations."
+            raise ValueError(msg)
+
+        self.path = pl.Path(path)
+        self.ttls = tuple(ttls)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        with self._connection:
+            self._connection.execute(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Close the cache file."""
+        self._connection.close()
+
+    def ttl(self, level: int) -> float:
+        """Time to live in seconds of the catalogs of a level of the tree."""
+        return self.ttls[min(level, len(self.ttls) - 1)]
+
+    def get(
+        self, session: requests.Session, url: str, level: int = 0, **kwargs
+    ) -> requests.Response:
+        """Get a catalog document from the cache, or from the server.
+
+        Parameters
+        ----------
+        session: requests.Session
+            session requesting the server
+        url: str
+            url of the catalog document
+        level: int
+            level of the catalog in the tree, the root being 0
+        kwargs
+            arguments of the request to the server, such as a timeout. The
+            validators of the cached document are added to its headers
+
+        Returns
+        -------
+            the response of the server, or a response built from the cache
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT final_url, content, content_type, etag, last_modified, "
+                "checked FROM catalogs WHERE url = ?",
+                (url,),
+            ).fetchone()
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        if row is not None:
+            final_url, content, content_type, etag, last_modified, checked = row
+            if time.time() - checked < self.ttl(level):
+                logger.debug("Catalog %s is fresh in the cache", url)
+                metrics.count(metrics.CACHED_CATALOGS, 1, url)
+                return _cached_response(final_url, content, content_type)
+
+            if etag is not None:
+                headers["If-None-Match"] = etag
+            if last_modified is not None:
+                headers["If-Modified-Since"] = last_modified
+
+        response = session.get(url, headers=headers, **kwargs)
+
+        if row is not None and response.status_code == 304:
+            logger.debug("Catalog %s has not changed", url)
+            with self._lock, self._connection:
+                self._connection.execute(
+                    "UPDATE catalogs SET checked = ? WHERE url = ?", (time.time(), url)
+                )
+            metrics.count(metrics.CACHED_CATALOGS, 1, url)
+            return _cached_response(final_url, content, content_type)
+
+        if response.status_code == 200:
+            with self._lock, self._connection:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO catalogs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        url,
+                        response.url,
+                        response.content,
+                        response.headers.get("Content-Type"),
+                        response.headers.get("ETag"),
+                        response.headers.get("Last-Modified"),
+                        time.time(),
+                    ),
+                )
+        return response
+
+
+class CachedSession:
+    """Session getting the catalog documents through a cache.
+
+    Parameters
+    ----------
+    session: requests.Session
+        session requesting the server
+    cache: CatalogCache
+        the cache of the catalogs
+    level: int
+        level in the tree of the catalogs requested
+    """
+
+    def __init__(self, session: requests.Session, cache: CatalogCache, level: int):
+        self.session = session
+        self.cache = cache
+        self.level = level
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.cache.get(self.session, url, self.level, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+def _cached_response(
+    url: str, content: bytes, content_type: str | None
+) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.url = url
+    response._content = content
+    response.headers = CaseInsensitiveDict(
+        {"Content-Type": content_type or "application/xml"}
+    )
+    return response
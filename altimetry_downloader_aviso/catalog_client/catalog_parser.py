@@ -0,0 +1,246 @@
+import io
+import logging
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from urllib.parse import urljoin, urlparse
+
+import numpy as np
+import pandas as pd
+import requests
+from siphon.http_util import session_manager
+
+from .catalog_cache import CachedSession, CatalogCache
+
+logger = logging.getLogger(__name__)
+
+# Multipliers of the dataSize units used in THREDDS catalogs
+DATA_SIZE_UNITS = {
+    "bytes": 1,
+    "kbytes": 1e3,
+    "mbytes": 1e6,
+    "gbytes": 1e9,
+    "tbytes": 1e12,
+    "pbytes": 1e15,
+}
+
+_XLINK = "{http://www.w3.org/1999/xlink}"
+
+
+@dataclass(slots=True)
+class CatalogDataset:
+    """Dataset of a THREDDS catalog, reduced to the fields of a granule.
+
+    Attributes
+    ----------
+    name: str
+        name of the dataset
+    url_path: str
+        path of the dataset, relative to the bases of the services
+    access_urls: dict[str, str]
+        urls of the dataset by service type ('HTTPServer', 'NetcdfSubset'...)
+    data_size: int | None
+        size in bytes given by the dataSize element
+    modified: np.datetime64 | None
+        date given by the modification date element
+    """
+
+    name: str
+    url_path: str
+    access_urls: dict[str, str] = field(default_factory=dict)
+    data_size: int | None = None
+    modified: np.datetime64 | None = None
+
+
+@dataclass(slots=True)
+class CatalogReference:
+    """Reference of a THREDDS catalog to a sub-catalog.
+
+    Attributes
+    ----------
+    title: str
+        title of the sub-catalog
+    href: str
+        absolute url of the sub-catalog
+    """
+
+    title: str
+    href: str
+
+
+@dataclass
+class Catalog:
+    """THREDDS client catalog, reduced to its datasets and sub-catalogs.
+
+    It exposes the 'datasets' and 'catalog_refs' of a siphon TDSCatalog, keyed
+    by dataset name and sub-catalog title.
+
+    Attributes
+    ----------
+    catalog_url: str
+        url of the catalog
+    datasets: dict[str, CatalogDataset]
+        the datasets with a urlPath
+    catalog_refs: dict[str, CatalogReference]
+        the references to the sub-catalogs
+    """
+
+    catalog_url: str
+    datasets: dict[str, CatalogDataset] = field(default_factory=dict)
+    catalog_refs: dict[str, CatalogReference] = field(default_factory=dict)
+
+
+def dataset_stats(element: ET.Element) -> tuple[int | None, np.datetime64 | None]:
+    """Size in bytes and modification date of a dataset element.
+
+    Note that THREDDS rounds the dataSize to 4 significant digits.
+
+    Returns
+    -------
+        the size given by the dataSize child and the date given by the
+        modification date child, None if missing or invalid
+    """
+    data_size = None
+    modified = None
+    for child in element:
+        tag_type = child.tag.rpartition("}")[2]
+        if tag_type == "dataSize":
+            unit = DATA_SIZE_UNITS.get(child.attrib.get("units", "bytes").lower())
+            if unit is not None and child.text:
+                try:
+                    data_size = round(float(child.text) * unit)
+                except (ValueError, OverflowError):
+                    logger.debug("Invalid dataSize %r", child.text)
+        elif (
+            tag_type == "date" and child.attrib.get("type") == "modified" and child.text
+        ):
+            modified = _modified_date(child.text)
+    return data_size, modified
+
+
+def _modified_date(text: str) -> np.datetime64 | None:
+    """Date of a modification date element, converted to UTC."""
+    try:
+        date = pd.Timestamp(text.strip())
+    except ValueError:
+        logger.debug("Invalid modification date %r", text)
+        return None
+    if pd.isna(date):
+        return None
+    if date.tzinfo is not None:
+        date = date.tz_convert("UTC").tz_localize(None)
+    return np.datetime64(date.to_datetime64(), "s")
+
+
+def parse_catalog(content: bytes, catalog_url: str) -> Catalog:
+    """Parse a THREDDS client catalog document.
+
+    Unlike siphon, the document is parsed as a stream of elements which are
+    dropped once read, and only the fields of the granules are kept: the urls,
+    sizes and modification dates of the datasets and the urls of the
+    sub-catalogs. The access urls are built from the services named by the
+    serviceName element of the catalog, as siphon does. Dataset access elements
+    and latest.xml resolvers are not supported.
+
+    Parameters
+    ----------
+    content: bytes
+        the catalog document
+    catalog_url: str
+        url of the catalog, against which the relative urls are resolved
+
+    Returns
+    -------
+        the catalog
+    """
+    catalog = Catalog(catalog_url)
+    # (service type, base) of the services, by name. A compound service lists
+    # its sub-services
+    services: dict[str, list[tuple[str, str]]] = {}
+    service_name = None
+    tag_types = {}
+
+    for _, element in ET.iterparse(io.BytesIO(content)):
+        tag = element.tag
+        tag_type = tag_types.get(tag)
+        if tag_type is None:
+            tag_type = tag_types[tag] = tag.rpartition("}")[2]
+
+        if tag_type == "dataset":
+            url_path = element.attrib.get("urlPath")
+            if url_path is not None:
+                name = element.attrib["name"]
+                data_size, modified = dataset_stats(element)
+                catalog.datasets[name] = CatalogDataset(
+                    name, url_path, data_size=data_size, modified=modified
+                )
+            element.clear()
+        elif tag_type == "catalogRef":
+            reference = CatalogReference(
+                element.attrib[f"{_XLINK}title"],
+                urljoin(catalog_url, element.attrib[f"{_XLINK}href"]),
+            )
+            catalog.catalog_refs[reference.title] = reference
+            element.clear()
+        elif tag_type == "service":
+            attrib = element.attrib
+            if attrib["serviceType"].lower() == "compound":
+                services[attrib["name"]] = [
+                    (s.attrib["serviceType"], s.attrib["base"]) for s in element
+                ]
+            else:
+                services[attrib["name"]] = [(attrib["serviceType"], attrib["base"])]
+        elif tag_type == "serviceName":
+            service_name = element.text.strip()
+
+    scheme, netloc, *_ = urlparse(catalog_url)
+    server_url = f"{scheme}://{netloc}"
+    bases = [
+        (service_type, urljoin(server_url, base))
+        for service_type, base in services.get(service_name, [])
+        if service_type.lower() != "resolver"
+    ]
+    for dataset in catalog.datasets.values():
+        dataset.access_urls = {
+            service_type: base + dataset.url_path for service_type, base in bases
+        }
+
+    return catalog
+
+
+def fetch_catalog(
+    catalog_url: str, cache: CatalogCache | None = None, level: int = 0
+) -> Catalog:
+    """Request and parse a THREDDS client catalog with parse_catalog.
+
+    Parameters
+    ----------
+    catalog_url: str
+        url of the catalog
+    cache: CatalogCache | None
+        cache of the catalog documents. The catalog is requested from the server
+        if not provided
+    level: int
+        level of the catalog in the tree, selecting its time to live in the
+        cache
+
+    Returns
+    -------
+        the catalog, which urls are resolved against the final url of the
+        request
+
+    Raises
+    ------
+    requests.HTTPError
+        In case the server answers with an error
+    """
+    session: requests.Session | CachedSession = session_manager.create_session()
+    if cache is not None:
+        session = CachedSession(session, cache, level)
+    try:
+        response = session.get(catalog_url)
+        response.raise_for_status()
+    finally:
+        session.close()
+
+    logger.debug("Parse catalog %s", response.url)
+    return parse_catalog(response.content, response.url)
@@ -1,8 +1,12 @@
 import logging
 import os
+from typing import Iterator
 
+import pandas as pd
 import requests
 
+from .. import metrics
+from .catalog_cache import CatalogCache
 from .geonetwork import (
     AvisoCatalog,
     AvisoProduct,
@@ -11,7 +15,8 @@ from .geonetwork import (
     parse_catalog_response,
     parse_product_response,
 )
-from .granule_discoverer import filter_granules
+from .granule_discoverer import filter_granules, stream_granules
+from .granule_index import GranuleIndex
 
 logger = logging.getLogger(__name__)
 
@@ -61,19 +66,76 @@ def get_details(product_short_name: str) -> AvisoProduct:
     return product
 
 
-def search_granules(product_short_name: str, **filters) -> list[str]:
+def search_granules(
+    product_short_name: str,
+    detail: bool = False,
+    catalog_cache: CatalogCache | None = None,
+    granule_index: GranuleIndex | None = None,
+    **filters,
+) -> pd.Series | pd.DataFrame:
     """Search for granules of a product in AVISO's Thredds Data Server.
 
     Parameters
     ----------
     product_short_name: str
         the short name of the product
+    detail: bool
+        whether to return the granules metadata along with their urls
+    catalog_cache: CatalogCache | None
+        cache of the THREDDS catalog documents
+    granule_index: GranuleIndex | None
+        index of the granules answering the search offline. The product is
+        indexed first if it is not indexed yet or if its index is outdated. The
+        filters are then restricted to the fields of the granule names, and to
+        the default values of the fields with a default filter
     **filters
         filters for files selection
 
     Returns
     -------
-        the urls of the granules corresponding to the provided filters
+        a series of the urls of the granules corresponding to the provided
+        filters, named 'filename', or a dataframe with the urls ('filename'),
+        sizes and modification dates of the granules if detail=True
+
+    Raises
+    ------
+    InvalidProductError
+        In case the product short name doesn't correspond to any product
+    InvalidIndexFilterError
+        In case a filter cannot be searched in the granule index
+    """
+    if granule_index is not None:
+        if granule_index.is_outdated(product_short_name):
+            product = _get_product_from_short_name(product_short_name)
+            granule_index.refresh(product, catalog_cache=catalog_cache)
+        return granule_index.query(product_short_name, detail=detail, **filters)
+
+    product = _get_product_from_short_name(product_short_name)
+    return filter_granules(
+        product, detail=detail, catalog_cache=catalog_cache, **filters
+    )
+
+
+def search_granules_stream(
+    product_short_name: str, catalog_cache: CatalogCache | None = None, **filters
+) -> Iterator[pd.DataFrame]:
+    """Search for granules of a product in AVISO's Thredds Data Server, catalog
+    by catalog.
+
+    Parameters
+    ----------
+    product_short_name: str
+        the short name of the product
+    catalog_cache: CatalogCache | None
+        cache of the THREDDS catalog documents
+    **filters
+        filters for files selection
+
+    Returns
+    -------
+        An iterator over dataframes with the urls ('filename'), sizes and
+        modification dates of the granules of each catalog, as soon as the
+        catalog is received
 
     Raises
     ------
@@ -81,7 +143,7 @@ def search_granules(product_short_name: str, **filters) -> list[str]:
         In case the product short name doesn't correspond to any product
     """
     product = _get_product_from_short_name(product_short_name)
-    return filter_granules(product, **filters)
+    return stream_granules(product, catalog_cache=catalog_cache, **filters)
 
 
 def _get_product_from_short_name(product_short_name: str) -> AvisoProduct:
@@ -107,6 +169,7 @@ def _request_catalog() -> dict:
         .build()
     )
 
+    metrics.count(metrics.CATALOG_REQUESTS, 1, url)
     resp = requests.post(url, json=payload, headers={"Accept": "application/json"})
     resp.raise_for_status()
 
@@ -117,6 +180,7 @@ def _request_product(product_id: str, timeout: float = 10.0):
     """Request AVISO's catalog product details."""
     url = os.path.join(AVISO_CATALOG_URL, "records", product_id)
 
+    metrics.count(metrics.CATALOG_REQUESTS, 1, url)
     try:
         resp = requests.get(
             url, headers={"Accept": "application/json"}, timeout=timeout
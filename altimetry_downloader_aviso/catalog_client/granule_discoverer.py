@@ -1,14 +1,27 @@
 import logging
 import typing as tp
 import warnings
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dataclasses import dataclass
 from pathlib import Path
 from urllib.parse import urljoin
 
+import pandas as pd
+import requests
+import siphon.catalog
 import yaml
-from fcollections.core import FileDiscoverer, FileNameConvention, ITreeIterable, Layout
-from siphon.catalog import TDSCatalog
-
+from fcollections.core import (
+    FileDiscoverer,
+    FileNameConvention,
+    FileNameField,
+    ITreeIterable,
+    Layout,
+)
+
+from .. import config, metrics
+from ..config import CATALOG_PARSERS, DEFAULT_CATALOG_PARSER, DEFAULT_CRAWL_WORKERS
+from .catalog_cache import CachedSession, CatalogCache
+from .catalog_parser import Catalog, dataset_stats, fetch_catalog
 from .geonetwork import AvisoProduct
 
 with warnings.catch_warnings():
@@ -23,73 +36,299 @@ TDS_CATALOG_BASE_URL = "https://tds-odatis.aviso.altimetry.fr/thredds/catalog/"
 
 TDS_LAYOUT_CONFIG = Path(__file__).parent / "resources" / "tds_layout.yaml"
 
+# Granule metadata read from the THREDDS catalogs
+GRANULE_STAT_FIELDS = ("size", "modified", "ncss")
+
+# Service type of the NetCDF Subset Service in the THREDDS catalogs
+NCSS_SERVICE = "NetcdfSubset"
+
+
+class TDSCatalog(siphon.catalog.TDSCatalog):
+    """THREDDS client catalog keeping the size and modification date of its
+    datasets.
+
+    Each dataset gets a 'data_size' attribute, the size in bytes given by its
+    dataSize element, and a 'modified' attribute, the np.datetime64 given by
+    its modification date element. Both are None if missing from the catalog.
+
+    Note that THREDDS rounds the dataSize to 4 significant digits.
+
+    The class overrides the private '_process_dataset' method and 'session'
+    attribute of siphon's TDSCatalog, which is pinned accordingly in the
+    dependencies.
+
+    Parameters
+    ----------
+    catalog_url
+        the url of the catalog
+    cache
+        cache of the catalog documents. The catalog is requested from the server
+        if not provided
+    level
+        level of the catalog in the tree, selecting its time to live in the
+        cache
+    """
+
+    def __init__(
+        self, catalog_url: str, cache: CatalogCache | None = None, level: int = 0
+    ):
+        self._cache = cache
+        self._level = level
+        super().__init__(catalog_url)
+
+    @property
+    def session(self) -> requests.Session | CachedSession:
+        return self._session
+
+    @session.setter
+    def session(self, session: requests.Session):
+        # siphon requests the catalog document with the session it creates
+        self._session = (
+            session
+            if self._cache is None
+            else CachedSession(session, self._cache, self._level)
+        )
+
+    def _process_dataset(self, element):
+        super()._process_dataset(element)
+        dataset = self.datasets[element.attrib["name"]]
+        dataset.data_size, dataset.modified = dataset_stats(element)
+
 
 class TDSIterable(ITreeIterable):
     """List files or links in a TDS Server.
 
+    The catalogs are fetched concurrently: the sub-catalogs of a catalog are
+    requested as soon as it is received, by a pool of max_workers threads. The
+    granules are listed in the same order as a depth-first walk of the catalogs.
+
     Parameters
     ----------
     layout
         Layout allowing to guess the tree structure and eventually discard some
         branches along the search
+    max_workers
+        maximum number of catalogs fetched at the same time
+    cache
+        cache of the catalog documents. The catalogs are requested from the
+        server if not provided
+    parser
+        parser of the catalog documents: 'siphon' builds a full siphon
+        TDSCatalog, 'fast' only reads the fields of the granules with
+        catalog_parser.parse_catalog, which is quicker on large catalogs
+
+    Raises
+    ------
+    ValueError
+        In case the parser is unknown
     """
 
-    def __init__(self, layout: Layout | None = None):
+    def __init__(
+        self,
+        layout: Layout | None = None,
+        max_workers: int = DEFAULT_CRAWL_WORKERS,
+        cache: CatalogCache | None = None,
+        parser: str = DEFAULT_CATALOG_PARSER,
+    ):
+        if parser not in CATALOG_PARSERS:
+            msg = (
+                f"Invalid catalog parser '{parser}': choose one of "
+                f"{', '.join(CATALOG_PARSERS)}."
+            )
+            raise ValueError(msg)
+
         super().__init__(layout)
+        self.max_workers = max_workers
+        self.cache = cache
+        self.parser = parser
 
     def find(
         self, root: str, detail: bool = False, **filters: tp.Any
-    ) -> tp.Iterator[str | dict[str, str]]:
-
+    ) -> tp.Iterator[str | dict[str, tp.Any]]:
+        """List the granules below a catalog.
+
+        Parameters
+        ----------
+        root
+            url of the catalog.xml to start the search from
+        detail
+            whether to return the granules metadata along with their urls
+        **filters
+            filters for catalogs selection over the fields declared in the layout
+
+        Returns
+        -------
+            The granules urls, or dictionaries with the 'name' (url), 'size'
+            (bytes), 'modified' (np.datetime64) and 'ncss' (NetCDF Subset Service
+            url, None if not served) of the granules if detail=True
+        """
         if self.layout is not None:
             self.layout.set_filters(**filters)
 
         logger.debug("Browsing TDS layout with filters: %s", filters)
 
-        return self._find(root, **filters)
-
-    def _find(self, url: str, level: int = 0, **filters):
-        cat = TDSCatalog(url)
-
-        results = [d.access_urls["HTTPServer"] for d in cat.datasets.values()]
-
-        for folder, ref in cat.catalog_refs.items():
-            # If name doesn't correspond to filters, continue
-            if self.layout is not None and not self.layout.test(level, folder):
-                logger.debug("Ignore folder %s", folder)
-                continue
-
-            next_level = level + 1
-
-            # Each `catalog_refs` should have (name, ref), and it should be possible
-            # to follow `ref` with `child = ref.follow()`. But there is a "name"
-            # marker missing somewhere in the Odatis TDS catalog.xml, so it's not
-            # possible to follow the ref directly.
-            # Instead, we use the `href` and create a new TDSCatalog object with it.
-            # Example:
-            #   ref.href = https://tds-odatis.aviso.altimetry.fr/thredds/catalog/
-            #              dataset-l3-swot-karin-nadir-validated/l3_lr_ssh/v1_0_1/Unsmoothed/
-            #              cycle_001/catalog.xml
+        results = self._find(root)
+        if detail:
+            return results
+        return [r["name"] for r in results]
+
+    def iter_find(
+        self, root: str, **filters: tp.Any
+    ) -> tp.Iterator[list[dict[str, tp.Any]]]:
+        """List the granules below a catalog, catalog by catalog.
+
+        Parameters
+        ----------
+        root
+            url of the catalog.xml to start the search from
+        **filters
+            filters for catalogs selection over the fields declared in the layout
+
+        Yields
+        ------
+        :
+            The granules of each catalog as soon as it is received, as
+            dictionaries like those of find(detail=True). The catalogs come in
+            the order in which they are received
+        """
+        if self.layout is not None:
+            self.layout.set_filters(**filters)
 
-            results += self._find(ref.href, next_level, **filters)
+        logger.debug("Streaming TDS layout with filters: %s", filters)
 
-        return results
+        for _, granules, _ in self._crawl(root):
+            yield granules
 
+    def _find(self, root: str) -> list[dict[str, tp.Any]]:
+        # Granules and sub-catalogs urls of each catalog, in the catalog order
+        tree = {
+            url: (granules, children) for url, granules, children in self._crawl(root)
+        }
+        return _walk(tree, root)
 
-def filter_granules(product: AvisoProduct, **filters) -> list[str]:
+    def _crawl(self, root: str) -> tp.Iterator[tuple[str, list, list[str]]]:
+        """Fetch the catalogs below root, and yield the url, the granules and
+        the sub-catalogs urls of each catalog as soon as it is received."""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            future = metrics.submit(
+                executor, _fetch_catalog, root, 0, self.cache, self.parser
+            )
+            pending = {future: (root, 0)}
+            try:
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        url, level = pending.pop(future)
+                        cat = future.result()
+
+                        children = []
+                        for folder, ref in cat.catalog_refs.items():
+                            # If name doesn't correspond to filters, continue
+                            if self.layout is not None and not self.layout.test(
+                                level, folder
+                            ):
+                                logger.debug("Ignore folder %s", folder)
+                                continue
+
+                            # Each `catalog_refs` should have (name, ref), and it
+                            # should be possible to follow `ref` with
+                            # `child = ref.follow()`. But there is a "name" marker
+                            # missing somewhere in the Odatis TDS catalog.xml, so
+                            # it's not possible to follow the ref directly.
+                            # Instead, we use the `href` and create a new
+                            # TDSCatalog object with it.
+                            # Example:
+                            #   ref.href = https://tds-odatis.aviso.altimetry.fr/
+                            #              thredds/catalog/dataset-l3-swot-karin-
+                            #              nadir-validated/l3_lr_ssh/v1_0_1/
+                            #              Unsmoothed/cycle_001/catalog.xml
+                            children.append(ref.href)
+                            future = metrics.submit(
+                                executor,
+                                _fetch_catalog,
+                                ref.href,
+                                level + 1,
+                                self.cache,
+                                self.parser,
+                            )
+                            pending[future] = (ref.href, level + 1)
+
+                        yield url, _granules(cat), children
+            finally:
+                # Do not fetch the remaining catalogs if one failed or the
+                # iteration is stopped
+                for future in pending:
+                    future.cancel()
+
+
+def _fetch_catalog(
+    url: str,
+    level: int,
+    cache: CatalogCache | None,
+    parser: str = DEFAULT_CATALOG_PARSER,
+) -> TDSCatalog | Catalog:
+    with metrics.timed(metrics.CATALOG, url):
+        if parser == "fast":
+            cat = fetch_catalog(url, cache, level)
+        elif cache is None:
+            cat = TDSCatalog(url)
+        else:
+            cat = TDSCatalog(url, cache, level)
+    metrics.count(metrics.CATALOGS, 1, url)
+    return cat
+
+
+def _granules(cat: TDSCatalog | Catalog) -> list[dict[str, tp.Any]]:
+    return [
+        {
+            "name": d.access_urls["HTTPServer"],
+            "size": d.data_size,
+            "modified": d.modified,
+            # siphon's case insensitive access urls do not implement get
+            "ncss": (
+                d.access_urls[NCSS_SERVICE] if NCSS_SERVICE in d.access_urls else None
+            ),
+        }
+        for d in cat.datasets.values()
+    ]
+
+
+def _walk(tree: dict, url: str) -> list[dict[str, tp.Any]]:
+    """Granules of a catalog and of its sub-catalogs, depth-first."""
+    granules, children = tree[url]
+    results = list(granules)
+    for child in children:
+        results += _walk(tree, child)
+    return results
+
+
+def filter_granules(
+    product: AvisoProduct,
+    detail: bool = False,
+    catalog_cache: CatalogCache | None = None,
+    **filters,
+) -> list[str] | pd.DataFrame:
     """Filter granules of a product in AVISO's Thredds Data Server.
 
     Parameters
     ----------
     product
         the aviso product
+    detail
+        whether to return the granules metadata along with their urls
+    catalog_cache
+        cache of the catalog documents
     **filters
         filters for files selection
 
     Returns
     -------
-    list[str]
-        the urls of the granules corresponding to the provided filters
+    list[str] | pd.DataFrame
+        the urls of the granules corresponding to the provided filters. If
+        detail=True, a dataframe with the fields parsed from the granules names,
+        the urls in a 'filename' column, the sizes in bytes in a 'size' column,
+        the modification dates in a 'modified' column and the NetCDF Subset
+        Service urls in a 'ncss' column
     """
     logger.info(
         "Filtering %s product with filters %s...",
@@ -97,28 +336,127 @@ def filter_granules(product: AvisoProduct, **filters) -> list[str]:
         (lambda d: str(d))(filters),
     )
 
-    # Get TDS product layout
-    product_layout_conf = _parse_tds_layout(product)
-
-    # Build TDS catalog URL
-    tds_url = urljoin(
-        TDS_CATALOG_BASE_URL,
-        str(Path(product_layout_conf.catalog_path) / "catalog.xml"),
-    )
+    product_layout_conf, tds_url = _product_catalog(product)
 
     # Create the file discoverer for this TDS catalog
     file_discoverer = FileDiscoverer(
         parser=product_layout_conf.convention,
-        iterable=TDSIterable(layout=product_layout_conf.layout),
+        iterable=TDSIterable(
+            layout=product_layout_conf.layout,
+            max_workers=config.crawl_workers(),
+            cache=catalog_cache,
+            parser=config.catalog_parser(),
+        ),
     )
 
     filters = {**product_layout_conf.default_filters, **filters}
 
-    granules = file_discoverer.list(path=tds_url, **filters)
+    with metrics.timed(metrics.DISCOVERY):
+        if detail:
+            granules = file_discoverer.list(
+                path=tds_url, stat_fields=GRANULE_STAT_FIELDS, **filters
+            )
+        else:
+            granules = file_discoverer.list(path=tds_url, **filters)
+    metrics.count(metrics.GRANULES, len(granules))
 
+    if detail:
+        return granules
     return granules.filename
 
 
+def stream_granules(
+    product: AvisoProduct, catalog_cache: CatalogCache | None = None, **filters
+) -> tp.Iterator[pd.DataFrame]:
+    """Filter granules of a product in AVISO's Thredds Data Server, catalog by
+    catalog.
+
+    Unlike filter_granules, the granules of each catalog are yielded as soon as
+    the catalog is received and filtered, while the other catalogs are still
+    being fetched.
+
+    Parameters
+    ----------
+    product
+        the aviso product
+    catalog_cache
+        cache of the catalog documents
+    **filters
+        filters for files selection
+
+    Yields
+    ------
+    pd.DataFrame
+        the granules of each catalog corresponding to the provided filters,
+        with the columns of filter_granules(detail=True). The catalogs come in
+        the order in which they are received
+    """
+    logger.info("Streaming %s product with filters %s...", product.short_name, filters)
+
+    product_layout_conf, tds_url = _product_catalog(product)
+    layout = product_layout_conf.layout
+    filters = {**product_layout_conf.default_filters, **filters}
+    layout_filters = {k: v for k, v in filters.items() if k in layout.names}
+
+    iterable = TDSIterable(
+        layout=layout,
+        max_workers=config.crawl_workers(),
+        cache=catalog_cache,
+        parser=config.catalog_parser(),
+    )
+    # The discovery lasts until the last catalog is received, including the
+    # downloads started in the meantime
+    with metrics.timed(metrics.DISCOVERY):
+        for catalog_granules in iterable.iter_find(tds_url, **layout_filters):
+            # The catalogs are already pruned by the layout: only the file name
+            # convention filters remain to be applied
+            file_discoverer = FileDiscoverer(
+                parser=product_layout_conf.convention,
+                iterable=_GranuleList(catalog_granules),
+            )
+            granules = file_discoverer.list(
+                path=tds_url, stat_fields=GRANULE_STAT_FIELDS, **filters
+            )
+            metrics.count(metrics.GRANULES, len(granules))
+            yield granules
+
+
+def granule_fields(product: AvisoProduct) -> list[FileNameField]:
+    """Fields parsed from the granule names of a product, in the order of the
+    columns of filter_granules(detail=True)."""
+    return _parse_tds_layout(product).convention.fields
+
+
+def default_filters(product: AvisoProduct) -> dict:
+    """Filters applied to the granules of a product when not overridden, such
+    as its version."""
+    return _parse_tds_layout(product).default_filters
+
+
+class _GranuleList(ITreeIterable):
+    """Granules already listed, as a tree iterable of a file discoverer."""
+
+    def __init__(self, granules: list[dict[str, tp.Any]]):
+        super().__init__()
+        self.granules = granules
+
+    def find(self, root: str, detail: bool = False, **filters: tp.Any):
+        return self.granules
+
+
+def _product_catalog(product: AvisoProduct) -> tuple["ProductLayoutConfig", str]:
+    """Layout configuration and root catalog url of a product."""
+    # Get TDS product layout
+    product_layout_conf = _parse_tds_layout(product)
+
+    # Build TDS catalog URL
+    tds_url = urljoin(
+        TDS_CATALOG_BASE_URL,
+        str(Path(product_layout_conf.catalog_path) / "catalog.xml"),
+    )
+    return product_layout_conf, tds_url
+
+
 def _load_convention_layout(
     granule_discovery: dict, data_type: str
 ) -> tuple[FileNameConvention, Layout]:
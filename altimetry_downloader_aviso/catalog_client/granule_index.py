@@ -0,0 +1,384 @@
+import io
+import logging
+import pathlib as pl
+import sqlite3
+import threading
+import time
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from fcollections.core import FileNameField, FileNameFieldInteger
+from fcollections.time import Period
+
+from .catalog_cache import CatalogCache
+from .geonetwork import AvisoProduct
+from .granule_discoverer import (
+    GRANULE_STAT_FIELDS,
+    default_filters,
+    filter_granules,
+    granule_fields,
+)
+
+logger = logging.getLogger(__name__)
+
+# Unit of the times stored in the index. Microseconds cover the unbounded
+# periods of the time filters, from year 1 to 9999
+TIME_UNIT = "datetime64[us]"
+
+_PRODUCTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    short_name TEXT PRIMARY KEY,
+    id TEXT NOT NULL,
+    granules INTEGER NOT NULL,
+    refreshed REAL NOT NULL
+)
+"""
+
+_COLUMNS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS columns (
+    short_name TEXT NOT NULL,
+    name TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (short_name, name)
+)
+"""
+
+
+class InvalidIndexFilterError(ValueError):
+    """Raised when a filter cannot be searched in a granule index."""
+
+
+class GranuleIndex:
+    """SQLite file indexing the granules of products, to search them offline.
+
+    The granules of a product are listed once by browsing the THREDDS catalogs,
+    like search_granules does, with the default filters of the product. The
+    fields parsed from their names (cycle and pass numbers, period, version,
+    subset...), their urls, sizes, modification dates and NetCDF Subset
+    Service urls are stored as one NumPy array per field. A query loads the
+    arrays of the product, and selects the granules with vectorized
+    comparisons instead of browsing the catalogs again.
+
+    Only the granules of the default filters of the product (e.g. its version)
+    are indexed: the queries selecting other values of these fields are
+    rejected, and must browse the catalogs instead.
+
+    The index is refreshed on demand with refresh, or when it is older than
+    max_age. The granules added to the catalogs in the meantime are not found.
+
+    Parameters
+    ----------
+    path: str | pl.Path
+        path of the index file, created if it does not exist
+    max_age: float | None
+        age in seconds after which the index of a product is outdated. The
+        index is never outdated if not provided
+    """
+
+    def __init__(self, path: str | pl.Path, max_age: float | None = None):
+        self.path = pl.Path(path)
+        self.max_age = max_age
+
+        self._lock = threading.Lock()
+        # Arrays of the products already loaded, with their refresh time
+        self._loaded: dict[str, tuple[float, dict[str, np.ndarray]]] = {}
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        with self._connection:
+            self._connection.execute(_PRODUCTS_SCHEMA)
+            self._connection.execute(_COLUMNS_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Close the index file."""
+        self._connection.close()
+
+    def refreshed(self, product_short_name: str) -> float | None:
+        """Time of the last refresh of a product, None if it is not indexed."""
+        row = self._product(product_short_name)
+        return None if row is None else row[3]
+
+    def is_outdated(self, product_short_name: str) -> bool:
+        """Whether a product is not indexed, or is older than max_age."""
+        refreshed = self.refreshed(product_short_name)
+        if refreshed is None:
+            return True
+        return self.max_age is not None and time.time() - refreshed > self.max_age
+
+    def refresh(
+        self, product: AvisoProduct, catalog_cache: CatalogCache | None = None
+    ) -> int:
+        """Index all the granules of a product, replacing its previous index.
+
+        Parameters
+        ----------
+        product: AvisoProduct
+            the product
+        catalog_cache: CatalogCache | None
+            cache of the THREDDS catalog documents
+
+        Returns
+        -------
+            the number of granules indexed
+        """
+        granules = filter_granules(product, detail=True, catalog_cache=catalog_cache)
+
+        arrays = {
+            "filename": np.asarray(granules.filename, dtype=str),
+            "size": pd.to_numeric(granules["size"]).to_numpy(dtype=float),
+            "modified": pd.to_datetime(granules.modified).to_numpy().astype(TIME_UNIT),
+            "ncss": np.array(
+                [u if isinstance(u, str) else "" for u in granules.ncss], dtype=str
+            ),
+        }
+        for field in granule_fields(product):
+            arrays.update(_encode(field, granules[field.name]))
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM columns WHERE short_name = ?", (product.short_name,)
+            )
+            self._connection.executemany(
+                "INSERT INTO columns VALUES (?, ?, ?)",
+                (
+                    (product.short_name, name, _dumps(array))
+                    for name, array in arrays.items()
+                ),
+            )
+            self._connection.execute(
+                "INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?)",
+                (product.short_name, product.id, len(granules), time.time()),
+            )
+
+        logger.info("Indexed %d granules of %s.", len(granules), product.short_name)
+        return len(granules)
+
+    def query(
+        self, product_short_name: str, detail: bool = False, **filters
+    ) -> pd.Series | pd.DataFrame:
+        """Search the granules of an indexed product.
+
+        The filters take the same values as for search_granules, but only the
+        fields parsed from the granule names can be filtered, and the fields
+        with a default filter can only take their default value.
+
+        Parameters
+        ----------
+        product_short_name: str
+            the short name of the product
+        detail: bool
+            whether to return the granules metadata along with their urls
+        **filters
+            filters over the fields parsed from the granule names
+
+        Returns
+        -------
+            a series of the urls of the granules corresponding to the provided
+            filters, named 'filename', or a dataframe with the columns of
+            search_granules if detail=True
+
+        Raises
+        ------
+        KeyError
+            In case the product is not indexed
+        InvalidIndexFilterError
+            In case a filter is not a field parsed from the granule names, or
+            selects granules outside the default filters of the product
+        """
+        row = self._product(product_short_name)
+        if row is None:
+            msg = f"The product {product_short_name} is not indexed in {self.path}."
+            raise KeyError(msg)
+        _, product_id, _, refreshed = row
+
+        product = AvisoProduct(id=product_id)
+        fields = {f.name: f for f in granule_fields(product)}
+        unknown = set(filters) - set(fields)
+        if unknown:
+            msg = (
+                f"Invalid filters {sorted(unknown)}: only the fields of the granule "
+                f"names ({', '.join(fields)}) can be searched in the index."
+            )
+            raise InvalidIndexFilterError(msg)
+
+        defaults = default_filters(product)
+        outside = {
+            name: reference
+            for name, reference in filters.items()
+            if name in defaults
+            and fields[name].sanitize(reference)
+            != fields[name].sanitize(defaults[name])
+        }
+        if outside:
+            msg = (
+                f"Invalid filters {outside}: the index only holds the granules of "
+                f"the default filters {defaults} of {product_short_name}. Search "
+                "the catalogs without the index instead."
+            )
+            raise InvalidIndexFilterError(msg)
+
+        arrays = self._arrays(product_short_name, refreshed)
+        mask = np.ones(len(arrays["filename"]), dtype=bool)
+        for name, reference in filters.items():
+            field = fields[name]
+            mask &= _mask(field, field.sanitize(reference), arrays)
+
+        logger.debug(
+            "Found %d granules of %s in the index.", mask.sum(), product_short_name
+        )
+        if not detail:
+            return pd.Series(arrays["filename"][mask].tolist(), name="filename")
+
+        columns = {f.name: _decode(f, arrays, mask) for f in fields.values()}
+        columns["filename"] = arrays["filename"][mask]
+        columns["size"] = arrays["size"][mask]
+        columns["modified"] = arrays["modified"][mask]
+        columns["ncss"] = [u or None for u in arrays["ncss"][mask]]
+        return pd.DataFrame(
+            columns, columns=[*fields, "filename", *GRANULE_STAT_FIELDS]
+        )
+
+    def _product(self, product_short_name: str) -> tuple | None:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT short_name, id, granules, refreshed FROM products "
+                "WHERE short_name = ?",
+                (product_short_name,),
+            ).fetchone()
+
+    def _arrays(self, product_short_name: str, refreshed: float) -> dict:
+        """Arrays of a product, loaded from the file once per refresh."""
+        loaded = self._loaded.get(product_short_name)
+        if loaded is not None and loaded[0] == refreshed:
+            return loaded[1]
+
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT name, data FROM columns WHERE short_name = ?",
+                (product_short_name,),
+            ).fetchall()
+        arrays = {name: np.load(io.BytesIO(data)) for name, data in rows}
+        self._loaded[product_short_name] = (refreshed, arrays)
+        return arrays
+
+
+def _dumps(array: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    np.save(buffer, array, allow_pickle=False)
+    return buffer.getvalue()
+
+
+def _kind(field: FileNameField) -> str:
+    """How the values of a field are stored: 'integer', 'period' (start and
+    stop times), 'datetime', or 'encoded' as in the file names."""
+    if isinstance(field, FileNameFieldInteger):
+        return "integer"
+    if field.type is Period:
+        return "period"
+    if field.type is np.datetime64:
+        return "datetime"
+    return "encoded"
+
+
+def _encode(field: FileNameField, values: pd.Series) -> dict[str, np.ndarray]:
+    """Arrays storing the values of a field."""
+    kind = _kind(field)
+    if kind == "integer":
+        return {field.name: values.to_numpy(dtype=np.int64)}
+    if kind == "period":
+        return {
+            f"{field.name}.start": np.array([p.start for p in values], TIME_UNIT),
+            f"{field.name}.stop": np.array([p.stop for p in values], TIME_UNIT),
+            f"{field.name}.include_start": np.array(
+                [p.include_start for p in values], dtype=bool
+            ),
+            f"{field.name}.include_stop": np.array(
+                [p.include_stop for p in values], dtype=bool
+            ),
+        }
+    if kind == "datetime":
+        return {field.name: np.array(list(values), TIME_UNIT)}
+    return {field.name: np.array([field.encode(v) for v in values], dtype=str)}
+
+
+def _decode(field: FileNameField, arrays: dict, mask: np.ndarray) -> Any:
+    """Values of a field for the selected granules."""
+    kind = _kind(field)
+    if kind == "period":
+        return [
+            Period(*bounds)
+            for bounds in zip(*(a[mask] for a in _period_arrays(field, arrays)))
+        ]
+    if kind == "encoded":
+        encoded, inverse = np.unique(arrays[field.name][mask], return_inverse=True)
+        decoded = [field.decode(e) for e in encoded]
+        return [decoded[i] for i in inverse]
+    return arrays[field.name][mask]
+
+
+def _period_arrays(field: FileNameField, arrays: dict) -> tuple[np.ndarray, ...]:
+    """Starts, stops, and whether they are included, of a period field."""
+    return tuple(
+        arrays[f"{field.name}.{bound}"]
+        for bound in ("start", "stop", "include_start", "include_stop")
+    )
+
+
+def _mask(field: FileNameField, reference: Any, arrays: dict) -> np.ndarray:
+    """Granules which field passes the test of the reference, as
+    field.test(reference, value) would for each granule."""
+    kind = _kind(field)
+    if kind == "integer":
+        values = arrays[field.name]
+        if isinstance(reference, list):
+            return np.isin(values, reference)
+        if isinstance(reference, slice):
+            return (reference.start <= values) & (values < reference.stop)
+        return values == reference
+
+    if kind == "period":
+        start, stop, include_start, include_stop = _period_arrays(field, arrays)
+        if isinstance(reference, Period):
+            after_start = np.where(
+                include_stop & reference.include_start,
+                reference.start <= stop,
+                reference.start < stop,
+            )
+            before_stop = np.where(
+                include_start & reference.include_stop,
+                start <= reference.stop,
+                start < reference.stop,
+            )
+            return after_start & before_stop
+        return np.where(include_start, start <= reference, start < reference) & (
+            np.where(include_stop, reference <= stop, reference < stop)
+        )
+
+    if kind == "datetime":
+        values = arrays[field.name]
+        if isinstance(reference, Period):
+            after_start = (
+                values >= reference.start
+                if reference.include_start
+                else values > reference.start
+            )
+            before_stop = (
+                values <= reference.stop
+                if reference.include_stop
+                else values < reference.stop
+            )
+            return after_start & before_stop
+        return values == reference
+
+    # Other fields have few distinct values: each one is decoded and tested once
+    encoded, inverse = np.unique(arrays[field.name], return_inverse=True)
+    passed = np.array(
+        [field.test(reference, field.decode(e)) for e in encoded], dtype=bool
+    )
+    return passed[inverse]
@@ -1,4 +1,5 @@
 import logging
+from contextlib import nullcontext
 from dataclasses import fields
 from pathlib import Path
 
@@ -9,7 +10,31 @@ from rich.panel import Panel
 from rich.table import Table
 
 import altimetry_downloader_aviso.core as ac_core
+from altimetry_downloader_aviso.catalog_client.catalog_cache import (
+    DEFAULT_CATALOG_TTLS,
+    CatalogCache,
+)
 from altimetry_downloader_aviso.catalog_client.client import InvalidProductError
+from altimetry_downloader_aviso.catalog_client.granule_index import (
+    GranuleIndex,
+    InvalidIndexFilterError,
+)
+from altimetry_downloader_aviso.config import ConfigurationError
+from altimetry_downloader_aviso.metrics import DownloadMetrics
+from altimetry_downloader_aviso.metrics import collect as collect_metrics
+from altimetry_downloader_aviso.planning import (
+    ORDERS,
+    InsufficientDiskSpaceError,
+    check_order,
+    check_shard,
+)
+from altimetry_downloader_aviso.progress import DownloadProgress
+from altimetry_downloader_aviso.prometheus import (
+    DEFAULT_EXPORT_INTERVAL,
+    TextfileExporter,
+)
+from altimetry_downloader_aviso.subsetting import check_subset
+from altimetry_downloader_aviso.tds_client import CHECKSUM_ALGORITHMS
 
 logging.basicConfig(
     level=logging.WARNING, handlers=[RichHandler()], format="%(message)s"
@@ -137,6 +162,69 @@ def _parse_ranges(expr: str) -> list[int]:
     raise typer.BadParameter(msg)
 
 
+def checksum_algorithm(value: str) -> str:
+    if value not in CHECKSUM_ALGORITHMS:
+        msg = (
+            f"Invalid checksum '{value}': choose one of "
+            f"{', '.join(CHECKSUM_ALGORITHMS)}."
+        )
+        raise typer.BadParameter(msg)
+    return value
+
+
+def download_order(value: str) -> str:
+    try:
+        check_order(value)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    return value
+
+
+def shard_spec(value: str) -> tuple[int, int]:
+    try:
+        index, count = (int(v) for v in value.split("/"))
+        check_shard(index, count)
+    except ValueError:
+        msg = f"Invalid shard '{value}': expected 'i/N' with 0 <= i < N, e.g. '0/4'."
+        raise typer.BadParameter(msg)
+    return index, count
+
+
+def variable_names(value: str) -> list[str]:
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    if not names:
+        msg = f"Invalid variables '{value}': expected comma separated names."
+        raise typer.BadParameter(msg)
+    return names
+
+
+def bounding_box(value: str) -> tuple[float, float, float, float]:
+    try:
+        bbox = tuple(float(v) for v in value.split(","))
+        check_subset(None, bbox)
+    except ValueError:
+        msg = (
+            f"Invalid bounding box '{value}': expected 'west,south,east,north' in "
+            "degrees, e.g. '-10,30,10,50'."
+        )
+        raise typer.BadParameter(msg)
+    return bbox
+
+
+def catalog_ttls(value: str) -> list[float]:
+    try:
+        ttls = [float(v) for v in value.split(",")]
+        if any(ttl < 0 for ttl in ttls):
+            raise ValueError
+    except ValueError:
+        msg = (
+            f"Invalid catalog TTLs '{value}': expected comma separated "
+            "non-negative numbers of seconds, e.g. '0,0,86400'."
+        )
+        raise typer.BadParameter(msg)
+    return ttls
+
+
 @app.command()
 def get(
     product: str = typer.Argument(..., help="Product's short name"),
@@ -147,6 +235,15 @@ def get(
         "-O",
         help="Overwrite files if they already exist",
     ),
+    incremental: bool = typer.Option(
+        False,
+        "--incremental",
+        "-i",
+        help=(
+            "Download again the existing files which size or modification date "
+            "differ from the remote files"
+        ),
+    ),
     cycle_number: list = typer.Option(
         None,
         "--cycle",
@@ -169,6 +266,160 @@ def get(
         "-V",
         help="Product's version. By default, last version is selected",
     ),
+    workers: int = typer.Option(
+        None,
+        "--workers",
+        "-j",
+        help=(
+            "Number of parallel downloads. Defaults to AVISO_MAX_WORKERS "
+            "environment variable, or 4 if not set"
+        ),
+        min=1,
+    ),
+    adaptive: bool = typer.Option(
+        False,
+        "--adaptive",
+        help=(
+            "Adapt the number of parallel downloads to the server throughput and "
+            "errors, up to the number of workers"
+        ),
+    ),
+    checksum: str = typer.Option(
+        None,
+        "--checksum",
+        help=(
+            "Compute the digest of the files while they are downloaded with this "
+            "algorithm (e.g. sha256), and write it in a '<file>.<algorithm>' file"
+        ),
+        parser=checksum_algorithm,
+    ),
+    job_file: Path = typer.Option(
+        None,
+        "--job-file",
+        help=(
+            "SQLite file recording the state of each file of the download. "
+            "Running the command again with the same job file resumes the "
+            "remaining downloads without browsing the catalog"
+        ),
+    ),
+    shard: tuple = typer.Option(
+        None,
+        "--shard",
+        help=(
+            "Only download the shard i of N ('i/N', i starting at 0). Nodes "
+            "running the same command with different shards download disjoint "
+            "sets of files"
+        ),
+        parser=shard_spec,
+    ),
+    order: str = typer.Option(
+        None,
+        "--order",
+        help=(
+            f"Order of the downloads: {', '.join(ORDERS)}. Defaults to the "
+            "catalog order"
+        ),
+        parser=download_order,
+    ),
+    variables: list = typer.Option(
+        None,
+        "--variables",
+        help=(
+            "Only download these variables (comma separated, e.g. "
+            "time,latitude,longitude,ssha), for the files served by the THREDDS "
+            "NetCDF Subset Service"
+        ),
+        parser=variable_names,
+    ),
+    bbox: tuple = typer.Option(
+        None,
+        "--bbox",
+        help=(
+            "Only download this area ('west,south,east,north' in degrees), for the "
+            "files served by the THREDDS NetCDF Subset Service"
+        ),
+        parser=bounding_box,
+    ),
+    stream: bool = typer.Option(
+        False,
+        "--stream",
+        help=(
+            "Start downloading the files of each catalog as soon as it is "
+            "received, while the other catalogs are browsed. Not compatible with "
+            "--order and --job-file, and the disk space is not checked"
+        ),
+    ),
+    catalog_cache: Path = typer.Option(
+        None,
+        "--catalog-cache",
+        help=(
+            "SQLite file caching the THREDDS catalogs between runs. Unchanged "
+            "catalogs are not downloaded again"
+        ),
+    ),
+    catalog_ttl: str = typer.Option(
+        ",".join(f"{ttl:g}" for ttl in DEFAULT_CATALOG_TTLS),
+        "--catalog-ttl",
+        help=(
+            "Seconds during which the cached catalogs are used without asking the "
+            "server if they changed, by level from the product catalog (e.g. "
+            "0,0,86400). The last value applies to the deeper levels"
+        ),
+        parser=catalog_ttls,
+    ),
+    granule_index: Path = typer.Option(
+        None,
+        "--granule-index",
+        help=(
+            "SQLite file indexing the files of the product, searched instead of "
+            "browsing the catalogs. The product is indexed on the first use. "
+            "Not compatible with --stream"
+        ),
+    ),
+    index_max_age: float = typer.Option(
+        None,
+        "--index-max-age",
+        help=(
+            "Seconds after which the granule index is refreshed from the "
+            "catalogs. Never refreshed if not set"
+        ),
+        min=0,
+    ),
+    dry_run: bool = typer.Option(
+        False,
+        "--dry-run",
+        help=(
+            "Only print the number and the size of the files to download, and "
+            "the free space in the output directory"
+        ),
+    ),
+    space_check: bool = typer.Option(
+        True,
+        "--space-check/--no-space-check",
+        help=(
+            "Refuse to start if the files to download do not fit in the free "
+            "space of the output directory. Only warn with --no-space-check"
+        ),
+    ),
+    progress: bool = typer.Option(
+        True,
+        "--progress/--no-progress",
+        help="Display the progress of the downloads. Disabled by --quiet",
+    ),
+    metrics_file: Path = typer.Option(
+        None,
+        "--metrics-file",
+        help=(
+            "Write the metrics of the run to this Prometheus textfile (e.g. "
+            "/var/lib/node_exporter/aviso.prom), periodically and at the end"
+        ),
+    ),
+    metrics_interval: float = typer.Option(
+        DEFAULT_EXPORT_INTERVAL,
+        "--metrics-interval",
+        help="Seconds between two writes of the metrics file during the run",
+        min=1,
+    ),
     quiet: bool = typer.Option(
         False,
         "--quiet",
@@ -185,30 +436,159 @@ def get(
     """Downloads a product from Aviso's Thredds Data Server.
 
     Example : get a_prod_short_name --output tmp_dir
-    --cycle 7,8 --pass 12-14,21 --version 1.0
+    --cycle 7,8 --pass 12-14,21 --version 1.0 --workers 8
     """
 
     _setup_logging(quiet=quiet, verbose=verbose)
 
-    try:
-        downloaded_files = ac_core.get(
-            product_short_name=product,
-            output_dir=output,
-            cycle_number=cycle_number if cycle_number else None,
-            pass_number=pass_number if pass_number else None,
-            time=(start, end),
-            version=version,
-            overwrite=overwrite,
+    with (
+        (
+            CatalogCache(catalog_cache, catalog_ttl)
+            if catalog_cache is not None
+            else nullcontext()
+        ) as cache,
+        (
+            GranuleIndex(granule_index, index_max_age)
+            if granule_index is not None
+            else nullcontext()
+        ) as index,
+    ):
+        try:
+            ac_core.check_arguments(
+                incremental=incremental,
+                checksum=checksum,
+                job_file=job_file,
+                shard=shard,
+                order=order,
+                variables=variables,
+                bbox=bbox,
+                stream=stream,
+                granule_index=index,
+            )
+        except ValueError as e:
+            raise typer.BadParameter(str(e))
+
+        if dry_run:
+            try:
+                download_estimate = ac_core.estimate(
+                    product_short_name=product,
+                    output_dir=output,
+                    cycle_number=cycle_number if cycle_number else None,
+                    pass_number=pass_number if pass_number else None,
+                    time=(start, end),
+                    version=version,
+                    overwrite=overwrite,
+                    incremental=incremental,
+                    shard=shard,
+                    catalog_cache=cache,
+                    granule_index=index,
+                )
+            except InvalidProductError:
+                msg = (
+                    f"'{product}' doesn't exist in Aviso catalog. "
+                    "Please use 'summary' command to get product's short name."
+                )
+                raise typer.BadParameter(msg)
+            except (InvalidIndexFilterError, ConfigurationError) as e:
+                raise typer.BadParameter(str(e))
+
+            style = "green" if download_estimate.fits else "red"
+            console.print(f"[{style}]{download_estimate}.[/]")
+            return
+
+        try:
+            display = DownloadProgress(console) if progress and not quiet else None
+            with (
+                collect_metrics(
+                    DownloadMetrics(hooks=[display] if display is not None else None)
+                ) as metrics,
+                (
+                    TextfileExporter(
+                        metrics, metrics_file, metrics_interval, {"product": product}
+                    )
+                    if metrics_file is not None
+                    else nullcontext()
+                ),
+                display if display is not None else nullcontext(),
+            ):
+                downloaded_files = ac_core.get(
+                    product_short_name=product,
+                    output_dir=output,
+                    cycle_number=cycle_number if cycle_number else None,
+                    pass_number=pass_number if pass_number else None,
+                    time=(start, end),
+                    version=version,
+                    overwrite=overwrite,
+                    max_workers=workers,
+                    incremental=incremental,
+                    checksum=checksum,
+                    adaptive=adaptive,
+                    job_file=job_file,
+                    shard=shard,
+                    order=order,
+                    check_disk_space=space_check,
+                    variables=variables,
+                    bbox=bbox,
+                    stream=stream,
+                    catalog_cache=cache,
+                    granule_index=index,
+                )
+
+            console.print(f"[green]Downloaded files ({len(downloaded_files)}) :[/]")
+
+            for file in downloaded_files:
+                console.print(f"- {file}")
+
+            _print_metrics(metrics)
+
+        except InvalidProductError:
+            msg = (
+                f"'{product}' doesn't exist in Aviso catalog. "
+                "Please use 'summary' command to get product's short name."
+            )
+            raise typer.BadParameter(msg)
+
+        except (InvalidIndexFilterError, ConfigurationError) as e:
+            raise typer.BadParameter(str(e))
+
+        except InsufficientDiskSpaceError as e:
+            console.print(f"[red]{e}[/]")
+            raise typer.Exit(1)
+
+
+def _print_metrics(metrics: DownloadMetrics):
+    """Print the summary of the download metrics."""
+    summary = metrics.summary()
+    counters = summary["counters"]
+    latencies = summary["latencies"]
+
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Phase", style="cyan")
+    table.add_column("Count", justify="right")
+    table.add_column("Total (s)", justify="right")
+    table.add_column("p50 (s)", justify="right")
+    table.add_column("p95 (s)", justify="right")
+    table.add_column("Max (s)", justify="right")
+
+    for phase, label in [
+        ("discovery", "Discovery"),
+        ("catalog", "Catalog requests"),
+        ("transfer", "File transfers"),
+    ]:
+        latency = latencies[phase]
+        table.add_row(
+            label,
+            str(latency["count"]),
+            *(
+                "-" if latency[k] is None else f"{latency[k]:.3f}"
+                for k in ("sum", "p50", "p95", "max")
+            ),
         )
 
-        console.print(f"[green]Downloaded files ({len(downloaded_files)}) :[/]")
-
-        for file in downloaded_files:
-            console.print(f"- {file}")
-
-    except InvalidProductError:
-        msg = (
-            f"'{product}' doesn't exist in Aviso catalog. "
-            "Please use 'summary' command to get product's short name."
-        )
-        raise typer.BadParameter(msg)
+    console.print(table)
+    console.print(
+        f"{counters['files']} files downloaded, {counters['skipped']} skipped, "
+        f"{counters['failures']} failed, {counters['retries']} retries. "
+        f"{counters['bytes'] / 1e6:.1f} MB in {summary['elapsed']:.1f} s "
+        f"({summary['throughput'] / 1e6:.2f} MB/s)."
+    )
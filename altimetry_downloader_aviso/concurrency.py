@@ -0,0 +1,252 @@
+import logging
+import threading
+import time
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# Relative drop of throughput between two rounds tolerated before the
+# concurrency stops increasing
+THROUGHPUT_TOLERANCE = 0.1
+
+
+class AdaptiveConcurrency:
+    """Additive-increase/multiplicative-decrease (AIMD) controller of the
+    number of concurrent downloads.
+
+    The downloads are observed by rounds: a round ends when as many downloads
+    as the current level have succeeded. At the end of a round, the level is
+    increased by one if the aggregated throughput has not dropped since the
+    previous round. It is multiplied by decrease_factor if the latency (seconds
+    per byte) exceeds latency_tolerance times the best observed latency, or as
+    soon as a download fails because the server is overloaded (HTTP 429 and 5xx
+    errors, connection errors and timeouts).
+
+    The downloads in flight when the level decreases were started at the
+    previous level: their failures do not decrease the level again.
+
+    Parameters
+    ----------
+    max_level: int
+        maximum number of concurrent downloads
+    min_level: int
+        minimum number of concurrent downloads
+    initial_level: int | None
+        starting number of concurrent downloads. Defaults to half max_level
+    decrease_factor: float
+        factor applied to the level when the server is overloaded, in ]0, 1[
+    latency_tolerance: float
+        ratio to the best observed latency above which the level decreases
+    callback: Callable[[int], None] | None
+        function called with the new level each time it changes
+
+    Raises
+    ------
+    ValueError
+        In case the levels or the decrease factor are inconsistent
+    """
+
+    def __init__(
+        self,
+        max_level: int,
+        min_level: int = 1,
+        initial_level: int | None = None,
+        decrease_factor: float = 0.5,
+        latency_tolerance: float = 2.0,
+        callback: Callable[[int], None] | None = None,
+    ):
+        if initial_level is None:
+            initial_level = max(min_level, max_level // 2)
+
+        if not 0 < min_level <= initial_level <= max_level:
+            msg = (
+                f"Invalid concurrency levels: min_level={min_level}, "
+                f"initial_level={initial_level}, max_level={max_level}."
+            )
+            raise ValueError(msg)
+        if not 0 < decrease_factor < 1:
+            msg = f"decrease_factor must be in ]0, 1[, got {decrease_factor}."
+            raise ValueError(msg)
+
+        self.max_level = max_level
+        self.min_level = min_level
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.callback = callback
+
+        self._level = initial_level
+        self._best_latency = None
+        self._last_throughput = None
+        # Number of completions to wait before the level can decrease again
+        self._cooldown = 0
+        self._new_round()
+
+    @property
+    def level(self) -> int:
+        """Current number of concurrent downloads."""
+        return self._level
+
+    def record_success(self, elapsed: float, size: int):
+        """Record a successful download.
+
+        Parameters
+        ----------
+        elapsed: float
+            duration of the download in seconds
+        size: int
+            size of the downloaded file in bytes
+        """
+        self._cooldown = max(0, self._cooldown - 1)
+        self._round_successes += 1
+        self._round_elapsed += elapsed
+        self._round_bytes += size
+
+        if self._round_successes >= self._level:
+            self._end_round()
+
+    def record_failure(self, status_code: int | None = None):
+        """Record a failed download.
+
+        Parameters
+        ----------
+        status_code: int | None
+            HTTP status of the failed response, None for network errors
+        """
+        self._cooldown = max(0, self._cooldown - 1)
+
+        if status_code is None or status_code == 429 or status_code >= 500:
+            self._decrease(f"server overloaded ({status_code or 'network error'})")
+
+    def _new_round(self):
+        self._round_start = time.monotonic()
+        self._round_successes = 0
+        self._round_elapsed = 0.0
+        self._round_bytes = 0
+
+    def _end_round(self):
+        duration = time.monotonic() - self._round_start
+        throughput = self._round_bytes / duration if duration > 0 else float("inf")
+        latency = self._round_elapsed / max(self._round_bytes, 1)
+
+        logger.debug(
+            "Concurrency %d: %.0f B/s, %.3g s/B", self._level, throughput, latency
+        )
+
+        if self._best_latency is None or latency < self._best_latency:
+            self._best_latency = latency
+
+        last_throughput = self._last_throughput
+        self._last_throughput = throughput
+
+        if latency > self.latency_tolerance * self._best_latency:
+            self._decrease("latency increased")
+        elif (
+            last_throughput is None
+            or throughput >= (1 - THROUGHPUT_TOLERANCE) * last_throughput
+        ):
+            self._set_level(self._level + 1, "throughput sustained")
+        else:
+            self._new_round()
+
+    def _decrease(self, reason: str):
+        if self._cooldown > 0:
+            return
+        self._cooldown = self._level
+        self._set_level(int(self._level * self.decrease_factor), reason)
+
+    def _set_level(self, level: int, reason: str):
+        level = min(self.max_level, max(self.min_level, level))
+        self._new_round()
+
+        if level == self._level:
+            return
+
+        logger.info(
+            "Download concurrency %s from %d to %d: %s.",
+            "increased" if level > self._level else "decreased",
+            self._level,
+            level,
+            reason,
+        )
+        self._level = level
+        if self.callback is not None:
+            self.callback(level)
+
+
+class ByteBudgetClosed(Exception):
+    """Exception raised when waiting for a closed byte budget."""
+
+
+class ByteBudget:
+    """Bound of the number of bytes held in memory by concurrent downloads.
+
+    A download acquires the size of its data before receiving it, and the
+    consumer releases it once done with the data. A download larger than the
+    capacity is let through when nothing else is held, so that it runs alone
+    instead of blocking forever.
+
+    Parameters
+    ----------
+    capacity: int
+        maximum number of bytes held at the same time
+
+    Raises
+    ------
+    ValueError
+        In case the capacity is not strictly positive
+    """
+
+    def __init__(self, capacity: int):
+        if capacity <= 0:
+            msg = f"The byte budget must be strictly positive, got {capacity}."
+            raise ValueError(msg)
+
+        self.capacity = capacity
+        self._used = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    @property
+    def used(self) -> int:
+        """Number of bytes currently held."""
+        return self._used
+
+    def acquire(self, size: int, block: bool = True):
+        """Hold a number of bytes, waiting for the budget to be available.
+
+        Parameters
+        ----------
+        size: int
+            number of bytes to hold
+        block: bool
+            whether to wait for the budget. If not set, the bytes are held even
+            if the capacity is exceeded
+
+        Raises
+        ------
+        ByteBudgetClosed
+            In case the budget is closed while waiting
+        """
+        with self._condition:
+            while (
+                block
+                and self._used > 0
+                and self._used + size > self.capacity
+                and not self._closed
+            ):
+                self._condition.wait()
+            if self._closed:
+                raise ByteBudgetClosed("The byte budget is closed.")
+            self._used += size
+
+    def release(self, size: int):
+        """Release bytes held."""
+        with self._condition:
+            self._used -= size
+            self._condition.notify_all()
+
+    def close(self):
+        """Wake up and fail the pending and future acquisitions."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
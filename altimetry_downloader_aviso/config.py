@@ -0,0 +1,92 @@
+import os
+
+# Environment variables overriding the downloader defaults
+MAX_WORKERS_ENV = "AVISO_MAX_WORKERS"
+CRAWL_WORKERS_ENV = "AVISO_CRAWL_WORKERS"
+CATALOG_PARSER_ENV = "AVISO_CATALOG_PARSER"
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_CRAWL_WORKERS = 8
+
+# Parsers of the THREDDS catalogs: a full siphon TDSCatalog, or a streaming
+# parser only reading the fields of the granules
+CATALOG_PARSERS = ("siphon", "fast")
+DEFAULT_CATALOG_PARSER = "siphon"
+
+
+class ConfigurationError(Exception):
+    """Exception raised when a configuration value is invalid."""
+
+
+def max_workers() -> int:
+    """Default number of parallel downloads.
+
+    Returns
+    -------
+        the value of the AVISO_MAX_WORKERS environment variable if set,
+        DEFAULT_MAX_WORKERS otherwise
+
+    Raises
+    ------
+    ConfigurationError
+        In case the environment variable is not a strictly positive integer
+    """
+    return _get_positive_int(MAX_WORKERS_ENV, DEFAULT_MAX_WORKERS)
+
+
+def crawl_workers() -> int:
+    """Default number of catalogs fetched in parallel during the granules
+    discovery.
+
+    Returns
+    -------
+        the value of the AVISO_CRAWL_WORKERS environment variable if set,
+        DEFAULT_CRAWL_WORKERS otherwise
+
+    Raises
+    ------
+    ConfigurationError
+        In case the environment variable is not a strictly positive integer
+    """
+    return _get_positive_int(CRAWL_WORKERS_ENV, DEFAULT_CRAWL_WORKERS)
+
+
+def catalog_parser() -> str:
+    """Parser of the THREDDS catalogs used by the granules discovery.
+
+    Returns
+    -------
+        the value of the AVISO_CATALOG_PARSER environment variable if set,
+        DEFAULT_CATALOG_PARSER otherwise
+
+    Raises
+    ------
+    ConfigurationError
+        In case the environment variable is not one of CATALOG_PARSERS
+    """
+    value = os.environ.get(CATALOG_PARSER_ENV, DEFAULT_CATALOG_PARSER)
+    if value not in CATALOG_PARSERS:
+        msg = (
+            f"{CATALOG_PARSER_ENV} must be one of {', '.join(CATALOG_PARSERS)}, "
+            f"got '{value}'."
+        )
+        raise ConfigurationError(msg)
+    return value
+
+
+def _get_positive_int(name: str, default: int) -> int:
+    """Read a strictly positive integer from the environment."""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+
+    if number <= 0:
+        msg = f"{name} must be a strictly positive integer, got '{value}'."
+        raise ConfigurationError(msg)
+
+    return number
@@ -1,20 +1,50 @@
 import logging
 import os
 import pathlib as pl
+import warnings
+from contextlib import nullcontext
+from typing import Any, Callable, Iterable, Iterator
 
 import numpy as np
+import pandas as pd
 
+from . import config, metrics
 from .auth import AuthenticationError
+from .catalog_client.catalog_cache import CatalogCache
 from .catalog_client.client import (
     fetch_catalog,
     get_details,
     search_granules,
+    search_granules_stream,
 )
 from .catalog_client.geonetwork import AvisoCatalog, AvisoProduct
-from .tds_client import http_bulk_download
+from .catalog_client.granule_index import GranuleIndex
+from .jobs import JobFile
+from .planning import (
+    DownloadEstimate,
+    InsufficientDiskSpaceError,
+    check_order,
+    check_shard,
+    estimate_download,
+    order_granules,
+    select_shard,
+)
+from .subsetting import check_subset, subset_granules
+from .tds_client import (
+    DownloadedFile,
+    check_checksum,
+    http_bulk_download,
+    http_bulk_download_parallel,
+    local_file_is_up_to_date,
+    url_filename,
+)
 
 logger = logging.getLogger(__name__)
 
+# Relative tolerance on the granules sizes, which are rounded to 4 significant
+# digits in the catalogs
+CATALOG_SIZE_REL_TOL = 1e-3
+
 
 def summary() -> AvisoCatalog:
     """Summarizes CDS-AVISO and SWOT products from AVISO's catalog.
@@ -49,7 +79,20 @@ def get(
     time: tuple[np.datetime64, np.datetime64] | None = None,
     version: str | None = None,
     overwrite: bool = False,
-) -> list[str]:
+    max_workers: int | None = None,
+    incremental: bool = False,
+    checksum: str | None = None,
+    adaptive: bool = False,
+    job_file: str | pl.Path | None = None,
+    shard: tuple[int, int] | None = None,
+    order: str | Callable[[dict], Any] | None = None,
+    check_disk_space: bool = True,
+    variables: list[str] | None = None,
+    bbox: tuple[float, float, float, float] | None = None,
+    stream: bool = False,
+    catalog_cache: CatalogCache | None = None,
+    granule_index: GranuleIndex | None = None,
+) -> list[DownloadedFile]:
     """Downloads a product from Aviso's Thredds Data Server.
 
     Parameters
@@ -68,11 +111,342 @@ def get(
         the version for files/folders selection
     overwrite: bool
         whether to overwrite files if they already exist
+    max_workers
+        number of parallel downloads. Defaults to the AVISO_MAX_WORKERS
+        environment variable, or 4 if not set. Files are downloaded sequentially
+        if set to 1
+    incremental
+        whether to download again the existing files which size or modification
+        time differ from the remote granules. The catalog metadata is compared
+        first, and only the files which may differ are checked with a HEAD
+        request. Ignored if overwrite is set
+    checksum
+        name of a hashlib algorithm (e.g. 'sha256'). The digest of each file is
+        computed while it is downloaded, returned with its path and written
+        next to it, in a '<file>.<algorithm>' file
+    adaptive
+        whether to adapt the number of parallel downloads to the throughput and
+        the errors of the server. max_workers is then the maximum number of
+        parallel downloads
+    job_file
+        SQLite file recording the state of each granule of the download. If the
+        job file already lists granules, the download resumes with the granules
+        which are not done, without browsing the catalog: the filters are
+        ignored
+    shard
+        (index, count) tuple: only download the granules of the shard index
+        among count shards, index starting at 0. Granules are assigned to a
+        shard by hashing their file name, so that processes running with the
+        same filters and count download disjoint sets of granules
+    order
+        order of the downloads: 'catalog', 'oldest', 'newest', 'smallest',
+        'largest' or 'cycle-pass' (see
+        :func:`~altimetry_downloader_aviso.planning.order_granules`), or a
+        function returning the sorting key of a granule given as a dictionary of
+        its metadata. Defaults to the catalog order
+    check_disk_space
+        whether to refuse to start the download if the files to download do not
+        fit in the free space of the output directory. A warning is emitted
+        instead if not set. The check is skipped when resuming a job. The sizes
+        of the whole granules are used, even when downloading subsets
+    variables
+        names of the variables to download (e.g. ['time', 'latitude',
+        'longitude', 'ssha']). The granules served by the THREDDS NetCDF Subset
+        Service are subset by the server, the others are downloaded whole
+    bbox
+        (west, south, east, north) bounding box in degrees of the area to
+        download. The granules are subset by the server like for variables
+    stream
+        whether to start the downloads while the catalogs are browsed, instead
+        of after the whole discovery. The granules of each catalog are
+        downloaded as soon as the catalog is received: they cannot be ordered
+        nor recorded in a job file, and the disk space is not checked
+    catalog_cache
+        cache of the THREDDS catalog documents, so that the catalogs which have
+        not changed since a previous run are not downloaded again (see
+        :class:`~altimetry_downloader_aviso.catalog_client.catalog_cache.CatalogCache`)
+    granule_index
+        index of the granules, searched instead of browsing the catalogs (see
+        :class:`~altimetry_downloader_aviso.catalog_client.granule_index.GranuleIndex`).
+        The product is indexed first if needed
+
+    Returns
+    -------
+        The list of downloaded local file paths, in the order of the granules in
+        the catalog, or in the download order if given. The paths are
+        :class:`~altimetry_downloader_aviso.tds_client.DownloadedFile` strings,
+        which 'digest' attribute holds the checksum of the file if requested
+
+    Raises
+    ------
+    InsufficientDiskSpaceError
+        In case the size of the files to download, as given by the catalog,
+        exceeds the free space of the output directory and check_disk_space is
+        set
+    ValueError
+        In case the variables or the bounding box are invalid, a subset is
+        requested with incremental, stream is combined with order, job_file
+        or granule_index, or a filter cannot be searched in the granule index
+    """
+    if max_workers is None:
+        max_workers = config.max_workers()
+    check_arguments(
+        incremental=incremental,
+        checksum=checksum,
+        job_file=job_file,
+        shard=shard,
+        order=order,
+        variables=variables,
+        bbox=bbox,
+        stream=stream,
+        granule_index=granule_index,
+    )
+    subset = variables is not None or bbox is not None
+
+    filters = _filters(cycle_number, pass_number, time, version)
+
+    with JobFile(job_file) if job_file is not None else nullcontext() as job:
+        if job is not None and job.is_planned():
+            job_urls = job.remaining()
+            logger.info(
+                "Resume job %s: %d granules remaining.", job_file, len(job_urls)
+            )
+            if overwrite or incremental:
+                granule_paths = job_urls
+            else:
+                granule_paths = _missing_granules(job_urls, output_dir)
+                _log_selection(len(job_urls), len(granule_paths), False, False)
+        elif stream:
+            logger.info("Download the granules while the catalogs are browsed.")
+            granule_paths = _plan_stream(
+                product_short_name,
+                output_dir,
+                filters,
+                overwrite,
+                incremental,
+                shard,
+                (variables, bbox) if subset else None,
+                catalog_cache,
+            )
+        else:
+            job_urls, granules = _plan(
+                product_short_name,
+                output_dir,
+                filters,
+                overwrite,
+                incremental,
+                shard,
+                order,
+                (variables, bbox) if subset else None,
+                catalog_cache,
+                granule_index,
+            )
+            granule_paths = list(granules.filename)
+
+            estimate = estimate_download(granules, output_dir)
+            logger.info("%s.", estimate)
+            if not estimate.fits:
+                msg = f"Not enough space in {output_dir}: {estimate}."
+                if check_disk_space:
+                    raise InsufficientDiskSpaceError(msg)
+                warnings.warn(msg)
+
+        if not stream:
+            logger.debug("Downloading granules: %s...", list(granule_paths))
+            metrics.count(metrics.PLANNED, len(granule_paths))
+
+        if job is not None:
+            job.plan(job_urls)
+
+        # Local files of the granules to download and their urls, in the
+        # catalog order. Filled as the downloads are scheduled
+        planned = {}
+        # Urls of the downloads which failed after all their tries
+        failed = set()
+        urls = _planned_files(granule_paths, output_dir, planned, job)
+
+        if max_workers > 1:
+            downloads = http_bulk_download_parallel(
+                urls=urls,
+                output_dir=output_dir,
+                max_workers=max_workers,
+                overwrite=overwrite,
+                incremental=incremental,
+                checksum=checksum,
+                adaptive=adaptive,
+                on_failure=lambda url, _: failed.add(url),
+            )
+        else:
+            downloads = http_bulk_download(
+                urls=urls,
+                output_dir=output_dir,
+                overwrite=overwrite,
+                incremental=incremental,
+                checksum=checksum,
+                on_failure=lambda url, _: failed.add(url),
+            )
+
+        try:
+            downloaded_files = {}
+            for file in downloads:
+                downloaded_files[file] = file
+                if job is not None:
+                    job.done(planned[file], os.path.getsize(file))
+
+        except AuthenticationError as e:
+            logging.error(e)
+            metrics.count(metrics.ERRORS)
+            return []
+
+        if job is not None:
+            _close_job(job, job_urls, output_dir, downloaded_files, failed)
+
+    # Parallel downloads complete in any order: restore the catalog order
+    return [downloaded_files[f] for f in planned if f in downloaded_files]
+
+
+def check_arguments(
+    incremental: bool = False,
+    checksum: str | None = None,
+    job_file: str | pl.Path | None = None,
+    shard: tuple[int, int] | None = None,
+    order: str | Callable[[dict], Any] | None = None,
+    variables: list[str] | None = None,
+    bbox: tuple[float, float, float, float] | None = None,
+    stream: bool = False,
+    granule_index: GranuleIndex | None = None,
+):
+    """Checks the arguments of a download, before anything is requested from
+    the server.
+
+    Parameters
+    ----------
+    incremental
+        whether to download again the existing files which differ from the
+        remote granules
+    checksum
+        name of the hashlib algorithm of the checksums
+    job_file
+        SQLite file recording the state of each granule of the download
+    shard
+        (index, count) tuple of the shard to download
+    order
+        order of the downloads
+    variables
+        names of the variables to download
+    bbox
+        (west, south, east, north) bounding box in degrees of the area to
+        download
+    stream
+        whether to start the downloads while the catalogs are browsed
+    granule_index
+        index of the granules, searched instead of browsing the catalogs
+
+    Raises
+    ------
+    ValueError
+        In case an argument is invalid, a subset is requested with incremental,
+        or stream is combined with order, job_file or granule_index
+    """
+    check_checksum(checksum)
+    if shard is not None:
+        check_shard(*shard)
+    if order is not None:
+        check_order(order)
+    if variables is not None or bbox is not None:
+        check_subset(variables, bbox)
+        if incremental:
+            msg = (
+                "Incremental downloads cannot be combined with subsetting: the "
+                "subsets differ from the remote granules."
+            )
+            raise ValueError(msg)
+
+    if stream and (order is not None or job_file is not None):
+        msg = (
+            "Streamed downloads cannot be ordered nor recorded in a job file: "
+            "they start before all the granules are known."
+        )
+        raise ValueError(msg)
+    if stream and granule_index is not None:
+        msg = "Streamed downloads browse the catalogs: they cannot use a granule index."
+        raise ValueError(msg)
+
+
+def estimate(
+    product_short_name: str,
+    output_dir: str | pl.Path,
+    cycle_number: int | list[int] | None = None,
+    pass_number: int | list[int] | None = None,
+    time: tuple[np.datetime64, np.datetime64] | None = None,
+    version: str | None = None,
+    overwrite: bool = False,
+    incremental: bool = False,
+    shard: tuple[int, int] | None = None,
+    catalog_cache: CatalogCache | None = None,
+    granule_index: GranuleIndex | None = None,
+) -> DownloadEstimate:
+    """Estimates the volume of a download without downloading, from the sizes
+    given by Aviso's Thredds Data Server catalog.
+
+    Parameters
+    ----------
+    product_short_name
+        the short name of the product
+    output_dir
+        directory to store downloaded product files
+    cycle_number
+        the cycle number for files/folders selection
+    pass_number
+        the pass number for files/folders selection
+    time
+        the period for files/folders selection
+    version
+        the version for files/folders selection
+    overwrite: bool
+        whether to overwrite files if they already exist
+    incremental
+        whether to download again the existing files which size or modification
+        time differ from the catalog metadata
+    shard
+        (index, count) tuple: only estimate the granules of the shard index
+        among count shards
+    catalog_cache
+        cache of the THREDDS catalog documents
+    granule_index
+        index of the granules, searched instead of browsing the catalogs
 
     Returns
     -------
-        The list of downloaded local file paths
+        the number of files to download, their total size, and the free space
+        in the output directory
     """
+    if shard is not None:
+        check_shard(*shard)
+
+    filters = _filters(cycle_number, pass_number, time, version)
+    _, granules = _plan(
+        product_short_name,
+        output_dir,
+        filters,
+        overwrite,
+        incremental,
+        shard,
+        None,
+        None,
+        catalog_cache,
+        granule_index,
+    )
+    return estimate_download(granules, output_dir)
+
+
+def _filters(
+    cycle_number: int | list[int] | None,
+    pass_number: int | list[int] | None,
+    time: tuple[np.datetime64, np.datetime64] | None,
+    version: str | None,
+) -> dict:
+    """Filters of the granules search, without the unset ones."""
     filters = {}
     if cycle_number is not None:
         filters["cycle_number"] = cycle_number
@@ -82,38 +456,222 @@ def get(
         filters["time"] = time
     if version is not None:
         filters["version"] = version
+    return filters
+
+
+def _plan(
+    product_short_name: str,
+    output_dir: str | pl.Path,
+    filters: dict,
+    overwrite: bool,
+    incremental: bool,
+    shard: tuple[int, int] | None,
+    order: str | Callable[[dict], Any] | None,
+    subset: tuple[list[str] | None, tuple | None] | None,
+    catalog_cache: CatalogCache | None,
+    granule_index: GranuleIndex | None,
+) -> tuple[list[str], pd.DataFrame]:
+    """Search the granules, and select those to download.
+
+    Returns
+    -------
+        the urls of all the granules matching the filters, and the granules to
+        download, in the download order. The urls are those of the subsets if
+        a (variables, bbox) subset is given
+    """
+    granules = _search(
+        product_short_name, shard, order, filters, catalog_cache, granule_index
+    )
+    urls, granules = _select(granules, output_dir, overwrite, incremental, subset)
+    _log_selection(len(urls), len(granules), overwrite, incremental)
+    return urls, granules
+
+
+def _plan_stream(
+    product_short_name: str,
+    output_dir: str | pl.Path,
+    filters: dict,
+    overwrite: bool,
+    incremental: bool,
+    shard: tuple[int, int] | None,
+    subset: tuple[list[str] | None, tuple | None] | None,
+    catalog_cache: CatalogCache | None,
+) -> Iterator[str]:
+    """Search the granules catalog by catalog, and yield the urls of those to
+    download as soon as their catalog is received."""
+    found = selected = 0
+    for granules in search_granules_stream(
+        product_short_name, catalog_cache=catalog_cache, **filters
+    ):
+        if granules.empty:
+            continue
+        if shard is not None:
+            granules = _in_shard(granules, shard)
+        urls, granules = _select(granules, output_dir, overwrite, incremental, subset)
+        found += len(urls)
+        selected += len(granules)
+
+        metrics.count(metrics.PLANNED, len(granules))
+        yield from granules.filename
 
-    granule_paths = search_granules(product_short_name, **filters)
+    _log_selection(found, selected, overwrite, incremental)
+
+
+def _select(
+    granules: pd.DataFrame,
+    output_dir: str | pl.Path,
+    overwrite: bool,
+    incremental: bool,
+    subset: tuple[list[str] | None, tuple | None] | None,
+) -> tuple[list[str], pd.DataFrame]:
+    """Select the granules to download among the granules found.
+
+    Returns
+    -------
+        the urls of all the granules, and the granules to download. The urls
+        are those of the subsets if a (variables, bbox) subset is given
+    """
+    if subset is not None:
+        granules = subset_granules(granules, *subset)
+    urls = list(granules.filename)
 
     if overwrite:
-        logger.info("%d files to download.", len(granule_paths))
+        return urls, granules
+
+    if incremental:
+        outdated = _outdated_granules(granules, output_dir)
     else:
-        files_to_download = [
-            pl.Path(output_dir) / os.path.basename(p) for p in granule_paths
-        ]
-        non_existing_files = [
-            p for p, f in zip(granule_paths, files_to_download) if not f.exists()
-        ]
+        outdated = _missing_granules(urls, output_dir)
+
+    return urls, granules[granules.filename.isin(outdated)]
+
+
+def _log_selection(found: int, selected: int, overwrite: bool, incremental: bool):
+    """Log the number of granules to download among the granules found."""
+    if overwrite:
+        logger.info("%d files to download.", selected)
+    elif incremental:
         logger.info(
-            "%d files to download. %d files already exist.",
-            len(non_existing_files),
-            len(granule_paths) - len(non_existing_files),
+            "%d files to check or download. %d files are up to date.",
+            selected,
+            found - selected,
         )
-        logger.debug(
-            "Existing files: %s",
-            [str(f) for f in files_to_download if f not in non_existing_files],
+    else:
+        logger.info(
+            "%d files to download. %d files already exist.", selected, found - selected
         )
-        granule_paths = non_existing_files
 
-    logger.debug("Downloading granules: %s...", list(granule_paths))
 
-    try:
-        return list(
-            http_bulk_download(
-                urls=list(granule_paths), output_dir=output_dir, overwrite=overwrite
+def _search(
+    product_short_name: str,
+    shard: tuple[int, int] | None,
+    order: str | Callable[[dict], Any] | None,
+    filters: dict,
+    catalog_cache: CatalogCache | None,
+    granule_index: GranuleIndex | None,
+) -> pd.DataFrame:
+    """Granules matching the filters with their metadata, restricted to a shard
+    and sorted in the download order."""
+    granules = search_granules(
+        product_short_name,
+        detail=True,
+        catalog_cache=catalog_cache,
+        granule_index=granule_index,
+        **filters,
+    )
+
+    if shard is not None:
+        granules = _in_shard(granules, shard)
+    if order is not None:
+        granules = order_granules(granules, order)
+    return granules
+
+
+def _in_shard(granules: pd.DataFrame, shard: tuple[int, int]) -> pd.DataFrame:
+    """Granules of a shard."""
+    return granules[granules.filename.isin(select_shard(granules.filename, *shard))]
+
+
+def _planned_files(
+    urls: Iterable[str],
+    output_dir: str | pl.Path,
+    planned: dict[str, str],
+    job: JobFile | None = None,
+) -> Iterator[str]:
+    """Record the local file of each url in planned as it is scheduled, and
+    start its granule in the job file."""
+    for url in urls:
+        planned[str(pl.Path(output_dir) / url_filename(url))] = url
+        if job is not None:
+            job.start([url])
+        yield url
+
+
+def _missing_granules(urls: list[str], output_dir: str | pl.Path) -> list[str]:
+    """Urls of the granules which local file does not exist."""
+    files_to_download = [pl.Path(output_dir) / url_filename(p) for p in urls]
+    non_existing_files = [p for p, f in zip(urls, files_to_download) if not f.exists()]
+    logger.debug(
+        "Existing files: %s",
+        [str(f) for f in files_to_download if f not in non_existing_files],
+    )
+    return non_existing_files
+
+
+def _close_job(
+    job: JobFile,
+    urls: list[str],
+    output_dir: str | pl.Path,
+    downloaded_files: dict[str, DownloadedFile],
+    failed: set[str],
+):
+    """Record the outcome of the granules of a job which were not downloaded.
+
+    Granules which download failed have failed, even if an older local
+    file exists. Granules skipped because their local file exists or is
+    up to date are done, the others have failed.
+    """
+    for url in urls:
+        local_file = pl.Path(output_dir) / url_filename(url)
+        if str(local_file) in downloaded_files:
+            continue
+        if url in failed or not local_file.exists():
+            job.fail(url)
+        else:
+            job.done(url, local_file.stat().st_size)
+
+    counts = job.summary()
+    logger.info(
+        "Job %s: %d granules done, %d failed.",
+        job.path,
+        counts["done"],
+        counts["failed"],
+    )
+
+
+def _outdated_granules(granules: pd.DataFrame, output_dir: str | pl.Path) -> list[str]:
+    """Urls of the granules which local file is missing or may differ from the
+    remote granule.
+
+    The local files are compared with the size and modification date
+    given by the catalog. Those without any catalog metadata are kept to
+    be checked against the server.
+    """
+    outdated = []
+    for url, size, modified in zip(
+        granules.filename, granules["size"], granules.modified
+    ):
+        local_filepath = pl.Path(output_dir) / url_filename(url)
+        if (
+            not local_filepath.exists()
+            or (pd.isna(size) and pd.isna(modified))
+            or not local_file_is_up_to_date(
+                local_filepath,
+                None if pd.isna(size) else int(size),
+                None if pd.isna(modified) else pd.Timestamp(modified).timestamp(),
+                rel_tol=CATALOG_SIZE_REL_TOL,
             )
-        )
+        ):
+            outdated.append(url)
 
-    except AuthenticationError as e:
-        logging.error(e)
-        return []
+    return outdated
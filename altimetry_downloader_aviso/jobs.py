@@ -0,0 +1,130 @@
+import logging
+import pathlib as pl
+import sqlite3
+import time
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+# States of the granules of a job
+PENDING = "pending"
+IN_PROGRESS = "in-progress"
+DONE = "done"
+FAILED = "failed"
+
+STATES = (PENDING, IN_PROGRESS, DONE, FAILED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS granules (
+    url TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    bytes INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated REAL
+)
+"""
+
+
+class JobFile:
+    """SQLite file recording the state of the granules of a bulk download.
+
+    Each granule planned for download is recorded with its state (pending,
+    in-progress, done or failed), its size once downloaded and the number of
+    download attempts. Every change is committed immediately, so that an
+    interrupted download can be resumed from the job file without browsing the
+    catalog again.
+
+    Parameters
+    ----------
+    path: str | pl.Path
+        path of the job file, created if it does not exist
+    """
+
+    def __init__(self, path: str | pl.Path):
+        self.path = pl.Path(path)
+        self._connection = sqlite3.connect(self.path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        with self._connection:
+            self._connection.execute(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Close the job file."""
+        self._connection.close()
+
+    def is_planned(self) -> bool:
+        """Whether granules have already been recorded in the job file."""
+        (count,) = self._connection.execute("SELECT COUNT(*) FROM granules").fetchone()
+        return count > 0
+
+    def plan(self, urls: Iterable[str]):
+        """Record granules as pending, in the given order.
+
+        Granules already recorded are kept unchanged.
+        """
+        with self._connection:
+            (offset,) = self._connection.execute(
+                "SELECT COALESCE(MAX(position) + 1, 0) FROM granules"
+            ).fetchone()
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO granules (url, position, updated) "
+                "VALUES (?, ?, ?)",
+                ((url, offset + i, time.time()) for i, url in enumerate(urls)),
+            )
+
+    def remaining(self) -> list[str]:
+        """Urls of the granules not downloaded yet, in the planned order."""
+        rows = self._connection.execute(
+            "SELECT url FROM granules WHERE state != ? ORDER BY position", (DONE,)
+        )
+        return [url for (url,) in rows]
+
+    def start(self, urls: Iterable[str]):
+        """Mark granules as in progress, and count a new download attempt."""
+        with self._connection:
+            self._connection.executemany(
+                "UPDATE granules SET state = ?, attempts = attempts + 1, updated = ? "
+                "WHERE url = ?",
+                ((IN_PROGRESS, time.time(), url) for url in urls),
+            )
+
+    def done(self, url: str, size: int):
+        """Mark a granule as downloaded."""
+        with self._connection:
+            self._connection.execute(
+                "UPDATE granules SET state = ?, bytes = ?, updated = ? WHERE url = ?",
+                (DONE, size, time.time(), url),
+            )
+
+    def fail(self, url: str):
+        """Mark a granule as failed."""
+        with self._connection:
+            self._connection.execute(
+                "UPDATE granules SET state = ?, updated = ? WHERE url = ?",
+                (FAILED, time.time(), url),
+            )
+
+    def summary(self) -> dict[str, int]:
+        """Number of granules in each state."""
+        counts = dict.fromkeys(STATES, 0)
+        rows = self._connection.execute(
+            "SELECT state, COUNT(*) FROM granules GROUP BY state"
+        )
+        counts.update(rows)
+        return counts
+
+    def granules(self) -> list[dict]:
+        """Records of all the granules, in the planned order."""
+        rows = self._connection.execute(
+            "SELECT url, state, bytes, attempts FROM granules ORDER BY position"
+        )
+        return [
+            {"url": url, "state": state, "bytes": size, "attempts": attempts}
+            for url, state, size, attempts in rows
+        ]
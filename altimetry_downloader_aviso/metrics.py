@@ -0,0 +1,309 @@
+import bisect
+import contextvars
+import threading
+import time
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from typing import Callable, Generator
+
+# Counters
+CATALOG_REQUESTS = "catalog_requests"
+CATALOGS = "catalogs"
+CACHED_CATALOGS = "cached_catalogs"
+GRANULES = "granules"
+PLANNED = "planned"
+FILES = "files"
+SKIPPED = "skipped"
+FAILURES = "failures"
+ERRORS = "errors"
+RETRIES = "retries"
+BYTES = "bytes"
+
+# Latency histograms
+DISCOVERY = "discovery"
+CATALOG = "catalog"
+TRANSFER = "transfer"
+
+# Upper bounds of the latency histograms buckets, in seconds
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+    float("inf"),
+)
+
+# Collectors receiving the metrics of the current context: those of the collect
+# scopes entered by the current thread or task, or by the code which submitted
+# its work with submit. Concurrent downloads in other threads are not mixed in
+_collectors: contextvars.ContextVar[tuple] = contextvars.ContextVar(
+    "collectors", default=()
+)
+
+
+class Histogram:
+    """Distribution of latencies in fixed buckets.
+
+    Parameters
+    ----------
+    buckets: tuple[float, ...]
+        increasing upper bounds of the buckets, the last one being infinite
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value: float):
+        """Add a value to the distribution."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def copy(self) -> "Histogram":
+        """Independent copy of the histogram."""
+        histogram = Histogram(self.buckets)
+        histogram.counts = list(self.counts)
+        histogram.count = self.count
+        histogram.sum = self.sum
+        histogram.min = self.min
+        histogram.max = self.max
+        return histogram
+
+    def quantile(self, q: float) -> float | None:
+        """Estimate of a quantile: the upper bound of the bucket holding it,
+        bounded by the maximum value.
+
+        None if the histogram is empty.
+        """
+        if self.count == 0:
+            return None
+
+        rank = q * self.count
+        cumulated = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulated += count
+            if cumulated >= rank:
+                break
+        return min(bound, self.max)
+
+
+class DownloadMetrics:
+    """Counters, byte totals and latency histograms of the granules discovery
+    and download.
+
+    Once registered with :func:`collect`, the metrics are filled by the catalog
+    browsing and the download functions called in the scope, including the
+    worker threads and tasks they start:
+
+    - counters: 'catalog_requests' to the AVISO products catalog, THREDDS
+      'catalogs' fetched, 'cached_catalogs' taken from the catalog cache,
+      'granules' discovered, files 'planned' for download, 'files'
+      downloaded, 'skipped' files already up to date, 'failures' of downloads,
+      'errors' which stopped the run, such as authentication failures,
+      'retries' of downloads and 'bytes' received
+    - latency histograms: 'discovery' of the granules, fetching of each
+      'catalog' and 'transfer' of each file (retries included)
+
+    Hooks are called with the name of the metric, the value added (a count or a
+    duration in seconds) and the url concerned if any, for each event.
+
+    Parameters
+    ----------
+    hooks: list[Callable[[str, float, str | None], None]] | None
+        functions called for each event
+    """
+
+    def __init__(
+        self, hooks: list[Callable[[str, float, str | None], None]] | None = None
+    ):
+        self.hooks = list(hooks or [])
+        self.counters = dict.fromkeys(
+            (
+                CATALOG_REQUESTS,
+                CATALOGS,
+                CACHED_CATALOGS,
+                GRANULES,
+                PLANNED,
+                FILES,
+                SKIPPED,
+                FAILURES,
+                ERRORS,
+                RETRIES,
+                BYTES,
+            ),
+            0,
+        )
+        self.histograms = {name: Histogram() for name in (DISCOVERY, CATALOG, TRANSFER)}
+
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._stop = None
+        # Disjoint (start, stop) intervals during which files were transferred,
+        # sorted, and their total duration
+        self._transfers = []
+        self._transfer_time = 0.0
+
+    def add_hook(self, hook: Callable[[str, float, str | None], None]):
+        """Call a function for each event."""
+        self.hooks.append(hook)
+
+    def count(self, name: str, value: int = 1, url: str | None = None):
+        """Increment a counter."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        for hook in self.hooks:
+            hook(name, value, url)
+
+    def observe(self, name: str, seconds: float, url: str | None = None):
+        """Add a latency to a histogram."""
+        with self._lock:
+            self.histograms.setdefault(name, Histogram()).observe(seconds)
+            if name == TRANSFER:
+                stop = time.monotonic()
+                self._add_transfer(stop - seconds, stop)
+        for hook in self.hooks:
+            hook(name, seconds, url)
+
+    def _add_transfer(self, start: float, stop: float):
+        """Merge the interval of a transfer ending now with the intervals of
+        the transfers which overlap it."""
+        while self._transfers and self._transfers[-1][1] >= start:
+            previous_start, previous_stop = self._transfers.pop()
+            self._transfer_time -= previous_stop - previous_start
+            start = min(start, previous_start)
+            stop = max(stop, previous_stop)
+        self._transfers.append((start, stop))
+        self._transfer_time += stop - start
+
+    def snapshot(self) -> tuple[dict[str, int], dict[str, Histogram]]:
+        """Consistent copies of the counters and of the histograms."""
+        with self._lock:
+            return dict(self.counters), {
+                name: h.copy() for name, h in self.histograms.items()
+            }
+
+    def stop(self):
+        """Stop the clock of the collection."""
+        if self._stop is None:
+            self._stop = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        """Duration of the collection in seconds."""
+        stop = self._stop if self._stop is not None else time.monotonic()
+        return stop - self._start
+
+    @property
+    def transfer_time(self) -> float:
+        """Time in seconds during which at least one file was transferred."""
+        with self._lock:
+            return self._transfer_time
+
+    def summary(self) -> dict:
+        """Totals of the collection.
+
+        Returns
+        -------
+            a dictionary with the 'elapsed' time, the 'transfer_time' during
+            which files were transferred, the 'counters', the transfer
+            'throughput' in bytes per second over the transfer time, and the
+            'count', 'sum', 'p50', 'p95' and 'max' of each histogram
+        """
+        with self._lock:
+            transfer_time = self._transfer_time
+            throughput = (
+                self.counters[BYTES] / transfer_time if transfer_time > 0 else 0.0
+            )
+            return {
+                "elapsed": self.elapsed,
+                "transfer_time": transfer_time,
+                "counters": dict(self.counters),
+                "throughput": throughput,
+                "latencies": {
+                    name: {
+                        "count": h.count,
+                        "sum": h.sum,
+                        "p50": h.quantile(0.5),
+                        "p95": h.quantile(0.95),
+                        "max": h.max,
+                    }
+                    for name, h in self.histograms.items()
+                },
+            }
+
+
+@contextmanager
+def collect(
+    metrics: DownloadMetrics | None = None,
+) -> Generator[DownloadMetrics, None, None]:
+    """Collect the metrics of the discoveries and downloads run in the scope.
+
+    Only the current thread or task and the work it submits are measured:
+    downloads run concurrently by other threads are collected by their own
+    scopes.
+
+    Parameters
+    ----------
+    metrics: DownloadMetrics | None
+        metrics to fill. New metrics are created if not provided
+
+    Returns
+    -------
+        the metrics, filled until the end of the scope
+    """
+    if metrics is None:
+        metrics = DownloadMetrics()
+
+    token = _collectors.set(_collectors.get() + (metrics,))
+    try:
+        yield metrics
+    finally:
+        metrics.stop()
+        _collectors.reset(token)
+
+
+def submit(executor: Executor, fn: Callable, *args) -> Future:
+    """Submit a call to an executor, its metrics being collected by the scopes
+    of the caller."""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def count(name: str, value: int = 1, url: str | None = None):
+    """Increment a counter of the registered metrics."""
+    for metrics in _collectors.get():
+        metrics.count(name, value, url)
+
+
+def observe(name: str, seconds: float, url: str | None = None):
+    """Add a latency to a histogram of the registered metrics."""
+    for metrics in _collectors.get():
+        metrics.observe(name, seconds, url)
+
+
+@contextmanager
+def timed(name: str, url: str | None = None):
+    """Observe the duration of the scope in a histogram of the registered
+    metrics."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, url)
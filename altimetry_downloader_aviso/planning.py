@@ -0,0 +1,272 @@
+import logging
+import os
+import pathlib as pl
+import shutil
+import zlib
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def shard_of(url: str, count: int) -> int:
+    """Shard of a granule among count shards.
+
+    The shard is computed from the CRC32 of the file name of the granule, which
+    does not depend on the other granules of the plan nor on the Python process:
+    every node computes the same partition, and a granule added to or removed
+    from the catalog does not move the others to another shard.
+
+    Parameters
+    ----------
+    url: str
+        url or path of the granule
+    count: int
+        number of shards
+
+    Returns
+    -------
+        the index of the shard of the granule, between 0 and count - 1
+    """
+    return zlib.crc32(os.path.basename(url).encode()) % count
+
+
+def check_shard(index: int, count: int):
+    """Check the index and the number of shards.
+
+    Raises
+    ------
+    ValueError
+        In case count is not positive, or index is not between 0 and count - 1
+    """
+    if count < 1 or not 0 <= index < count:
+        msg = (
+            f"Invalid shard {index}/{count}: the index must be between 0 and "
+            "the number of shards minus one."
+        )
+        raise ValueError(msg)
+
+
+def select_shard(urls: Iterable[str], index: int, count: int) -> list[str]:
+    """Granules of a shard, in the order of the plan.
+
+    Parameters
+    ----------
+    urls: Iterable[str]
+        urls of the planned granules
+    index: int
+        index of the shard, between 0 and count - 1
+    count: int
+        number of shards
+
+    Returns
+    -------
+        the urls belonging to the shard
+
+    Raises
+    ------
+    ValueError
+        In case the shard is invalid
+    """
+    check_shard(index, count)
+    urls = list(urls)
+    selected = [url for url in urls if shard_of(url, count) == index]
+    logger.info(
+        "Shard %d/%d: %d of %d granules.", index, count, len(selected), len(urls)
+    )
+    return selected
+
+
+def _granule_time(granule: dict) -> tuple[float] | None:
+    """Start of the period covered by a granule, parsed from its name, or its
+    modification date in the catalog."""
+    start = getattr(granule.get("time"), "start", granule.get("time"))
+    if start is None or pd.isna(start):
+        start = granule.get("modified")
+    if start is None or pd.isna(start):
+        return None
+    return (pd.Timestamp(start).timestamp(),)
+
+
+def _granule_size(granule: dict) -> tuple[float] | None:
+    size = granule.get("size")
+    if size is None or pd.isna(size):
+        return None
+    return (float(size),)
+
+
+def _granule_cycle_pass(granule: dict) -> tuple[float, float] | None:
+    cycle_number = granule.get("cycle_number")
+    if cycle_number is None or pd.isna(cycle_number):
+        return None
+    pass_number = granule.get("pass_number")
+    return (
+        float(cycle_number),
+        -1.0 if pass_number is None or pd.isna(pass_number) else float(pass_number),
+    )
+
+
+# Built-in download orders: key of the granules and whether it is descending.
+# Granules without the key are downloaded last
+ORDERS = {
+    "catalog": None,
+    "oldest": (_granule_time, False),
+    "newest": (_granule_time, True),
+    "smallest": (_granule_size, False),
+    "largest": (_granule_size, True),
+    "cycle-pass": (_granule_cycle_pass, False),
+}
+
+
+def check_order(order: str | Callable[[dict], Any]):
+    """Check a download order.
+
+    Raises
+    ------
+    ValueError
+        In case the order is neither a built-in order nor a callable
+    """
+    if not callable(order) and order not in ORDERS:
+        msg = (
+            f"Invalid order '{order}': choose one of {', '.join(ORDERS)}, "
+            "or give a key function."
+        )
+        raise ValueError(msg)
+
+
+def order_granules(
+    granules: pd.DataFrame, order: str | Callable[[dict], Any]
+) -> pd.DataFrame:
+    """Sort the granules to download.
+
+    The built-in orders are:
+
+    - 'catalog': the order of the granules in the catalog
+    - 'oldest' / 'newest': chronological or reverse chronological order, from
+      the time parsed from the granule names or from the modification dates
+    - 'smallest' / 'largest': by size given by the catalog
+    - 'cycle-pass': by cycle number, then pass number
+
+    Granules lacking the sorting key keep the catalog order after the others.
+
+    Parameters
+    ----------
+    granules: pd.DataFrame
+        the granules, with their urls in a 'filename' column, and their metadata
+        ('size', 'modified' and the fields parsed from their names)
+    order: str | Callable[[dict], Any]
+        the name of a built-in order, or a function returning the sorting key of
+        a granule given as a dictionary of its metadata
+
+    Returns
+    -------
+        the sorted granules
+
+    Raises
+    ------
+    ValueError
+        In case the order is unknown
+    """
+    check_order(order)
+
+    records = granules.to_dict("records")
+    if callable(order):
+        positions = sorted(range(len(records)), key=lambda i: order(records[i]))
+    elif ORDERS[order] is None:
+        return granules
+    else:
+        key, descending = ORDERS[order]
+        keys = [key(r) for r in records]
+        sign = -1.0 if descending else 1.0
+        positions = sorted(
+            range(len(records)),
+            key=lambda i: (
+                (1,) if keys[i] is None else (0, *(sign * v for v in keys[i]))
+            ),
+        )
+
+    logger.debug("Download granules in %s order", getattr(order, "__name__", order))
+    return granules.iloc[positions]
+
+
+class InsufficientDiskSpaceError(Exception):
+    """Exception raised when the files to download do not fit in the free space
+    of the output directory."""
+
+
+@dataclass
+class DownloadEstimate:
+    """Volume of a planned download.
+
+    Attributes
+    ----------
+    files: int
+        number of files to download
+    size: int
+        total size in bytes of the files to download, as given by the catalog.
+        THREDDS rounds the sizes to 4 significant digits
+    unknown_sizes: int
+        number of files to download which size is not given by the catalog
+    free_space: int
+        free space in bytes on the file system of the output directory
+    """
+
+    files: int
+    size: int
+    unknown_sizes: int
+    free_space: int
+
+    @property
+    def fits(self) -> bool:
+        """Whether the files of known size fit in the free space."""
+        return self.size <= self.free_space
+
+    def __str__(self) -> str:
+        unknown = (
+            f" ({self.unknown_sizes} files of unknown size)"
+            if self.unknown_sizes
+            else ""
+        )
+        return (
+            f"{self.files} files to download: {self.size / 1e9:.2f} GB{unknown}, "
+            f"{self.free_space / 1e9:.2f} GB available"
+        )
+
+
+def estimate_download(
+    granules: pd.DataFrame, output_dir: str | pl.Path
+) -> DownloadEstimate:
+    """Estimate the volume of a download from the sizes given by the catalog.
+
+    Parameters
+    ----------
+    granules: pd.DataFrame
+        the granules to download, with their sizes in bytes in a 'size' column
+    output_dir: str | pl.Path
+        directory receiving the files. It may not exist yet
+
+    Returns
+    -------
+        the estimate of the download
+    """
+    sizes = (
+        granules["size"] if "size" in granules else pd.Series([None] * len(granules))
+    )
+    known = sizes.dropna()
+    return DownloadEstimate(
+        files=len(granules),
+        size=int(known.sum()),
+        unknown_sizes=len(sizes) - len(known),
+        free_space=free_space(output_dir),
+    )
+
+
+def free_space(path: str | pl.Path) -> int:
+    """Free space in bytes on the file system of a path, or of its closest
+    existing parent."""
+    path = pl.Path(path).absolute()
+    while not path.exists():
+        path = path.parent
+    return shutil.disk_usage(path).free
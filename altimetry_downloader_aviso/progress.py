@@ -0,0 +1,163 @@
+import os
+import threading
+import time
+from itertools import islice
+
+from rich.console import Console
+from rich.filesize import decimal
+from rich.progress import BarColumn, Progress, TaskID, TextColumn
+
+from . import metrics
+
+# Number of transfers displayed at the same time
+MAX_DISPLAYED_TRANSFERS = 8
+
+
+class DownloadProgress:
+    """Live display of the downloads: one line per active transfer, and the
+    overall number of files, bytes, rate and estimated remaining time.
+
+    The display is a hook of the download metrics. The hook only updates
+    counters, so that it does not slow down the download loops: the display is
+    rendered from these counters by a background thread, refresh_per_second
+    times per second. Transfers shorter than a refresh are counted but never
+    displayed.
+
+    Parameters
+    ----------
+    console: Console | None
+        console to render the display to
+    refresh_per_second: float
+        rate of the display refreshes
+    max_transfers: int
+        maximum number of active transfers displayed
+    """
+
+    def __init__(
+        self,
+        console: Console | None = None,
+        refresh_per_second: float = 4.0,
+        max_transfers: int = MAX_DISPLAYED_TRANSFERS,
+    ):
+        self.refresh_per_second = refresh_per_second
+        self.max_transfers = max_transfers
+        self.progress = Progress(
+            TextColumn("{task.description}"),
+            BarColumn(),
+            TextColumn("{task.fields[info]}"),
+            console=console,
+            auto_refresh=False,
+        )
+
+        self._lock = threading.Lock()
+        self._planned = 0
+        self._completed = 0
+        self._failed = 0
+        self._bytes = 0
+        # Bytes and start time of the active transfers, by url
+        self._transfers = {}
+
+        self._start = None
+        self._overall = None
+        self._tasks: dict[str, TaskID] = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __call__(self, name: str, value: float, url: str | None = None):
+        with self._lock:
+            if name == metrics.BYTES:
+                self._bytes += value
+                if url is not None:
+                    transfer = self._transfers.get(url)
+                    if transfer is None:
+                        self._transfers[url] = [value, time.monotonic()]
+                    else:
+                        transfer[0] += value
+            elif name in (metrics.FILES, metrics.SKIPPED, metrics.FAILURES):
+                self._completed += value
+                if name == metrics.FAILURES:
+                    self._failed += value
+                self._transfers.pop(url, None)
+            elif name == metrics.PLANNED:
+                self._planned += value
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        """Start the display."""
+        self._start = time.monotonic()
+        self._overall = self.progress.add_task("Total", total=None, info="")
+        self.progress.start()
+        self._thread.start()
+
+    def stop(self):
+        """Render the final state and stop the display."""
+        self._stopped.set()
+        self._thread.join()
+        self.refresh()
+        self.progress.stop()
+
+    def refresh(self):
+        """Render the display from the current counters."""
+        now = time.monotonic()
+        with self._lock:
+            planned = self._planned
+            completed = self._completed
+            failed = self._failed
+            total_bytes = self._bytes
+            transfers = {
+                url: tuple(transfer)
+                for url, transfer in islice(self._transfers.items(), self.max_transfers)
+            }
+
+        elapsed = now - self._start
+        info = (
+            f"{completed}/{planned or '?'} files"
+            + (f" ({failed} failed)" if failed else "")
+            + f", {decimal(total_bytes)}, {_rate(total_bytes, elapsed)}"
+        )
+        if 0 < completed < planned:
+            eta = (planned - completed) * elapsed / completed
+            info += f", ETA {_duration(eta)}"
+        self.progress.update(
+            self._overall,
+            total=planned or None,
+            completed=min(completed, planned) if planned else 0,
+            info=info,
+        )
+
+        for url in list(self._tasks):
+            if url not in transfers:
+                self.progress.remove_task(self._tasks.pop(url))
+
+        for url, (size, start) in transfers.items():
+            info = f"{decimal(size)}, {_rate(size, now - start)}"
+            if url in self._tasks:
+                self.progress.update(self._tasks[url], info=info)
+            else:
+                self._tasks[url] = self.progress.add_task(
+                    os.path.basename(url), total=None, info=info
+                )
+
+        self.progress.refresh()
+
+    def _run(self):
+        while not self._stopped.wait(1 / self.refresh_per_second):
+            self.refresh()
+
+
+def _rate(size: int, seconds: float) -> str:
+    if seconds <= 0:
+        return "-/s"
+    return f"{decimal(int(size / seconds))}/s"
+
+
+def _duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
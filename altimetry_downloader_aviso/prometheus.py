@@ -0,0 +1,291 @@
+import logging
+import math
+import os
+import pathlib as pl
+import tempfile
+import threading
+import time
+
+from . import metrics
+from .metrics import DownloadMetrics
+
+logger = logging.getLogger(__name__)
+
+# Prefix of the names of the exported metrics
+METRIC_PREFIX = "aviso_downloader"
+
+# Name of the gauge giving the time of the last run completed without error,
+# kept from the previous textfile by the runs which fail
+LAST_SUCCESS_METRIC = f"{METRIC_PREFIX}_last_success_timestamp_seconds"
+
+# Default period of the exports during a run, in seconds
+DEFAULT_EXPORT_INTERVAL = 60.0
+
+_COUNTERS_HELP = {
+    metrics.CATALOG_REQUESTS: "Requests to the AVISO products catalog.",
+    metrics.CATALOGS: "THREDDS catalogs fetched.",
+    metrics.CACHED_CATALOGS: "THREDDS catalogs taken from the catalog cache.",
+    metrics.GRANULES: "Granules discovered in the THREDDS catalogs.",
+    metrics.PLANNED: "Files planned for download.",
+    metrics.FILES: "Files downloaded.",
+    metrics.SKIPPED: "Files skipped because they exist or are up to date.",
+    metrics.FAILURES: "Files which download failed.",
+    metrics.ERRORS: "Errors which stopped the run, such as authentication failures.",
+    metrics.RETRIES: "Retries of file downloads.",
+    metrics.BYTES: "Bytes received from the THREDDS Data Server.",
+}
+
+_HISTOGRAMS_HELP = {
+    metrics.DISCOVERY: "Duration of the granules discovery in seconds.",
+    metrics.CATALOG: "Duration of the THREDDS catalog requests in seconds.",
+    metrics.TRANSFER: "Duration of the file downloads in seconds, retries included.",
+}
+
+
+def format_metrics(
+    download_metrics: DownloadMetrics,
+    labels: dict[str, str] | None = None,
+    running: bool = False,
+    success: bool = False,
+    last_success: float | None = None,
+) -> str:
+    """Format metrics in the Prometheus text exposition format.
+
+    Parameters
+    ----------
+    download_metrics: DownloadMetrics
+        the metrics to format
+    labels: dict[str, str] | None
+        labels added to every sample, such as the product name
+    running: bool
+        whether the run is still in progress
+    success: bool
+        whether the run has completed without error. The time of the export is
+        then given as the time of the last success
+    last_success: float | None
+        time of the last run completed without error, given when this run has
+        not. Not exported if None
+
+    Returns
+    -------
+        the text of the metrics
+    """
+    counters, histograms = download_metrics.snapshot()
+    labels = labels or {}
+    lines = []
+
+    def sample(name: str, value: float, extra_labels: dict[str, str] | None = None):
+        all_labels = {**labels, **(extra_labels or {})}
+        label_text = ",".join(
+            f'{k}="{_escape_label(str(v))}"' for k, v in all_labels.items()
+        )
+        if label_text:
+            name = f"{name}{{{label_text}}}"
+        lines.append(f"{name} {_format_value(value)}")
+
+    def header(name: str, kind: str, help_text: str):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    for counter, value in counters.items():
+        name = f"{METRIC_PREFIX}_{counter}_total"
+        header(name, "counter", _COUNTERS_HELP.get(counter, f"{counter} count."))
+        sample(name, value)
+
+    for histogram_name, histogram in histograms.items():
+        name = f"{METRIC_PREFIX}_{histogram_name}_seconds"
+        header(
+            name,
+            "histogram",
+            _HISTOGRAMS_HELP.get(
+                histogram_name, f"Duration of {histogram_name} in seconds."
+            ),
+        )
+        cumulated = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulated += count
+            sample(f"{name}_bucket", cumulated, {"le": _format_value(bound)})
+        sample(f"{name}_sum", histogram.sum)
+        sample(f"{name}_count", histogram.count)
+
+    name = f"{METRIC_PREFIX}_duration_seconds"
+    header(name, "gauge", "Duration of the run in seconds.")
+    sample(name, download_metrics.elapsed)
+
+    name = f"{METRIC_PREFIX}_running"
+    header(name, "gauge", "Whether the run is in progress.")
+    sample(name, int(running))
+
+    name = f"{METRIC_PREFIX}_success"
+    header(name, "gauge", "Whether the run has completed without error.")
+    sample(name, int(success))
+
+    now = time.time()
+    name = f"{METRIC_PREFIX}_last_update_timestamp_seconds"
+    header(name, "gauge", "Time of the export of the metrics.")
+    sample(name, now)
+
+    if success:
+        last_success = now
+    if last_success is not None:
+        name = LAST_SUCCESS_METRIC
+        header(name, "gauge", "Time of the last run completed without error.")
+        sample(name, last_success)
+
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(
+    download_metrics: DownloadMetrics,
+    path: str | pl.Path,
+    labels: dict[str, str] | None = None,
+    running: bool = False,
+    success: bool = False,
+):
+    """Write metrics to a file read by the textfile collector of the Prometheus
+    node exporter.
+
+    The file is written atomically: the metrics are written to a hidden
+    temporary file in the same directory, which is then renamed, so that the
+    collector never reads a partial file.
+
+    Parameters
+    ----------
+    download_metrics: DownloadMetrics
+        the metrics to write
+    path: str | pl.Path
+        path of the '.prom' file
+    labels: dict[str, str] | None
+        labels added to every sample, such as the product name
+    running: bool
+        whether the run is still in progress
+    success: bool
+        whether the run has completed without error. Otherwise, the time of the
+        last success is kept from the previous file
+    """
+    path = pl.Path(path)
+    last_success = None if success else _read_last_success(path)
+    text = format_metrics(download_metrics, labels, running, success, last_success)
+
+    fd, tmp_path = tempfile.mkstemp(
+        dir=path.parent, prefix=f".{path.name}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        # mkstemp creates the file readable by its owner only
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class TextfileExporter:
+    """Periodic export of metrics to a Prometheus textfile.
+
+    Used as a context manager, the metrics are written every interval seconds
+    by a background thread, and a last time when leaving the context. The last
+    export records the success of the run if the context is left without
+    exception, no download failed and no error stopped the run (see
+    :func:`succeeded`). A failure of this export does not hide the exception
+    of the run.
+
+    Parameters
+    ----------
+    download_metrics: DownloadMetrics
+        the metrics to export
+    path: str | pl.Path
+        path of the '.prom' file
+    interval: float
+        time between two exports during the run, in seconds
+    labels: dict[str, str] | None
+        labels added to every sample, such as the product name
+    """
+
+    def __init__(
+        self,
+        download_metrics: DownloadMetrics,
+        path: str | pl.Path,
+        interval: float = DEFAULT_EXPORT_INTERVAL,
+        labels: dict[str, str] | None = None,
+    ):
+        self.metrics = download_metrics
+        self.path = pl.Path(path)
+        self.interval = interval
+        self.labels = labels
+
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.stop(success=exc_type is None and succeeded(self.metrics))
+        except Exception as e:
+            if exc_type is None:
+                raise
+            logger.warning("Cannot write the metrics to %s: %s", self.path, e)
+
+    def start(self):
+        """Start the periodic exports."""
+        self._thread.start()
+
+    def stop(self, success: bool = True):
+        """Stop the periodic exports, and write the final metrics.
+
+        Parameters
+        ----------
+        success: bool
+            whether the run has completed without error
+        """
+        self._stopped.set()
+        self._thread.join()
+        write_textfile(self.metrics, self.path, self.labels, success=success)
+        logger.debug("Metrics written to %s", self.path)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                write_textfile(self.metrics, self.path, self.labels, running=True)
+            except OSError as e:
+                logger.warning("Cannot write the metrics to %s: %s", self.path, e)
+
+
+def succeeded(download_metrics: DownloadMetrics) -> bool:
+    """Whether a run has completed without failed download nor error, such as
+    an authentication failure, according to its metrics."""
+    counters = download_metrics.counters
+    return not counters.get(metrics.FAILURES) and not counters.get(metrics.ERRORS)
+
+
+def _read_last_success(path: pl.Path) -> float | None:
+    """Time of the last success recorded in a previous textfile, None if
+    missing."""
+    try:
+        text = path.read_text()
+    except OSError:
+        return None
+    for line in text.splitlines():
+        name, _, value = line.rpartition(" ")
+        if name.partition("{")[0] == LAST_SUCCESS_METRIC:
+            try:
+                return float(value)
+            except ValueError:
+                return None
+    return None
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
@@ -0,0 +1,138 @@
+import email.utils
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Client errors worth retrying: timeouts, throttling, and Range Not Satisfiable
+# after the discarding of an inconsistent partial file
+RETRYABLE_CLIENT_STATUS_CODES = (408, 416, 425, 429)
+
+# Upper bound of the waiting time between two tries, in seconds
+MAX_BACKOFF = 300.0
+
+
+def is_retryable_status(status_code: int) -> bool:
+    """Whether a request that failed with an HTTP status may succeed later.
+
+    Server errors and a few client errors are retryable. Other client
+    errors, such as 401, 403 or 404, fail again whatever the number of
+    tries.
+    """
+    return not 400 <= status_code < 500 or status_code in RETRYABLE_CLIENT_STATUS_CODES
+
+
+def decorrelated_jitter(backoff: float, previous: float) -> float:
+    """Waiting time before the next try, drawn between backoff and three times
+    the previous waiting time.
+
+    Randomizing the waiting times prevents concurrent downloads failing together
+    from retrying together.
+
+    Parameters
+    ----------
+    backoff: float
+        minimum waiting time, in seconds
+    previous: float
+        previous waiting time, or backoff before the first retry
+
+    Returns
+    -------
+        the waiting time in seconds, bounded by MAX_BACKOFF
+    """
+    return min(MAX_BACKOFF, random.uniform(backoff, max(backoff, previous) * 3))
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Number of seconds to wait given by a Retry-After header, which is either
+    a number of seconds or an HTTP date.
+
+    None if missing or invalid.
+    """
+    if value is None:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+
+class CircuitBreaker:
+    """Circuit breaker shared by the downloads of a pool.
+
+    After failure_threshold consecutive failures on a host, the circuit opens:
+    the requests to this host are paused for reset_timeout seconds. The requests
+    are then let through again, and the first failure reopens the circuit until
+    a request succeeds. The circuit can also be opened explicitly, when the
+    server asks the clients to slow down with a Retry-After header.
+
+    The breaker can be shared between threads.
+
+    Parameters
+    ----------
+    failure_threshold: int
+        number of consecutive failures opening the circuit
+    reset_timeout: float
+        pause of the requests when the circuit opens, in seconds
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._failures = {}
+        self._open_until = {}
+
+    def remaining(self, url: str) -> float:
+        """Seconds to wait before requesting the host of a url, 0 if the
+        circuit is closed."""
+        host = urlsplit(url).netloc
+        with self._lock:
+            return max(0.0, self._open_until.get(host, 0.0) - time.monotonic())
+
+    def wait(self, url: str):
+        """Block until the circuit of the host of a url is closed."""
+        while (remaining := self.remaining(url)) > 0:
+            time.sleep(remaining)
+
+    def record_success(self, url: str):
+        """Close the circuit of the host of a url."""
+        host = urlsplit(url).netloc
+        with self._lock:
+            self._failures[host] = 0
+
+    def record_failure(self, url: str):
+        """Count a failure on the host of a url, and open its circuit if the
+        threshold is reached."""
+        host = urlsplit(url).netloc
+        with self._lock:
+            self._failures[host] = self._failures.get(host, 0) + 1
+            if self._failures[host] >= self.failure_threshold:
+                self._open(host, self.reset_timeout)
+
+    def pause(self, url: str, seconds: float):
+        """Open the circuit of the host of a url for a given time."""
+        host = urlsplit(url).netloc
+        with self._lock:
+            self._open(host, seconds)
+
+    def _open(self, host: str, seconds: float):
+        now = time.monotonic()
+        previous = self._open_until.get(host, 0.0)
+        if now + seconds <= previous:
+            return
+
+        if previous <= now:
+            logger.warning("Pause the requests to %s for %.0f s.", host, seconds)
+        self._open_until[host] = now + seconds
@@ -0,0 +1,120 @@
+import logging
+import warnings
+from urllib.parse import urlencode
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Format of the subsets returned by the NetCDF Subset Service. NetCDF-4 keeps
+# the compression of the variables
+NCSS_FORMAT = "netcdf4"
+
+
+def check_subset(
+    variables: list[str] | None,
+    bbox: tuple[float, float, float, float] | None,
+):
+    """Check the variables and the bounding box of a subset.
+
+    Raises
+    ------
+    ValueError
+        In case the variables are empty, or the bounding box is not a
+        (west, south, east, north) tuple with valid latitudes
+    """
+    if variables is not None and (isinstance(variables, str) or not variables):
+        msg = f"Invalid variables {variables!r}: expected a list of variable names."
+        raise ValueError(msg)
+
+    if bbox is not None:
+        if len(bbox) != 4:
+            msg = (
+                f"Invalid bounding box {bbox}: expected (west, south, east, north) "
+                "in degrees."
+            )
+            raise ValueError(msg)
+        _, south, _, north = bbox
+        if not -90 <= south <= north <= 90:
+            msg = (
+                f"Invalid bounding box {bbox}: the latitudes must verify "
+                "-90 <= south <= north <= 90."
+            )
+            raise ValueError(msg)
+
+
+def subset_url(
+    ncss_url: str,
+    variables: list[str] | None = None,
+    bbox: tuple[float, float, float, float] | None = None,
+) -> str:
+    """Url of a subset of a granule on the NetCDF Subset Service (NCSS).
+
+    Parameters
+    ----------
+    ncss_url: str
+        NCSS access url of the granule
+    variables: list[str] | None
+        names of the variables to keep. All variables are kept if not provided
+    bbox: tuple[float, float, float, float] | None
+        (west, south, east, north) bounding box in degrees. The whole area is
+        kept if not provided
+
+    Returns
+    -------
+        the url of the subset, which file name is the granule's
+    """
+    params = [("var", v) for v in variables] if variables else [("var", "all")]
+    if bbox is not None:
+        west, south, east, north = bbox
+        params += [("north", north), ("south", south), ("east", east), ("west", west)]
+    params.append(("accept", NCSS_FORMAT))
+    return f"{ncss_url}?{urlencode(params)}"
+
+
+def subset_granules(
+    granules: pd.DataFrame,
+    variables: list[str] | None = None,
+    bbox: tuple[float, float, float, float] | None = None,
+) -> pd.DataFrame:
+    """Replace the urls of the granules by the urls of their subsets.
+
+    The granules which are not served by the NetCDF Subset Service are
+    downloaded whole, with a warning.
+
+    Parameters
+    ----------
+    granules: pd.DataFrame
+        the granules, with their urls in a 'filename' column and their NCSS
+        access urls in a 'ncss' column
+    variables: list[str] | None
+        names of the variables to keep
+    bbox: tuple[float, float, float, float] | None
+        (west, south, east, north) bounding box in degrees
+
+    Returns
+    -------
+        the granules, with the urls of the subsets in the 'filename' column
+
+    Raises
+    ------
+    ValueError
+        In case the variables or the bounding box are invalid
+    """
+    check_subset(variables, bbox)
+
+    ncss = granules["ncss"] if "ncss" in granules else pd.Series([None] * len(granules))
+    urls = [
+        url if pd.isna(ncss_url) else subset_url(ncss_url, variables, bbox)
+        for url, ncss_url in zip(granules.filename, ncss)
+    ]
+
+    whole = int(ncss.isna().sum())
+    if whole:
+        warnings.warn(
+            f"{whole} of {len(granules)} granules are not served by the NetCDF "
+            "Subset Service: they are downloaded whole."
+        )
+    logger.debug("Subset granules with variables %s, bbox %s", variables, bbox)
+
+    return granules.assign(filename=urls)
@@ -0,0 +1,417 @@
+import asyncio
+import logging
+import pathlib as pl
+import time
+import warnings
+from typing import AsyncGenerator, Iterable
+
+import aiohttp
+
+from . import metrics
+from .auth import ensure_credentials
+from .retry import (
+    MAX_BACKOFF,
+    CircuitBreaker,
+    decorrelated_jitter,
+    is_retryable_status,
+    parse_retry_after,
+)
+from .tds_client import (
+    DEFAULT_CHUNK_SIZE,
+    PART_SUFFIX,
+    TDS_HOST,
+    DownloadedFile,
+    _check_chunk_size,
+    _complete_download,
+    _discard_part_file,
+    _downloaded_file,
+    _new_hash,
+    _part_file_mode,
+    _resume_headers,
+    _validator,
+    _write_checksum_file,
+    _write_validator,
+    check_checksum,
+    url_filename,
+)
+
+logger = logging.getLogger(__name__)
+
+# Timeouts of the connection to the server and of the wait for each chunk, in
+# seconds. A transfer has no total timeout: large granules can take longer
+# than any fixed bound
+CONNECT_TIMEOUT = 30.0
+READ_TIMEOUT = 300.0
+
+
+async def http_single_download_async(
+    url: str,
+    output_dir: str | pl.Path,
+    session: aiohttp.ClientSession,
+    overwrite: bool = False,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    checksum: str | None = None,
+) -> DownloadedFile | None:
+    """Download a granule from AVISO's Thredds Data Server using HTTPS
+    protocol.
+
+    Asynchronous counterpart of :func:`tds_client.http_single_download`: the
+    granule is streamed in a '.part' file renamed once complete, and an
+    interrupted download is resumed with an HTTP Range request conditioned on
+    the version of the remote file.
+
+    The file operations (writing the chunks, hashing a resumed part file,
+    renaming the complete file) run in worker threads, so that they do not
+    block the other downloads of the event loop.
+
+    Parameters
+    ----------
+    url: str
+        the url to download
+    output_dir: str | pl.Path
+        existing directory to store the downloaded file
+    session: aiohttp.ClientSession
+        authenticated session used to request the server
+    overwrite: bool
+        whether to overwrite the file if it already exists
+    chunk_size: int
+        size in bytes of the chunks streamed to disk
+    checksum: str | None
+        name of a hashlib algorithm (e.g. 'sha256') used to compute the digest
+        of the file while it is downloaded, and record it in a sidecar file
+
+    Returns
+    -------
+        the local path to the downloaded file, with its digest if a checksum
+        is requested. None if the download is skipped
+    """
+    logger.debug("Downloading %s...", url)
+
+    filename = url_filename(url)
+    local_filepath = pl.Path(output_dir) / filename
+
+    if not overwrite and await asyncio.to_thread(local_filepath.exists):
+        logger.debug("File %s already exist. Ignore download.", local_filepath)
+        metrics.count(metrics.SKIPPED, 1, url)
+        return None
+
+    part_filepath = local_filepath.with_name(filename + PART_SUFFIX)
+    offset, headers = await asyncio.to_thread(_resume_headers, part_filepath)
+
+    async with session.get(url, headers=headers) as response:
+        try:
+            mode = _part_file_mode(
+                url, offset, response.status, response.headers.get("Content-Range")
+            )
+        except ValueError as e:
+            logger.debug("Discard invalid partial file %s", part_filepath)
+            await asyncio.to_thread(_discard_part_file, part_filepath)
+            raise aiohttp.ClientResponseError(
+                response.request_info,
+                response.history,
+                status=response.status,
+                message=str(e),
+            ) from e
+
+        if mode == "wb":
+            response.raise_for_status()
+            await asyncio.to_thread(
+                _write_validator, part_filepath, _validator(response.headers)
+            )
+
+        # The bytes already in the part file are read back to be hashed
+        file_hash = await asyncio.to_thread(
+            _new_hash, checksum, part_filepath if mode != "wb" else None
+        )
+
+        if mode is not None:
+            f = await asyncio.to_thread(open, part_filepath, mode)
+            try:
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    await asyncio.to_thread(_write_chunk, f, chunk, file_hash)
+                    metrics.count(metrics.BYTES, len(chunk), url)
+            finally:
+                await asyncio.to_thread(f.close)
+
+        last_modified = response.headers.get("Last-Modified")
+
+    await asyncio.to_thread(
+        _complete_download, part_filepath, local_filepath, last_modified
+    )
+    if file_hash is not None:
+        await asyncio.to_thread(
+            _write_checksum_file, local_filepath, checksum, file_hash
+        )
+    logger.info("File %s downloaded.", local_filepath)
+
+    return _downloaded_file(local_filepath, file_hash)
+
+
+async def http_single_download_with_retries_async(
+    url: str,
+    output_dir: str | pl.Path,
+    session: aiohttp.ClientSession,
+    retries: int = 3,
+    backoff: float = 1.0,
+    overwrite: bool = False,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    checksum: str | None = None,
+    circuit_breaker: CircuitBreaker | None = None,
+) -> DownloadedFile | None:
+    """Download a granule from AVISO's Thredds Data Server using HTTPS
+    protocol. Retries if the download fails.
+
+    The retry policy is the one of
+    :func:`tds_client.http_single_download_with_retries`: only transient errors
+    are retried, after a jittered waiting time extended to the Retry-After
+    delay asked by the server.
+
+    Parameters
+    ----------
+    url: str
+        the url to download
+    output_dir: str | pl.Path
+        existing directory to store the downloaded file
+    session: aiohttp.ClientSession
+        authenticated session used to request the server
+    retries: int
+        number of retries
+    backoff: float
+        minimum waiting time between two tries
+    overwrite: bool
+        whether to overwrite the file if it already exists
+    chunk_size: int
+        size in bytes of the chunks streamed to disk
+    checksum: str | None
+        name of a hashlib algorithm (e.g. 'sha256') used to compute the digest
+        of the file while it is downloaded, and record it in a sidecar file
+    circuit_breaker: CircuitBreaker | None
+        circuit breaker shared with other downloads, pausing the requests to a
+        failing host
+
+    Returns
+    -------
+        the local path to the downloaded file, with its digest if a checksum
+        is requested. None if the download is skipped
+
+    Raises
+    ------
+    aiohttp.ClientError
+        In case an exception happens when requesting the file on the server
+    """
+    last_exception = None
+    delay = backoff
+    start = time.perf_counter()
+
+    for attempt in range(1, retries + 1):
+        if circuit_breaker is not None:
+            while (remaining := circuit_breaker.remaining(url)) > 0:
+                await asyncio.sleep(remaining)
+
+        try:
+            result = await http_single_download_async(
+                url, output_dir, session, overwrite, chunk_size, checksum
+            )
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.debug("Attempt %d failed for %s: %s", attempt, url, e)
+
+            last_exception = e
+            if not _is_retryable(e):
+                logger.debug("Error is not retryable: give up %s", url)
+                break
+
+            if circuit_breaker is not None:
+                circuit_breaker.record_failure(url)
+
+            if attempt < retries:
+                delay = decorrelated_jitter(backoff, delay)
+
+                headers = getattr(e, "headers", None)
+                retry_after = parse_retry_after(
+                    headers.get("Retry-After") if headers is not None else None
+                )
+                if retry_after is not None:
+                    delay = min(MAX_BACKOFF, max(delay, retry_after))
+                    if circuit_breaker is not None:
+                        circuit_breaker.pause(url, min(MAX_BACKOFF, retry_after))
+
+                metrics.count(metrics.RETRIES, 1, url)
+                await asyncio.sleep(delay)
+
+        else:
+            if circuit_breaker is not None:
+                circuit_breaker.record_success(url)
+            if result is not None:
+                metrics.observe(metrics.TRANSFER, time.perf_counter() - start, url)
+                metrics.count(metrics.FILES, 1, url)
+            return result
+
+    metrics.count(metrics.FAILURES, 1, url)
+    raise last_exception
+
+
+def _write_chunk(f, chunk: bytes, file_hash):
+    """Write a chunk in a file, and feed it to the hash of the file if any."""
+    f.write(chunk)
+    if file_hash is not None:
+        file_hash.update(chunk)
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Whether a failed download may succeed if it is tried again."""
+    if isinstance(error, aiohttp.InvalidURL):
+        return False
+    if isinstance(error, aiohttp.ClientResponseError):
+        return is_retryable_status(error.status)
+    return True
+
+
+async def _download_one_async(
+    url: str,
+    output_dir: str | pl.Path,
+    session: aiohttp.ClientSession,
+    retries: int = 3,
+    backoff: float = 1.0,
+    overwrite: bool = False,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    checksum: str | None = None,
+    circuit_breaker: CircuitBreaker | None = None,
+):
+    try:
+        return await http_single_download_with_retries_async(
+            url,
+            output_dir,
+            session,
+            retries,
+            backoff,
+            overwrite,
+            chunk_size,
+            checksum,
+            circuit_breaker,
+        )
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        msg = f"Failed to download {url}. An error happened: {e}"
+        warnings.warn(msg)
+    return
+
+
+async def http_bulk_download_async(
+    urls: Iterable[str],
+    output_dir: str | pl.Path,
+    retries: int = 3,
+    backoff: float = 1.0,
+    max_concurrency: int = 100,
+    username: str = None,
+    password: str = None,
+    overwrite: bool = False,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    checksum: str | None = None,
+    session: aiohttp.ClientSession | None = None,
+) -> AsyncGenerator[DownloadedFile, None]:
+    """Concurrent download of granules from AVISO's Thredds Data Server using
+    HTTPS protocol, driven by an asyncio event loop.
+
+    At most max_concurrency downloads are in flight at any time, and the urls
+    are consumed lazily. Each download has retries if it fails. Contrary to
+    :func:`tds_client.http_bulk_download_parallel`, no thread is spawned, which
+    allows hundreds of concurrent transfers and embedding the downloader in an
+    asyncio application. Requires the optional 'aiohttp' dependency.
+
+    Parameters
+    ----------
+    urls: Iterable[str]
+        the urls to download
+    output_dir: str | pl.Path
+        a directory to store the downloaded file (create it if doesn't exist)
+    retries: int
+        number of retries
+    backoff: float
+        waiting time between two tries. Increases exponentially
+    max_concurrency: int
+        maximum number of simultaneous downloads
+    username: str
+        username for authentication. Retrieved from .netrc file if not provided
+    password: str
+        password for authentication. Retrieved from .netrc file if not provided
+    overwrite: bool
+        whether to overwrite the file if it already exists
+    chunk_size: int
+        size in bytes of the chunks streamed to disk
+    checksum: str | None
+        name of a hashlib algorithm (e.g. 'sha256') used to compute the digest
+        of each file while it is downloaded, and record it in a sidecar file
+    session: aiohttp.ClientSession
+        session shared by all the downloads. An authenticated session with a
+        connection pool sized to max_concurrency is created if not provided. Its
+        requests time out when the connection or a chunk is not received in
+        time, but a transfer can last as long as it keeps receiving data
+
+    Returns
+    -------
+        An asynchronous iterator over the downloaded paths, with their digests if
+        a checksum is requested, in completion order, one for each download
+        that have succeeded
+    """
+    _check_chunk_size(chunk_size)
+    check_checksum(checksum)
+
+    output_dir = pl.Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    own_session = session is None
+    if own_session:
+        if username is None or password is None:
+            (username, password) = ensure_credentials(TDS_HOST)
+        session = aiohttp.ClientSession(
+            headers={"Authorization": aiohttp.encode_basic_auth(username, password)},
+            connector=aiohttp.TCPConnector(limit=max_concurrency),
+            timeout=aiohttp.ClientTimeout(
+                total=None, sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT
+            ),
+        )
+
+    circuit_breaker = CircuitBreaker()
+    urls = iter(urls)
+    pending = set()
+
+    try:
+        while True:
+            for url in urls:
+                pending.add(
+                    asyncio.ensure_future(
+                        _download_one_async(
+                            url,
+                            output_dir,
+                            session,
+                            retries,
+                            backoff,
+                            overwrite,
+                            chunk_size,
+                            checksum,
+                            circuit_breaker,
+                        )
+                    )
+                )
+                if len(pending) >= max_concurrency:
+                    break
+
+            if not pending:
+                break
+
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                result = task.result()
+                if result:
+                    yield result
+
+    finally:
+        # Stop the downloads in flight if the iteration is stopped, and wait
+        # for them to release their connections and files
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        if own_session:
+            await session.close()
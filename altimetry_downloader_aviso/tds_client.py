@@ -1,19 +1,91 @@
+import email.utils
+import hashlib
 import logging
+import math
 import os
 import pathlib as pl
+import re
 import time
 import warnings
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Generator, Iterable
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from contextlib import closing, nullcontext
+from itertools import islice
+from typing import Callable, Generator, Iterable, TypeVar
+from urllib.parse import urlparse
 
 import requests
+from requests.adapters import HTTPAdapter
 
+from . import metrics
 from .auth import ensure_credentials
+from .concurrency import AdaptiveConcurrency, ByteBudget, ByteBudgetClosed
+from .retry import (
+    MAX_BACKOFF,
+    CircuitBreaker,
+    decorrelated_jitter,
+    is_retryable_status,
+    parse_retry_after,
+)
 
 logger = logging.getLogger(__name__)
 
 TDS_HOST = "tds-odatis.aviso.altimetry.fr"
 
+# Size of the chunks read from the network and written to disk. A download never
+# holds more than one chunk in memory
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+# Suffix of the files receiving the data of an incomplete download
+PART_SUFFIX = ".part"
+
+# Suffix of the files recording the version of the remote file (ETag or
+# Last-Modified) received in a part file, checked by the If-Range header when
+# the download is resumed
+VALIDATOR_SUFFIX = ".validator"
+
+# Default bound of the bytes held in memory by in-memory downloads
+DEFAULT_MAX_BYTES_IN_FLIGHT = 1024 * 1024 * 1024
+
+# hashlib algorithms accepted for the checksums. Those guaranteed on every
+# platform, except the variable length digests (shake_*)
+CHECKSUM_ALGORITHMS = tuple(
+    sorted(a for a in hashlib.algorithms_guaranteed if not a.startswith("shake"))
+)
+
+# Number of hexadecimal digits of the hash of the query string added to the
+# names of the local files of the urls with a query, such as the subsets of
+# the NetCDF Subset Service
+QUERY_DIGEST_LENGTH = 8
+
+T = TypeVar("T")
+
+
+class DownloadedFile(str):
+    """Local path of a downloaded file, with the digest computed while it was
+    downloaded.
+
+    It is a str, and can be used wherever the path of the file is expected.
+
+    Attributes
+    ----------
+    digest: str | None
+        hexadecimal digest of the file for the requested checksum algorithm,
+        None if no checksum was requested
+    """
+
+    digest: str | None
+
+    def __new__(cls, path: str | pl.Path, digest: str | None = None):
+        downloaded_file = super().__new__(cls, path)
+        downloaded_file.digest = digest
+        return downloaded_file
+
 
 def http_single_download(
     url: str,
@@ -21,10 +93,35 @@ def http_single_download(
     username: str = None,
     password: str = None,
     overwrite: bool = False,
-) -> str:
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    segments: int = 1,
+    incremental: bool = False,
+    checksum: str | None = None,
+    session: requests.Session | None = None,
+) -> DownloadedFile | None:
     """Download a granule from AVISO's Thredds Data Server using HTTPS
     protocol.
 
+    The granule is streamed to disk chunk by chunk, so that the memory used by
+    a download is bounded by the chunk size. The data is written in a '.part'
+    file next to the final file, and only renamed once complete. If a '.part'
+    file is left by an interrupted download, the download is resumed where it
+    stopped using an HTTP Range request. The request is conditioned by an
+    If-Range header on the version of the remote file received in the '.part'
+    file: if the remote file changed in the meantime, it is downloaded again
+    from the start.
+
+    Large files can be split in several byte ranges downloaded concurrently
+    into a preallocated file. A segmented download that fails is not resumed.
+
+    The modification time of the downloaded file is set to the Last-Modified
+    date sent by the server, so that it can be compared with the remote file by
+    later incremental downloads.
+
+    A checksum is computed over the streamed chunks, without reading the file
+    back, except for the resumed part of an interrupted download and for
+    segmented downloads which chunks are not received in order.
+
     Parameters
     ----------
     url: str
@@ -37,33 +134,136 @@ def http_single_download(
         password for authentication. Retrieved from .netrc file if not provided
     overwrite: bool
         whether to overwrite the file if it already exists
+    chunk_size: int
+        size in bytes of the chunks streamed to disk. Cannot exceed
+        MAX_CHUNK_SIZE
+    segments: int
+        number of byte ranges of the file downloaded concurrently. Falls back to
+        a single stream if the server does not accept range requests
+    incremental: bool
+        whether to download again an existing file which size or modification
+        time differ from the remote file, as given by a HEAD request
+    checksum: str | None
+        name of a hashlib algorithm (e.g. 'sha256') used to compute the digest
+        of the file while it is downloaded. The digest is returned with the
+        path, and written in a sidecar file named after the file and the
+        algorithm ('<file>.sha256'), in the format of the sha256sum command
+    session: requests.Session
+        keep-alive session used to request the server. A plain request is made
+        if not provided
 
     Returns
     -------
-        the local path to the downloaded file
+        the local path to the downloaded file, with its digest if a checksum
+        is requested. None if the download is skipped
+
+    Raises
+    ------
+    ValueError
+        In case the chunk size is not in ]0, MAX_CHUNK_SIZE], or the checksum
+        algorithm is not supported
     """
+    _check_chunk_size(chunk_size)
+    check_checksum(checksum)
+
     if username is None or password is None:
         (username, password) = ensure_credentials(TDS_HOST)
 
     logger.debug("Downloading %s...", url)
 
-    filename = os.path.basename(url)
+    filename = url_filename(url)
     output_dir = pl.Path(output_dir) if isinstance(output_dir, str) else output_dir
     local_filepath = output_dir / filename
 
+    remote_headers = None
     if not overwrite and local_filepath.exists():
-        logger.debug("File %s already exist. Ignore download.", local_filepath)
-        return None
+        if not incremental:
+            logger.debug("File %s already exist. Ignore download.", local_filepath)
+            metrics.count(metrics.SKIPPED, 1, url)
+            return None
 
-    response = requests.get(url, auth=(username, password))
-    response.raise_for_status()
+        remote_headers = _remote_headers(url, (username, password), session)
+        if local_file_is_up_to_date(
+            local_filepath,
+            _content_length(remote_headers),
+            _parse_http_date(remote_headers.get("Last-Modified")),
+        ):
+            logger.debug("File %s is up to date. Ignore download.", local_filepath)
+            metrics.count(metrics.SKIPPED, 1, url)
+            return None
+
+        logger.info("File %s differs from the remote file.", local_filepath)
+
+    part_filepath = local_filepath.with_name(filename + PART_SUFFIX)
+    offset, headers = _resume_headers(part_filepath)
+
+    get = requests.get if session is None else session.get
+
+    if segments > 1 and offset == 0:
+        if remote_headers is None:
+            remote_headers = _remote_headers(url, (username, password), session)
+
+        size = _range_size(remote_headers)
+        if size > 0:
+            _segmented_download(
+                get,
+                url,
+                (username, password),
+                part_filepath,
+                size,
+                segments,
+                chunk_size,
+                _validator(remote_headers),
+            )
+            _complete_download(
+                part_filepath, local_filepath, remote_headers.get("Last-Modified")
+            )
+            file_hash = _new_hash(checksum, local_filepath)
+            if file_hash is not None:
+                _write_checksum_file(local_filepath, checksum, file_hash)
+            logger.info("File %s downloaded in %d segments.", local_filepath, segments)
+            return _downloaded_file(local_filepath, file_hash)
 
-    with open(local_filepath, "wb") as f:
-        f.write(response.content)
+        logger.debug("%s does not accept range requests. Use a single stream.", url)
 
+    with closing(
+        get(url, auth=(username, password), stream=True, headers=headers)
+    ) as response:
+        try:
+            mode = _part_file_mode(
+                url,
+                offset,
+                response.status_code,
+                response.headers.get("Content-Range"),
+            )
+        except ValueError as e:
+            logger.debug("Discard invalid partial file %s", part_filepath)
+            _discard_part_file(part_filepath)
+            raise requests.HTTPError(str(e), response=response) from e
+
+        if mode == "wb":
+            response.raise_for_status()
+            _write_validator(part_filepath, _validator(response.headers))
+
+        # The bytes already in the part file are read back to be hashed
+        file_hash = _new_hash(checksum, part_filepath if mode != "wb" else None)
+
+        if mode is not None:
+            with open(part_filepath, mode) as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+                    metrics.count(metrics.BYTES, len(chunk), url)
+                    if file_hash is not None:
+                        file_hash.update(chunk)
+
+        last_modified = response.headers.get("Last-Modified")
+
+    _complete_download(part_filepath, local_filepath, last_modified)
+    if file_hash is not None:
+        _write_checksum_file(local_filepath, checksum, file_hash)
     logger.info("File %s downloaded.", local_filepath)
 
-    return str(local_filepath)
+    return _downloaded_file(local_filepath, file_hash)
 
 
 def http_single_download_with_retries(
@@ -74,10 +274,20 @@ def http_single_download_with_retries(
     username: str = None,
     password: str = None,
     overwrite: bool = False,
-) -> str:
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    segments: int = 1,
+    incremental: bool = False,
+    checksum: str | None = None,
+    circuit_breaker: CircuitBreaker | None = None,
+    session: requests.Session | None = None,
+) -> DownloadedFile | None:
     """Download a granule from AVISO's Thredds Data Server using HTTPS
     protocol. Retries if the download fails.
 
+    Only the errors that may be transient are retried: network errors, server
+    errors, timeouts and throttling. Other client errors (401, 403, 404...) fail
+    immediately.
+
     Parameters
     ----------
     url: str
@@ -87,17 +297,36 @@ def http_single_download_with_retries(
     retries: int
         number of retries
     backoff: float
-        waiting time between two tries. Increases exponentially
+        minimum waiting time between two tries. The waiting time grows with
+        random jitter, and is extended to the Retry-After delay asked by the
+        server
     username: str
         username for authentication. Retrieved from .netrc file if not provided
     password: str
         password for authentication. Retrieved from .netrc file if not provided
     overwrite: bool
         whether to overwrite the file if it already exists
+    chunk_size: int
+        size in bytes of the chunks streamed to disk
+    segments: int
+        number of byte ranges of each file downloaded concurrently
+    incremental: bool
+        whether to download again the existing files which size or modification
+        time differ from the remote file
+    checksum: str | None
+        name of a hashlib algorithm (e.g. 'sha256') used to compute the digest
+        of each file while it is downloaded, and record it in a sidecar file
+    circuit_breaker: CircuitBreaker | None
+        circuit breaker shared with other downloads, pausing the requests to a
+        failing host
+    session: requests.Session
+        keep-alive session used to request the server. A plain request is made
+        if not provided
 
     Returns
     -------
-        the local path to the downloaded file
+        the local path to the downloaded file, with its digest if a checksum
+        is requested. None if the download is skipped
 
     Raises
     ------
@@ -107,22 +336,129 @@ def http_single_download_with_retries(
     if username is None or password is None:
         (username, password) = ensure_credentials(TDS_HOST)
 
+    return _with_retries(
+        lambda: http_single_download(
+            url,
+            output_dir,
+            username,
+            password,
+            overwrite,
+            chunk_size,
+            segments,
+            incremental,
+            checksum,
+            session,
+        ),
+        url,
+        retries,
+        backoff,
+        circuit_breaker,
+    )
+
+
+def _with_retries(
+    request: Callable[[], T],
+    url: str,
+    retries: int,
+    backoff: float,
+    circuit_breaker: CircuitBreaker | None,
+) -> T:
+    """Call a request of a url until it succeeds, retrying the transient
+    errors.
+
+    Parameters
+    ----------
+    request: Callable[[], T]
+        function requesting the url
+    url: str
+        the requested url
+    retries: int
+        number of tries
+    backoff: float
+        minimum waiting time between two tries
+    circuit_breaker: CircuitBreaker | None
+        circuit breaker shared with other requests
+
+    Returns
+    -------
+        the result of the first successful request. A None result is a skipped
+        download
+
+    Raises
+    ------
+    RequestException
+        The error of the last try
+    """
     last_exception = None
+    delay = backoff
+    start = time.perf_counter()
 
     for attempt in range(1, retries + 1):
+        if circuit_breaker is not None:
+            circuit_breaker.wait(url)
+
         try:
-            return http_single_download(url, output_dir, username, password, overwrite)
+            result = request()
 
         except requests.RequestException as e:
             logger.debug("Attempt %d failed for %s: %s", attempt, url, e)
 
             last_exception = e
+            if not _is_retryable(e):
+                logger.debug("Error is not retryable: give up %s", url)
+                break
+
+            if circuit_breaker is not None:
+                circuit_breaker.record_failure(url)
+
             if attempt < retries:
-                time.sleep(backoff * (2 ** (attempt - 1)))
+                delay = decorrelated_jitter(backoff, delay)
+
+                # Throttled or unavailable server: honour its Retry-After
+                # header, and pause the other downloads as well
+                retry_after = parse_retry_after(
+                    e.response.headers.get("Retry-After")
+                    if e.response is not None
+                    else None
+                )
+                if retry_after is not None:
+                    delay = min(MAX_BACKOFF, max(delay, retry_after))
+                    if circuit_breaker is not None:
+                        circuit_breaker.pause(url, min(MAX_BACKOFF, retry_after))
+
+                metrics.count(metrics.RETRIES, 1, url)
+                time.sleep(delay)
 
+        else:
+            if circuit_breaker is not None:
+                circuit_breaker.record_success(url)
+            if result is not None:
+                metrics.observe(metrics.TRANSFER, time.perf_counter() - start, url)
+                metrics.count(metrics.FILES, 1, url)
+            return result
+
+    metrics.count(metrics.FAILURES, 1, url)
     raise last_exception
 
 
+def _is_retryable(error: requests.RequestException) -> bool:
+    """Whether a failed download may succeed if it is tried again."""
+    if isinstance(
+        error,
+        (
+            requests.exceptions.InvalidURL,
+            requests.exceptions.InvalidSchema,
+            requests.exceptions.MissingSchema,
+        ),
+    ):
+        return False
+
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return is_retryable_status(error.response.status_code)
+
+    return True
+
+
 def _download_one(
     url: str,
     output_dir: str | pl.Path,
@@ -131,17 +467,75 @@ def _download_one(
     username: str = None,
     password: str = None,
     overwrite: bool = False,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    segments: int = 1,
+    incremental: bool = False,
+    checksum: str | None = None,
+    circuit_breaker: CircuitBreaker | None = None,
+    session: requests.Session | None = None,
+    on_failure: Callable[[str, Exception], None] | None = None,
 ):
     try:
         return http_single_download_with_retries(
-            url, output_dir, retries, backoff, username, password, overwrite
+            url,
+            output_dir,
+            retries,
+            backoff,
+            username,
+            password,
+            overwrite,
+            chunk_size,
+            segments,
+            incremental,
+            checksum,
+            circuit_breaker,
+            session,
         )
     except requests.RequestException as e:
-        msg = f"Failed to download {url}. An error happened: {e}"
-        warnings.warn(msg)
+        _warn_failure(url, e, on_failure)
     return
 
 
+def _measured_download(url: str, *args) -> tuple:
+    """Download a granule with retries.
+
+    Return its url, its local path, the duration of the download and the
+    error that made it fail.
+    """
+    start = time.monotonic()
+    try:
+        result = http_single_download_with_retries(url, *args)
+    except requests.RequestException as e:
+        return url, None, time.monotonic() - start, e
+    return url, result, time.monotonic() - start, None
+
+
+def _record_outcome(
+    controller: AdaptiveConcurrency,
+    result: str | None,
+    elapsed: float,
+    error: Exception | None,
+):
+    """Feed the adaptive concurrency controller with a download outcome."""
+    if error is not None:
+        response = getattr(error, "response", None)
+        controller.record_failure(getattr(response, "status_code", None))
+    elif result is not None:
+        # Skipped downloads say nothing about the server load
+        controller.record_success(elapsed, os.path.getsize(result))
+
+
+def _warn_failure(
+    url: str,
+    error: Exception,
+    on_failure: Callable[[str, Exception], None] | None = None,
+):
+    msg = f"Failed to download {url}. An error happened: {error}"
+    warnings.warn(msg)
+    if on_failure is not None:
+        on_failure(url, error)
+
+
 def http_bulk_download(
     urls: list[str],
     output_dir: str | pl.Path,
@@ -150,10 +544,18 @@ def http_bulk_download(
     username: str = None,
     password: str = None,
     overwrite: bool = False,
-) -> Generator[str, None, None]:
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    segments: int = 1,
+    incremental: bool = False,
+    checksum: str | None = None,
+    session: requests.Session | None = None,
+    on_failure: Callable[[str, Exception], None] | None = None,
+) -> Generator[DownloadedFile, None, None]:
     """Loop on a list of urls to download each granule from AVISO's Thredds
     Data Server using HTTPS protocol. Each download as retries if it fails.
 
+    The requests are paused when the server keeps failing or asks to slow down.
+
     Parameters
     ----------
     urls: list[str]
@@ -170,23 +572,58 @@ def http_bulk_download(
         password for authentication. Retrieved from .netrc file if not provided
     overwrite: bool
         whether to overwrite the file if it already exists
+    chunk_size: int
+        size in bytes of the chunks streamed to disk
+    segments: int
+        number of byte ranges of each file downloaded concurrently
+    incremental: bool
+        whether to download again the existing files which size or modification
+        time differ from the remote file
+    checksum: str | None
+        name of a hashlib algorithm (e.g. 'sha256') used to compute the digest
+        of each file while it is downloaded, and record it in a sidecar file
+    session: requests.Session
+        keep-alive session shared by all the downloads. Created if not provided
+    on_failure: Callable[[str, Exception], None] | None
+        function called with the url and the error of each download which
+        failed, after its last try
 
     Returns
     -------
-        An iterator over the downloaded paths, one for each download that have succeeded
+        An iterator over the downloaded paths, one for each download that have
+        succeeded, with their digests if a checksum is requested
     """
+    _check_chunk_size(chunk_size)
+    check_checksum(checksum)
+
     if username is None or password is None:
         (username, password) = ensure_credentials(TDS_HOST)
 
     output_dir = pl.Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    for url in urls:
-        file = _download_one(
-            url, output_dir, retries, backoff, username, password, overwrite
-        )
-        if file:
-            yield file
+    circuit_breaker = CircuitBreaker()
+
+    with _session_scope(session, username, password, pool_size=segments) as session:
+        for url in urls:
+            file = _download_one(
+                url,
+                output_dir,
+                retries,
+                backoff,
+                username,
+                password,
+                overwrite,
+                chunk_size,
+                segments,
+                incremental,
+                checksum,
+                circuit_breaker,
+                session,
+                on_failure,
+            )
+            if file:
+                yield file
 
 
 def http_bulk_download_parallel(
@@ -198,16 +635,37 @@ def http_bulk_download_parallel(
     username: str = None,
     password: str = None,
     overwrite: bool = False,
-) -> Generator[str, None, None]:
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    segments: int = 1,
+    incremental: bool = False,
+    checksum: str | None = None,
+    session: requests.Session | None = None,
+    max_in_flight: int | None = None,
+    adaptive: bool = False,
+    on_concurrency_change: Callable[[int], None] | None = None,
+    on_failure: Callable[[str, Exception], None] | None = None,
+) -> Generator[DownloadedFile, None, None]:
     """Parallel download of granules from AVISO's Thredds Data Server using
     HTTPS protocol.
 
+    The urls are consumed lazily: at most max_in_flight downloads are submitted
+    to the workers at any time, so that a generator of urls can be downloaded
+    without being materialized.
+
+    The downloads share a circuit breaker: when the server keeps failing or
+    asks to slow down, all the workers pause their requests.
+
+    In adaptive mode, the number of concurrent downloads is driven by an
+    :class:`~altimetry_downloader_aviso.concurrency.AdaptiveConcurrency`
+    controller between 1 and max_workers: it increases while the throughput
+    grows and decreases when the server is throttling or failing.
+
     Parameters
     ----------
-    urls: list[str]
+    urls: Iterable[str]
         the urls to download
     output_dir: str | pl.Path
-        existing directory to store the downloaded file
+        a directory to store the downloaded file (create it if doesn't exist)
     retries: int
         number of retries
     backoff: float
@@ -220,30 +678,745 @@ def http_bulk_download_parallel(
         password for authentication. Retrieved from .netrc file if not provided
     overwrite: bool
         whether to overwrite the file if it already exists
+    chunk_size: int
+        size in bytes of the chunks streamed to disk
+    segments: int
+        number of byte ranges of each file downloaded concurrently
+    incremental: bool
+        whether to download again the existing files which size or modification
+        time differ from the remote file
+    checksum: str | None
+        name of a hashlib algorithm (e.g. 'sha256') used to compute the digest
+        of each file while it is downloaded, and record it in a sidecar file
+    session: requests.Session
+        keep-alive session shared by all the downloads. A session with a
+        connection pool sized to the number of workers is created if not provided
+    max_in_flight: int
+        maximum number of downloads submitted and not yet completed. Defaults to
+        twice the number of workers. Ignored in adaptive mode
+    adaptive: bool
+        whether to adapt the number of concurrent downloads to the observed
+        throughput, latency and errors
+    on_concurrency_change: Callable[[int], None] | None
+        function called with the new number of concurrent downloads each time
+        the adaptive mode changes it
+    on_failure: Callable[[str, Exception], None] | None
+        function called with the url and the error of each download which
+        failed, after its last try
 
     Returns
     -------
-        An iterator over the downloaded paths, one for each download that have succeeded
+        An iterator over the downloaded paths, one for each download that have
+        succeeded, with their digests if a checksum is requested
+
+    Raises
+    ------
+    ValueError
+        In case max_in_flight is not strictly positive
     """
+    _check_chunk_size(chunk_size)
+    check_checksum(checksum)
+
+    if max_in_flight is None:
+        max_in_flight = 2 * max_workers
+    if max_in_flight <= 0:
+        msg = f"max_in_flight must be strictly positive, got {max_in_flight}."
+        raise ValueError(msg)
+
     if username is None or password is None:
         (username, password) = ensure_credentials(TDS_HOST)
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_url = {
-            executor.submit(
-                _download_one,
-                url,
-                output_dir,
-                retries,
-                backoff,
-                username,
-                password,
-                overwrite,
-            ): url
-            for url in urls
-        }
-
-        for future in as_completed(future_to_url):
-            result = future.result()
-            if result:
-                yield result
+    output_dir = pl.Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # Shared by the workers to pause them all when the server is failing
+    circuit_breaker = CircuitBreaker()
+
+    controller = None
+    if adaptive:
+        controller = AdaptiveConcurrency(max_workers, callback=on_concurrency_change)
+        logger.info("Start with %d concurrent downloads.", controller.level)
+
+    with (
+        _session_scope(
+            session, username, password, pool_size=max_workers * segments
+        ) as session,
+        ThreadPoolExecutor(max_workers=max_workers) as executor,
+    ):
+        urls = iter(urls)
+        pending = set()
+
+        try:
+            while True:
+                # Refill the window of in-flight downloads
+                limit = max_in_flight if controller is None else controller.level
+                for url in islice(urls, max(0, limit - len(pending))):
+                    pending.add(
+                        metrics.submit(
+                            executor,
+                            _measured_download,
+                            url,
+                            output_dir,
+                            retries,
+                            backoff,
+                            username,
+                            password,
+                            overwrite,
+                            chunk_size,
+                            segments,
+                            incremental,
+                            checksum,
+                            circuit_breaker,
+                            session,
+                        )
+                    )
+
+                if not pending:
+                    break
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url, result, elapsed, error = future.result()
+                    if error is not None:
+                        _warn_failure(url, error, on_failure)
+                    if controller is not None:
+                        _record_outcome(controller, result, elapsed, error)
+                    if result:
+                        yield result
+
+        finally:
+            # Do not start the queued downloads if the iteration is stopped
+            for future in pending:
+                future.cancel()
+
+
+def http_fetch(
+    url: str,
+    username: str = None,
+    password: str = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    budget: ByteBudget | None = None,
+    session: requests.Session | None = None,
+) -> memoryview:
+    """Download a granule from AVISO's Thredds Data Server into memory, without
+    writing it to disk.
+
+    The data is received chunk by chunk into a buffer allocated once from the
+    Content-Length of the response.
+
+    Parameters
+    ----------
+    url: str
+        the url to download
+    username: str
+        username for authentication. Retrieved from .netrc file if not provided
+    password: str
+        password for authentication. Retrieved from .netrc file if not provided
+    chunk_size: int
+        size in bytes of the chunks read from the network. Cannot exceed
+        MAX_CHUNK_SIZE
+    budget: ByteBudget | None
+        byte budget shared with other downloads. The size of the granule is
+        acquired before receiving its data, and must be released by the caller
+        once done with the data. It is released if the download fails
+    session: requests.Session
+        keep-alive session used to request the server. A plain request is made
+        if not provided
+
+    Returns
+    -------
+        the content of the granule
+
+    Raises
+    ------
+    ValueError
+        In case the chunk size is not in ]0, MAX_CHUNK_SIZE]
+    RequestException
+        In case an exception happens when requesting the file on the server, or
+        the data received is shorter than announced
+    """
+    _check_chunk_size(chunk_size)
+
+    if username is None or password is None:
+        (username, password) = ensure_credentials(TDS_HOST)
+
+    logger.debug("Fetching %s...", url)
+    get = requests.get if session is None else session.get
+
+    with closing(get(url, auth=(username, password), stream=True)) as response:
+        response.raise_for_status()
+
+        size = _content_length(response.headers)
+        acquired = 0
+        if budget is not None and size is not None:
+            budget.acquire(size)
+            acquired = size
+
+        try:
+            buffer = bytearray(size or 0)
+            received = 0
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                # Fills the preallocated buffer, or extends it beyond
+                end = received + len(chunk)
+                buffer[received:end] = chunk
+                received = end
+                metrics.count(metrics.BYTES, len(chunk), url)
+
+            if size is not None and received < size:
+                msg = f"Received {received} bytes instead of {size} for {url}"
+                raise requests.HTTPError(msg, response=response)
+
+            if budget is not None and received > acquired:
+                # Unknown or understated size: the data is already in memory
+                budget.acquire(received - acquired, block=False)
+
+        except BaseException:
+            if acquired:
+                budget.release(acquired)
+            raise
+
+    return memoryview(buffer)
+
+
+def http_bulk_fetch(
+    urls: Iterable[str],
+    retries: int = 3,
+    backoff: float = 1.0,
+    max_workers: int = 4,
+    username: str = None,
+    password: str = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    session: requests.Session | None = None,
+    max_bytes_in_flight: int = DEFAULT_MAX_BYTES_IN_FLIGHT,
+) -> Generator[tuple[str, memoryview], None, None]:
+    """Parallel download of granules from AVISO's Thredds Data Server into
+    memory, without writing them to disk.
+
+    The memory is bounded by a byte budget: a download waits before receiving
+    its data until its size fits in the budget, and the data of a granule stays
+    in the budget until the caller asks for the next granule. A granule larger
+    than the budget is downloaded alone. The budget cannot bound the granules
+    which size is not sent by the server.
+
+    The granules are yielded in the order in which their downloads complete.
+    Failed downloads are retried, then skipped with a warning.
+
+    Parameters
+    ----------
+    urls: Iterable[str]
+        the urls to download, consumed lazily
+    retries: int
+        number of retries
+    backoff: float
+        minimum waiting time between two tries
+    max_workers: int
+        maximum number of concurrent downloads
+    username: str
+        username for authentication. Retrieved from .netrc file if not provided
+    password: str
+        password for authentication. Retrieved from .netrc file if not provided
+    chunk_size: int
+        size in bytes of the chunks read from the network
+    session: requests.Session
+        keep-alive session shared by all the downloads. A session with a
+        connection pool sized to the number of workers is created if not provided
+    max_bytes_in_flight: int
+        maximum number of bytes received and not yet consumed
+
+    Returns
+    -------
+        An iterator over (url, content) tuples, one for each download that has
+        succeeded. The content is a memoryview that can be wrapped in a file-like
+        object with io.BytesIO, or opened by netCDF4.Dataset(memory=...)
+
+    Raises
+    ------
+    ValueError
+        In case the chunk size or the byte budget is invalid
+    """
+    _check_chunk_size(chunk_size)
+    budget = ByteBudget(max_bytes_in_flight)
+
+    if username is None or password is None:
+        (username, password) = ensure_credentials(TDS_HOST)
+
+    circuit_breaker = CircuitBreaker()
+
+    with (
+        _session_scope(session, username, password, pool_size=max_workers) as session,
+        ThreadPoolExecutor(max_workers=max_workers) as executor,
+    ):
+        urls = iter(urls)
+        pending = set()
+
+        try:
+            while True:
+                for url in islice(urls, max(0, max_workers - len(pending))):
+                    pending.add(
+                        metrics.submit(
+                            executor,
+                            _fetch_one,
+                            url,
+                            retries,
+                            backoff,
+                            username,
+                            password,
+                            chunk_size,
+                            budget,
+                            circuit_breaker,
+                            session,
+                        )
+                    )
+
+                if not pending:
+                    break
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url, content, error = future.result()
+                    if error is not None:
+                        _warn_failure(url, error)
+                        continue
+                    try:
+                        yield url, content
+                    finally:
+                        budget.release(content.nbytes)
+
+        finally:
+            # Do not start the queued downloads if the iteration is stopped, and
+            # unblock those waiting for the budget
+            for future in pending:
+                future.cancel()
+            budget.close()
+
+
+def _fetch_one(
+    url: str,
+    retries: int,
+    backoff: float,
+    username: str,
+    password: str,
+    chunk_size: int,
+    budget: ByteBudget,
+    circuit_breaker: CircuitBreaker,
+    session: requests.Session,
+) -> tuple:
+    """Download a granule into memory with retries.
+
+    Return its url, its content and the error that made it fail.
+    """
+    try:
+        content = _with_retries(
+            lambda: http_fetch(url, username, password, chunk_size, budget, session),
+            url,
+            retries,
+            backoff,
+            circuit_breaker,
+        )
+    except (requests.RequestException, ByteBudgetClosed) as e:
+        return url, None, e
+    return url, content, None
+
+
+def url_filename(url: str) -> str:
+    """Name of the local file of a url.
+
+    The query string is hashed into a suffix of the name, so that the
+    subsets of a granule with different variables or bounding boxes, and
+    the whole granule, are stored in distinct files.
+    """
+    parsed = urlparse(url)
+    name = os.path.basename(parsed.path)
+    if not parsed.query:
+        return name
+    digest = hashlib.sha1(parsed.query.encode()).hexdigest()[:QUERY_DIGEST_LENGTH]
+    stem, extension = os.path.splitext(name)
+    return f"{stem}.{digest}{extension}"
+
+
+def create_session(
+    pool_size: int = 1, username: str = None, password: str = None
+) -> requests.Session:
+    """Create a keep-alive session to AVISO's Thredds Data Server.
+
+    Sharing a session between downloads reuses the TCP/TLS connections instead
+    of paying a new handshake for each granule.
+
+    Parameters
+    ----------
+    pool_size: int
+        maximum number of connections kept alive to the server. Should match the
+        number of concurrent downloads
+    username: str
+        username for authentication. Retrieved from .netrc file if not provided
+    password: str
+        password for authentication. Retrieved from .netrc file if not provided
+
+    Returns
+    -------
+        the session, to be closed by the caller
+    """
+    if username is None or password is None:
+        (username, password) = ensure_credentials(TDS_HOST)
+
+    session = requests.Session()
+    session.auth = (username, password)
+
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return session
+
+
+def _session_scope(
+    session: requests.Session | None, username: str, password: str, pool_size: int
+):
+    """Use the given session, or a new one closed at the end of the scope."""
+    if session is not None:
+        return nullcontext(session)
+    return create_session(pool_size, username, password)
+
+
+def local_file_is_up_to_date(
+    path: str | pl.Path,
+    remote_size: int | None = None,
+    remote_mtime: float | None = None,
+    rel_tol: float = 0.0,
+) -> bool:
+    """Compare a local file with the metadata of its remote counterpart.
+
+    Parameters
+    ----------
+    path: str | pl.Path
+        the existing local file
+    remote_size: int | None
+        size in bytes of the remote file. Not compared if None
+    remote_mtime: float | None
+        modification time of the remote file, as a POSIX timestamp. Not compared
+        if None
+    rel_tol: float
+        relative tolerance on the size, for remote sizes which are rounded
+
+    Returns
+    -------
+        True if the local file has the size of the remote file and is not older
+        than it
+    """
+    stat = pl.Path(path).stat()
+
+    if remote_size is not None and not math.isclose(
+        stat.st_size, remote_size, rel_tol=rel_tol
+    ):
+        return False
+
+    return remote_mtime is None or stat.st_mtime >= remote_mtime
+
+
+def _remote_headers(
+    url: str, auth: tuple[str, str], session: requests.Session | None
+) -> requests.structures.CaseInsensitiveDict:
+    """Headers of a HEAD request on a remote file."""
+    head = requests.head if session is None else session.head
+    response = head(url, auth=auth, allow_redirects=True)
+    response.raise_for_status()
+    return response.headers
+
+
+def _range_size(headers: requests.structures.CaseInsensitiveDict) -> int:
+    """Size of a remote file if the server accepts byte range requests, 0
+    otherwise."""
+    if headers.get("Accept-Ranges", "").lower() != "bytes":
+        return 0
+    return _content_length(headers) or 0
+
+
+def _content_length(headers: requests.structures.CaseInsensitiveDict) -> int | None:
+    """Content-Length header, or None if unknown."""
+    content_length = headers.get("Content-Length")
+    return int(content_length) if content_length is not None else None
+
+
+def _parse_http_date(value: str | None) -> float | None:
+    """POSIX timestamp of an HTTP date header, or None if missing or
+    invalid."""
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _complete_download(
+    part_filepath: pl.Path, local_filepath: pl.Path, last_modified: str | None
+):
+    """Rename a complete part file and date it with the remote modification
+    time."""
+    os.replace(part_filepath, local_filepath)
+    _validator_filepath(part_filepath).unlink(missing_ok=True)
+
+    mtime = _parse_http_date(last_modified)
+    if mtime is not None:
+        os.utime(local_filepath, (time.time(), mtime))
+
+
+def _segmented_download(
+    get: Callable[..., requests.Response],
+    url: str,
+    auth: tuple[str, str],
+    part_filepath: pl.Path,
+    size: int,
+    segments: int,
+    chunk_size: int,
+    validator: str | None = None,
+):
+    """Download a file as concurrent byte ranges written in a preallocated
+    file.
+
+    The ranges are conditioned by an If-Range header on the version of
+    the file given by the validator, so that they cannot mix two
+    versions of a file updated during the download.
+    """
+    with open(part_filepath, "wb") as f:
+        f.truncate(size)
+
+    bounds = [size * i // segments for i in range(segments + 1)]
+    ranges = [(a, b - 1) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            futures = [
+                metrics.submit(
+                    executor,
+                    _download_range,
+                    get,
+                    url,
+                    auth,
+                    part_filepath,
+                    a,
+                    b,
+                    chunk_size,
+                    validator,
+                )
+                for a, b in ranges
+            ]
+            for future in as_completed(futures):
+                future.result()
+    except BaseException:
+        # A preallocated file has the size of the complete file: it must not be
+        # resumed
+        part_filepath.unlink()
+        raise
+
+
+def _download_range(
+    get: Callable[..., requests.Response],
+    url: str,
+    auth: tuple[str, str],
+    part_filepath: pl.Path,
+    start: int,
+    end: int,
+    chunk_size: int,
+    validator: str | None = None,
+):
+    """Download the [start, end] byte range of a file at its position in a
+    preallocated file."""
+    headers = {"Range": f"bytes={start}-{end}"}
+    if validator is not None:
+        headers["If-Range"] = validator
+    with closing(get(url, auth=auth, stream=True, headers=headers)) as response:
+        response.raise_for_status()
+
+        received_start, _ = _parse_content_range(response.headers.get("Content-Range"))
+        if response.status_code != 206 or received_start != start:
+            msg = f"Server did not send the bytes {start}-{end} of {url}"
+            raise requests.HTTPError(msg, response=response)
+
+        written = 0
+        with open(part_filepath, "r+b") as f:
+            f.seek(start)
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+                written += len(chunk)
+                metrics.count(metrics.BYTES, len(chunk), url)
+
+    if written != end - start + 1:
+        msg = f"Received {written} bytes instead of {end - start + 1} for {url}"
+        raise requests.HTTPError(msg, response=response)
+
+
+def _resume_headers(part_filepath: pl.Path) -> tuple[int, dict[str, str]]:
+    """Offset at which a download resumes its part file, and the headers of the
+    Range request.
+
+    A part file which version of the remote file is unknown cannot be resumed
+    safely: the download starts again from the beginning.
+    """
+    if not part_filepath.exists():
+        return 0, {}
+
+    validator_filepath = _validator_filepath(part_filepath)
+    if not validator_filepath.exists():
+        logger.debug("Unknown version of partial file %s: restart", part_filepath)
+        return 0, {}
+
+    offset = part_filepath.stat().st_size
+    if offset == 0:
+        return 0, {}
+    return offset, {
+        "Range": f"bytes={offset}-",
+        "If-Range": validator_filepath.read_text(),
+    }
+
+
+def _validator(headers: requests.structures.CaseInsensitiveDict) -> str | None:
+    """Validator of the version of a remote file usable in an If-Range header:
+    its strong ETag, or its Last-Modified date. None if the server sent none."""
+    etag = headers.get("ETag")
+    if etag is not None and not etag.startswith("W/"):
+        return etag
+    return headers.get("Last-Modified")
+
+
+def _validator_filepath(part_filepath: pl.Path) -> pl.Path:
+    return part_filepath.with_name(part_filepath.name + VALIDATOR_SUFFIX)
+
+
+def _write_validator(part_filepath: pl.Path, validator: str | None):
+    """Record the version of the remote file received in a part file.
+
+    Without validator, the part file will not be resumed.
+    """
+    validator_filepath = _validator_filepath(part_filepath)
+    if validator is None:
+        validator_filepath.unlink(missing_ok=True)
+    else:
+        validator_filepath.write_text(validator)
+
+
+def _discard_part_file(part_filepath: pl.Path):
+    part_filepath.unlink(missing_ok=True)
+    _validator_filepath(part_filepath).unlink(missing_ok=True)
+
+
+def _part_file_mode(
+    url: str, offset: int, status_code: int, content_range: str | None
+) -> str | None:
+    """Mode in which the part file should be opened to receive a response.
+
+    Parameters
+    ----------
+    url: str
+        the requested url
+    offset: int
+        size of the existing part file. The response answers a Range request
+        starting at this offset if it is strictly positive
+    status_code: int
+        status of the response
+    content_range: str | None
+        Content-Range header of the response
+
+    Returns
+    -------
+        'ab' to resume the download, 'wb' to write the whole file (the server
+        may ignore the Range header, or the If-Range condition when the remote
+        file changed) or None if the part file is already complete
+
+    Raises
+    ------
+    ValueError
+        In case the part file is inconsistent with the remote file
+    """
+    if offset <= 0 or status_code not in (206, 416):
+        return "wb"
+
+    start, total = _parse_content_range(content_range)
+
+    if status_code == 416:
+        # Range Not Satisfiable: the part file is either already complete or
+        # longer than the remote file
+        if total != offset:
+            msg = f"Partial file of {url} has {offset} bytes, remote file {total}"
+            raise ValueError(msg)
+        return None
+
+    if start != offset:
+        msg = f"Server resumed {url} at byte {start} instead of {offset}"
+        raise ValueError(msg)
+
+    logger.debug("Resume download of %s from byte %d", url, offset)
+    return "ab"
+
+
+def _parse_content_range(content_range: str | None) -> tuple[int, int]:
+    """Parse the first byte position and the total length of a Content-Range
+    header ('bytes 100-199/1000' or 'bytes */1000').
+
+    Unknown values are returned as -1.
+    """
+    match = re.fullmatch(
+        r"bytes (?:(\d+)-\d+|\*)/(\d+|\*)", (content_range or "").strip()
+    )
+    if match is None:
+        return -1, -1
+    start, total = match.groups()
+    return (
+        int(start) if start is not None else -1,
+        int(total) if total != "*" else -1,
+    )
+
+
+def check_checksum(checksum: str | None):
+    """Check that the checksum algorithm is one of CHECKSUM_ALGORITHMS.
+
+    Raises
+    ------
+    ValueError
+        In case the algorithm is not supported
+    """
+    if checksum is not None and checksum not in CHECKSUM_ALGORITHMS:
+        msg = (
+            f"Unsupported checksum algorithm '{checksum}'. Available algorithms: "
+            f"{', '.join(CHECKSUM_ALGORITHMS)}."
+        )
+        raise ValueError(msg)
+
+
+def _new_hash(checksum: str | None, prefix_filepath: pl.Path | None = None):
+    """Hash object of a checksum algorithm, fed with the content of an existing
+    file.
+
+    None if no checksum is requested.
+    """
+    if checksum is None:
+        return None
+
+    file_hash = hashlib.new(checksum)
+    if prefix_filepath is not None:
+        with open(prefix_filepath, "rb") as f:
+            while chunk := f.read(DEFAULT_CHUNK_SIZE):
+                file_hash.update(chunk)
+
+    return file_hash
+
+
+def _downloaded_file(local_filepath: pl.Path, file_hash) -> DownloadedFile:
+    return DownloadedFile(
+        local_filepath, file_hash.hexdigest() if file_hash is not None else None
+    )
+
+
+def _write_checksum_file(local_filepath: pl.Path, checksum: str, file_hash):
+    """Record the digest of a file in a '<file>.<algorithm>' sidecar file."""
+    checksum_filepath = local_filepath.with_name(f"{local_filepath.name}.{checksum}")
+    checksum_filepath.write_text(f"{file_hash.hexdigest()}  {local_filepath.name}\n")
+    logger.debug("Checksum of %s written in %s", local_filepath, checksum_filepath)
+
+
+def _check_chunk_size(chunk_size: int):
+    """Check that the chunk size bounds the memory used by a download."""
+    if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+        msg = (
+            f"Invalid chunk size {chunk_size}: it must be strictly positive and "
+            f"lower than {MAX_CHUNK_SIZE} bytes."
+        )
+        raise ValueError(msg)
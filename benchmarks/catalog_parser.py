@@ -0,0 +1,107 @@
+"""Compare the parsing of a THREDDS leaf catalog by siphon and by the fast
+parser.
+
+The catalog is generated with the structure of the AVISO cycle catalogs. Both
+parsers read the same document from memory: the time and the peak of memory
+allocated by the parsing are measured, not the request.
+
+Usage::
+
+    python benchmarks/catalog_parser.py --datasets 5000 --repeat 5
+"""
+
+import argparse
+import time
+import tracemalloc
+from unittest import mock
+
+from altimetry_downloader_aviso.catalog_client.catalog_parser import parse_catalog
+from altimetry_downloader_aviso.catalog_client.granule_discoverer import TDSCatalog
+
+CATALOG_URL = "https://tds.mock/thredds/catalog/cycle_001/catalog.xml"
+
+_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<catalog xmlns="http://www.unidata.ucar.edu/namespaces/thredds/InvCatalog/v1.0"
+         xmlns:xlink="http://www.w3.org/1999/xlink" name="cycle_001">
+  <service name="all" serviceType="Compound" base="">
+    <service name="http" serviceType="HTTPServer" base="/thredds/fileServer/"/>
+    <service name="ncss" serviceType="NetcdfSubset" base="/thredds/ncss/grid/"/>
+    <service name="odap" serviceType="OPENDAP" base="/thredds/dodsC/"/>
+  </service>
+  <dataset name="cycle_001" ID="cycle_001">
+    <metadata inherited="true">
+      <serviceName>all</serviceName>
+      <dataType>Grid</dataType>
+    </metadata>
+"""
+
+_DATASET = """    <dataset name="{name}" ID="cycle_001/{name}"
+             urlPath="cycle_001/{name}">
+      <dataSize units="Mbytes">123.4</dataSize>
+      <date type="modified">2025-03-04T05:06:07Z</date>
+    </dataset>
+"""
+
+_FOOTER = """  </dataset>
+</catalog>
+"""
+
+
+def catalog_document(datasets: int) -> bytes:
+    """Leaf catalog listing a number of granules."""
+    names = (
+        f"SWOT_L3_LR_SSH_Expert_001_{p:03d}_20250304T050607_20250304T060607_v1.0.nc"
+        for p in range(datasets)
+    )
+    return (
+        _HEADER + "".join(_DATASET.format(name=n) for n in names) + _FOOTER
+    ).encode()
+
+
+def parse_siphon(content: bytes):
+    response = mock.Mock(
+        url=CATALOG_URL, headers={"content-type": "application/xml"}, content=content
+    )
+    with mock.patch("siphon.catalog.session_manager.create_session") as session:
+        session.return_value.get.return_value = response
+        return TDSCatalog(CATALOG_URL)
+
+
+def parse_fast(content: bytes):
+    return parse_catalog(content, CATALOG_URL)
+
+
+def measure(parse, content: bytes, repeat: int) -> tuple[float, int]:
+    """Best parsing time in seconds, and peak of allocated memory in bytes."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(content)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    parse(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--datasets", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'datasets':>8} {'parser':>7} {'time (ms)':>10} {'peak (MB)':>10}")
+    for datasets in args.datasets:
+        content = catalog_document(datasets)
+        assert list(parse_fast(content).datasets) == list(
+            parse_siphon(content).datasets
+        )
+        for name, parse in (("siphon", parse_siphon), ("fast", parse_fast)):
+            seconds, peak = measure(parse, content, args.repeat)
+            print(f"{datasets:>8} {name:>7} {seconds * 1e3:>10.1f} {peak / 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
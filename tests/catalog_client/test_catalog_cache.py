@@ -0,0 +1,119 @@
+import sqlite3
+
+import pytest
+
+from altimetry_downloader_aviso import metrics
+from altimetry_downloader_aviso.catalog_client.catalog_cache import (
+    CachedSession,
+    CatalogCache,
+)
+
+URL = "https://tds.mock/thredds/catalog/cycle_001/catalog.xml"
+
+
+def _response(mocker, status_code=200, content=b"<catalog/>", headers=None):
+    response = mocker.Mock()
+    response.status_code = status_code
+    response.url = URL
+    response.content = content
+    response.headers = {"Content-Type": "application/xml", **(headers or {})}
+    return response
+
+
+@pytest.fixture
+def cache(tmp_path):
+    with CatalogCache(tmp_path / "catalogs.sqlite", ttls=(0, 3600)) as cache:
+        yield cache
+
+
+@pytest.mark.parametrize("ttls", [(), (0, -1)])
+def test_catalog_cache_invalid(tmp_path, ttls):
+    with pytest.raises(ValueError, match="expected non-negative durations"):
+        CatalogCache(tmp_path / "catalogs.sqlite", ttls)
+
+
+def test_catalog_cache_ttl(cache):
+    assert cache.ttl(0) == 0
+    assert cache.ttl(1) == 3600
+    assert cache.ttl(5) == 3600
+
+
+def test_catalog_cache_fresh(mocker, cache):
+    session = mocker.Mock()
+    session.get.return_value = _response(mocker)
+
+    with metrics.collect() as cache_metrics:
+        assert cache.get(session, URL, level=1) is session.get.return_value
+        response = cache.get(session, URL, level=1)
+
+    session.get.assert_called_once_with(URL, headers={})
+    assert response.content == b"<catalog/>"
+    assert response.url == URL
+    assert response.headers["content-type"] == "application/xml"
+    response.raise_for_status()
+    assert cache_metrics.counters[metrics.CACHED_CATALOGS] == 1
+
+
+def test_catalog_cache_revalidate(mocker, cache):
+    session = mocker.Mock()
+    session.get.return_value = _response(
+        mocker,
+        headers={"ETag": '"abc"', "Last-Modified": "Tue, 04 Mar 2025 05:06:07 GMT"},
+    )
+    cache.get(session, URL)
+
+    session.get.return_value = _response(mocker, status_code=304, content=b"")
+    with metrics.collect() as cache_metrics:
+        response = cache.get(session, URL)
+
+    session.get.assert_called_with(
+        URL,
+        headers={
+            "If-None-Match": '"abc"',
+            "If-Modified-Since": "Tue, 04 Mar 2025 05:06:07 GMT",
+        },
+    )
+    assert response.content == b"<catalog/>"
+    assert cache_metrics.counters[metrics.CACHED_CATALOGS] == 1
+
+    # Changed catalog, without validators
+    session.get.return_value = _response(mocker, content=b"<catalog new/>")
+    assert cache.get(session, URL).content == b"<catalog new/>"
+    session.get.return_value = _response(mocker, status_code=304, content=b"")
+    assert cache.get(session, URL).content == b"<catalog new/>"
+    assert session.get.call_args.kwargs["headers"] == {}
+
+
+def test_catalog_cache_error(mocker, cache):
+    session = mocker.Mock()
+    session.get.return_value = _response(mocker, status_code=500)
+
+    assert cache.get(session, URL) is session.get.return_value
+    with sqlite3.connect(cache.path) as connection:
+        assert connection.execute("SELECT COUNT(*) FROM catalogs").fetchone() == (0,)
+
+
+def test_catalog_cache_persistent(mocker, tmp_path):
+    session = mocker.Mock()
+    session.get.return_value = _response(mocker)
+    with CatalogCache(tmp_path / "catalogs.sqlite", ttls=(3600,)) as cache:
+        cache.get(session, URL)
+    with CatalogCache(tmp_path / "catalogs.sqlite", ttls=(3600,)) as cache:
+        assert cache.get(session, URL).content == b"<catalog/>"
+
+    session.get.assert_called_once()
+
+
+def test_cached_session(mocker, cache):
+    session = mocker.Mock()
+    session.get.return_value = _response(mocker)
+    cached_session = CachedSession(session, cache, level=1)
+
+    cached_session.get(URL, timeout=10, headers={"Accept": "application/xml"})
+    cached_session.get(URL)
+    session.get.assert_called_once_with(
+        URL, headers={"Accept": "application/xml"}, timeout=10
+    )
+
+    cached_session.close()
+    session.close.assert_called_once()
@@ -0,0 +1,195 @@
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pytest
+import requests
+
+from altimetry_downloader_aviso.catalog_client.catalog_cache import CatalogCache
+from altimetry_downloader_aviso.catalog_client.catalog_parser import (
+    Catalog,
+    CatalogDataset,
+    CatalogReference,
+    dataset_stats,
+    fetch_catalog,
+    parse_catalog,
+)
+from altimetry_downloader_aviso.catalog_client.granule_discoverer import TDSCatalog
+
+URL = "https://tds.mock/thredds/catalog/product/catalog.xml"
+
+CATALOG_XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<catalog xmlns="http://www.unidata.ucar.edu/namespaces/thredds/InvCatalog/v1.0"
+         xmlns:xlink="http://www.w3.org/1999/xlink" name="product">
+  <service name="all" serviceType="Compound" base="">
+    <service name="http" serviceType="HTTPServer" base="/thredds/fileServer/"/>
+    <service name="ncss" serviceType="NetcdfSubset" base="/thredds/ncss/grid/"/>
+  </service>
+  <service name="latest" serviceType="Resolver" base=""/>
+  <dataset name="product" ID="product">
+    <metadata inherited="true">
+      <serviceName>all</serviceName>
+    </metadata>
+    <dataset name="a.nc" ID="product/a.nc" urlPath="product/a.nc">
+      <dataSize units="Mbytes">12.35</dataSize>
+      <date type="modified">2025-03-04T05:06:07Z</date>
+    </dataset>
+    <dataset name="b.nc" ID="product/b.nc" urlPath="product/b.nc">
+      <dataSize units="bytes">512</dataSize>
+      <date type="created">2025-03-04T05:06:07Z</date>
+    </dataset>
+    <dataset name="c.nc" ID="product/c.nc" urlPath="product/c.nc">
+      <dataSize units="furlongs">1</dataSize>
+    </dataset>
+    <catalogRef xlink:href="cycle_001/catalog.xml" xlink:title="cycle_001"
+                name=""/>
+    <catalogRef xlink:href="/thredds/catalog/other/catalog.xml"
+                xlink:title="other" name=""/>
+  </dataset>
+</catalog>
+"""
+
+
+def test_parse_catalog():
+    catalog = parse_catalog(CATALOG_XML, URL)
+
+    assert catalog == Catalog(
+        URL,
+        datasets={
+            "a.nc": CatalogDataset(
+                "a.nc",
+                "product/a.nc",
+                {
+                    "HTTPServer": "https://tds.mock/thredds/fileServer/product/a.nc",
+                    "NetcdfSubset": "https://tds.mock/thredds/ncss/grid/product/a.nc",
+                },
+                12_350_000,
+                np.datetime64("2025-03-04T05:06:07"),
+            ),
+            "b.nc": CatalogDataset(
+                "b.nc",
+                "product/b.nc",
+                {
+                    "HTTPServer": "https://tds.mock/thredds/fileServer/product/b.nc",
+                    "NetcdfSubset": "https://tds.mock/thredds/ncss/grid/product/b.nc",
+                },
+                512,
+            ),
+            "c.nc": CatalogDataset(
+                "c.nc",
+                "product/c.nc",
+                {
+                    "HTTPServer": "https://tds.mock/thredds/fileServer/product/c.nc",
+                    "NetcdfSubset": "https://tds.mock/thredds/ncss/grid/product/c.nc",
+                },
+            ),
+        },
+        catalog_refs={
+            "cycle_001": CatalogReference(
+                "cycle_001",
+                "https://tds.mock/thredds/catalog/product/cycle_001/catalog.xml",
+            ),
+            "other": CatalogReference(
+                "other", "https://tds.mock/thredds/catalog/other/catalog.xml"
+            ),
+        },
+    )
+
+
+@pytest.mark.parametrize(
+    "children, expected",
+    [
+        (
+            '<dataSize units="Kbytes">1.5</dataSize>'
+            '<date type="modified">2025-03-04T05:06:07Z</date>',
+            (1500, np.datetime64("2025-03-04T05:06:07")),
+        ),
+        (
+            '<date type="modified">2025-03-04T07:06:07+02:00</date>',
+            (None, np.datetime64("2025-03-04T05:06:07")),
+        ),
+        ('<dataSize units="bytes"/><date type="modified"/>', (None, None)),
+        ("<dataSize>abc</dataSize><date type='modified'>n/a</date>", (None, None)),
+        ("<dataSize>inf</dataSize><date type='modified'>NaT</date>", (None, None)),
+    ],
+)
+def test_dataset_stats(children, expected):
+    element = ET.fromstring(f"<dataset>{children}</dataset>")
+    assert dataset_stats(element) == expected
+
+
+def test_parse_catalog_as_siphon(mocker):
+    session = mocker.patch("siphon.catalog.session_manager.create_session")
+    response = session.return_value.get.return_value
+    response.url = URL
+    response.headers = {"content-type": "application/xml"}
+    response.content = CATALOG_XML
+
+    expected = TDSCatalog(URL)
+    catalog = parse_catalog(CATALOG_XML, URL)
+
+    assert list(catalog.datasets) == list(expected.datasets)
+    for name, dataset in catalog.datasets.items():
+        assert expected.datasets[name].access_urls == dataset.access_urls
+        assert dataset.data_size == expected.datasets[name].data_size
+        assert dataset.modified == expected.datasets[name].modified
+    assert {t: r.href for t, r in catalog.catalog_refs.items()} == {
+        t: r.href for t, r in expected.catalog_refs.items()
+    }
+
+
+def test_parse_catalog_simple_service():
+    content = b"""<catalog>
+      <service name="http" serviceType="HTTPServer" base="/fileServer/"/>
+      <serviceName>http</serviceName>
+      <dataset name="a.nc" urlPath="a.nc"/>
+    </catalog>"""
+
+    catalog = parse_catalog(content, "http://tds.mock:8080/catalog/catalog.xml")
+
+    assert catalog.datasets["a.nc"].access_urls == {
+        "HTTPServer": "http://tds.mock:8080/fileServer/a.nc"
+    }
+
+
+def test_parse_catalog_no_service():
+    content = b'<catalog><dataset name="a.nc" urlPath="a.nc"/></catalog>'
+
+    catalog = parse_catalog(content, URL)
+
+    assert catalog.datasets["a.nc"].access_urls == {}
+    assert catalog.catalog_refs == {}
+
+
+def test_fetch_catalog(mock_session_get):
+    response = mock_session_get.return_value
+    response.url = URL
+    response.content = CATALOG_XML
+
+    catalog = fetch_catalog(URL)
+
+    mock_session_get.assert_called_once_with(URL)
+    assert catalog.catalog_url == URL
+    assert list(catalog.datasets) == ["a.nc", "b.nc", "c.nc"]
+    assert list(catalog.catalog_refs) == ["cycle_001", "other"]
+
+
+def test_fetch_catalog_cache(mock_session_get, tmp_path):
+    response = mock_session_get.return_value
+    response.url = URL
+    response.content = CATALOG_XML
+
+    with CatalogCache(tmp_path / "catalogs.sqlite", ttls=(0, 3600)) as cache:
+        for _ in range(2):
+            catalog = fetch_catalog(URL, cache, level=1)
+            assert list(catalog.datasets) == ["a.nc", "b.nc", "c.nc"]
+
+    mock_session_get.assert_called_once()
+
+
+def test_fetch_catalog_error(mock_session_get):
+    mock_session_get.return_value.raise_for_status.side_effect = requests.HTTPError(
+        "404 Client Error"
+    )
+
+    with pytest.raises(requests.HTTPError, match="404"):
+        fetch_catalog(URL)
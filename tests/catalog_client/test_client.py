@@ -4,6 +4,7 @@ from datetime import datetime
 import pytest
 import requests
 
+from altimetry_downloader_aviso import metrics
 from altimetry_downloader_aviso.catalog_client.client import (
     InvalidProductError,
     _get_product_from_short_name,
@@ -12,10 +13,12 @@ from altimetry_downloader_aviso.catalog_client.client import (
     fetch_catalog,
     get_details,
     search_granules,
+    search_granules_stream,
 )
 from altimetry_downloader_aviso.catalog_client.geonetwork.models.model import (
     AvisoCatalog,
 )
+from altimetry_downloader_aviso.catalog_client.granule_index import GranuleIndex
 
 
 def test_request_catalog(mock_post):
@@ -92,7 +95,10 @@ def test_get_details():
     with pytest.raises(InvalidProductError):
         get_details(product_short_name="bad_short_name")
 
-    product = get_details(product_short_name="sample_product_a")
+    with metrics.collect() as catalog_metrics:
+        product = get_details(product_short_name="sample_product_a")
+    # Products list, then product details
+    assert catalog_metrics.counters[metrics.CATALOG_REQUESTS] == 2
     assert product.title == "Sample Product A"
     assert product.short_name == "sample_product_a"
     assert product.id == "productA"
@@ -176,11 +182,67 @@ def test_search_granules(short_name, filters, exp_granules):
     assert list(granules) == exp_granules
 
 
+def test_search_granules_detail():
+    granules = search_granules("sample_product_b", detail=True)
+    assert list(granules.filename) == [
+        "https://tds.mock/productB_path/cycle_04/dataset_04.nc",
+        "https://tds.mock/productB_path/cycle_04/dataset_44.nc",
+    ]
+    assert list(granules["size"]) == [4000, 44000]
+
+
+def test_search_granules_index(mock_post, tmp_path):
+    with GranuleIndex(tmp_path / "granules.sqlite") as index:
+        urls = search_granules("sample_product_a", granule_index=index, pass_number=3)
+        assert list(urls) == ["https://tds.mock/productA_path/cycle_03/dataset_03.nc"]
+        assert mock_post.call_count == 1
+
+        granules = search_granules(
+            "sample_product_a", detail=True, granule_index=index, pass_number=[2, 22]
+        )
+        assert list(granules["size"]) == [2000, 22000]
+        # The product is not looked up again in the catalog
+        assert mock_post.call_count == 1
+
+
 def test_search_granules_error():
     with pytest.raises(InvalidProductError):
         search_granules(product_short_name="Bad Product")
 
 
+@pytest.mark.parametrize(
+    "filters, exp_granules",
+    [
+        (
+            {},
+            [
+                "https://tds.mock/productA_path/cycle_02/dataset_02.nc",
+                "https://tds.mock/productA_path/cycle_02/dataset_22.nc",
+                "https://tds.mock/productA_path/cycle_03/dataset_03.nc",
+                "https://tds.mock/productA_path/cycle_03/dataset_33.nc",
+            ],
+        ),
+        (
+            {"pass_number": 3},
+            ["https://tds.mock/productA_path/cycle_03/dataset_03.nc"],
+        ),
+    ],
+)
+def test_search_granules_stream(filters, exp_granules):
+    batches = list(search_granules_stream("sample_product_a", **filters))
+
+    assert sorted(url for b in batches for url in b.filename) == exp_granules
+    assert all(
+        list(b.columns[-4:]) == ["filename", "size", "modified", "ncss"]
+        for b in batches
+    )
+
+
+def test_search_granules_stream_error():
+    with pytest.raises(InvalidProductError):
+        search_granules_stream(product_short_name="Bad Product")
+
+
 @pytest.mark.parametrize(
     "short_name, filters",
     [
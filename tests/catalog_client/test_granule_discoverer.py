@@ -1,17 +1,109 @@
+import threading
+import time
+
+import numpy as np
 import pytest
 from requests.exceptions import ProxyError
 
+from altimetry_downloader_aviso import metrics
+from altimetry_downloader_aviso.catalog_client import granule_discoverer
+from altimetry_downloader_aviso.catalog_client.catalog_cache import CatalogCache
 from altimetry_downloader_aviso.catalog_client.geonetwork.models.model import (
     AvisoProduct,
 )
 from altimetry_downloader_aviso.catalog_client.granule_discoverer import (
     ProductLayoutConfig,
+    TDSCatalog,
     TDSIterable,
     _load_convention_layout,
     _parse_tds_layout,
     filter_granules,
+    stream_granules,
 )
 
+CATALOG_XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<catalog xmlns="http://www.unidata.ucar.edu/namespaces/thredds/InvCatalog/v1.0"
+         name="cycle_001">
+  <service name="all" serviceType="Compound" base="">
+    <service name="http" serviceType="HTTPServer" base="/thredds/fileServer/"/>
+    <service name="ncss" serviceType="NetcdfSubset" base="/thredds/ncss/grid/"/>
+  </service>
+  <dataset name="cycle_001" ID="cycle_001">
+    <metadata inherited="true">
+      <serviceName>all</serviceName>
+    </metadata>
+    <dataset name="a.nc" ID="cycle_001/a.nc" urlPath="cycle_001/a.nc">
+      <dataSize units="Mbytes">12.35</dataSize>
+      <date type="modified">2025-03-04T05:06:07Z</date>
+    </dataset>
+    <dataset name="b.nc" ID="cycle_001/b.nc" urlPath="cycle_001/b.nc">
+      <dataSize units="bytes">512</dataSize>
+      <date type="created">2025-03-04T05:06:07Z</date>
+    </dataset>
+    <dataset name="c.nc" ID="cycle_001/c.nc" urlPath="cycle_001/c.nc">
+      <dataSize units="furlongs">1</dataSize>
+    </dataset>
+  </dataset>
+</catalog>
+"""
+
+ROOT_CATALOG_XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<catalog xmlns="http://www.unidata.ucar.edu/namespaces/thredds/InvCatalog/v1.0"
+         xmlns:xlink="http://www.w3.org/1999/xlink" name="root">
+  <service name="all" serviceType="Compound" base="">
+    <service name="http" serviceType="HTTPServer" base="/thredds/fileServer/"/>
+    <service name="ncss" serviceType="NetcdfSubset" base="/thredds/ncss/grid/"/>
+  </service>
+  <dataset name="root" ID="root">
+    <metadata inherited="true">
+      <serviceName>all</serviceName>
+    </metadata>
+    <dataset name="root.nc" ID="root.nc" urlPath="root.nc"/>
+    <catalogRef xlink:href="cycle_001/catalog.xml" xlink:title="cycle_001"
+                name=""/>
+  </dataset>
+</catalog>
+"""
+
+
+def test_tds_catalog(mocker):
+    session = mocker.patch("siphon.catalog.session_manager.create_session")
+    response = session.return_value.get.return_value
+    response.url = "https://tds.mock/thredds/catalog/cycle_001/catalog.xml"
+    response.headers = {"content-type": "application/xml"}
+    response.content = CATALOG_XML
+
+    catalog = TDSCatalog(response.url)
+
+    assert [(d.name, d.data_size, d.modified) for d in catalog.datasets.values()] == [
+        ("a.nc", 12_350_000, np.datetime64("2025-03-04T05:06:07")),
+        ("b.nc", 512, None),
+        ("c.nc", None, None),
+    ]
+    assert catalog.datasets["a.nc"].access_urls["HTTPServer"] == (
+        "https://tds.mock/thredds/fileServer/cycle_001/a.nc"
+    )
+    assert catalog.datasets["a.nc"].access_urls["NetcdfSubset"] == (
+        "https://tds.mock/thredds/ncss/grid/cycle_001/a.nc"
+    )
+
+
+def test_tds_catalog_cache(mocker, tmp_path):
+    session = mocker.patch("siphon.catalog.session_manager.create_session")
+    response = session.return_value.get.return_value
+    response.status_code = 200
+    response.url = "https://tds.mock/thredds/catalog/cycle_001/catalog.xml"
+    response.headers = {"content-type": "application/xml"}
+    response.content = CATALOG_XML
+
+    with CatalogCache(tmp_path / "catalogs.sqlite", ttls=(0, 3600)) as cache:
+        for _ in range(2):
+            catalog = TDSCatalog(response.url, cache, level=1)
+            assert list(catalog.datasets) == ["a.nc", "b.nc", "c.nc"]
+            assert catalog.datasets["a.nc"].data_size == 12_350_000
+
+    session.return_value.get.assert_called_once()
+
 
 class Test_TDSIterable:
 
@@ -85,8 +177,27 @@ class Test_TDSIterable:
 
         assert urls == exp_urls
 
+    def test_find_detail(self, tds_iterable):
+        granules = tds_iterable.find(
+            "https://tds.mock/catalog.xml", detail=True, path_filter="B"
+        )
+
+        assert granules == [
+            {
+                "name": f"https://tds.mock{path}/dataset_{nb:0>2d}.nc",
+                "size": 1000 * nb,
+                "modified": np.datetime64("2025-01-01T00:00:00") + nb,
+                "ncss": f"https://tds.mock/ncss{path}/dataset_{nb:0>2d}.nc",
+            }
+            for path, nb in [
+                ("", 1),
+                ("/productB_path/cycle_04", 4),
+                ("/productB_path/cycle_04", 44),
+            ]
+        ]
+
     def test_find_not_layout(self):
-        urls = TDSIterable().find("https://tds.mock/catalog.xml", {"filter1": 12})
+        urls = TDSIterable().find("https://tds.mock/catalog.xml", filter1=12)
 
         assert urls == [
             "https://tds.mock/dataset_01.nc",
@@ -126,6 +237,138 @@ class Test_TDSIterable:
             urls = tds_iterable.find("https://tds.mock/catalog.xml", **filter)
             assert urls == exp_urls
 
+    def test_find_concurrent(self, mocker, test_layout):
+        tds_catalog = granule_discoverer.TDSCatalog
+        fetch = tds_catalog.side_effect
+        lock = threading.Lock()
+        in_flight = [0, 0]
+
+        def slow_fetch(url):
+            with lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight)
+            # The first sub-catalogs are received last
+            time.sleep(0.05 if "productA" in url else 0.01)
+            with lock:
+                in_flight[0] -= 1
+            return fetch(url)
+
+        tds_catalog.side_effect = slow_fetch
+        urls = TDSIterable(test_layout, max_workers=2).find(
+            "https://tds.mock/catalog.xml"
+        )
+
+        assert urls == [
+            "https://tds.mock/dataset_01.nc",
+            "https://tds.mock/productA_path/cycle_02/dataset_02.nc",
+            "https://tds.mock/productA_path/cycle_02/dataset_22.nc",
+            "https://tds.mock/productA_path/cycle_03/dataset_03.nc",
+            "https://tds.mock/productA_path/cycle_03/dataset_33.nc",
+            "https://tds.mock/productB_path/cycle_04/dataset_04.nc",
+            "https://tds.mock/productB_path/cycle_04/dataset_44.nc",
+        ]
+        assert in_flight[1] == 2
+
+    def test_iter_find(self, tds_iterable):
+        batches = list(
+            tds_iterable.iter_find("https://tds.mock/catalog.xml", path_filter="A")
+        )
+
+        assert len(batches) == 4
+        assert sorted(g["name"] for b in batches for g in b) == [
+            "https://tds.mock/dataset_01.nc",
+            "https://tds.mock/productA_path/cycle_02/dataset_02.nc",
+            "https://tds.mock/productA_path/cycle_02/dataset_22.nc",
+            "https://tds.mock/productA_path/cycle_03/dataset_03.nc",
+            "https://tds.mock/productA_path/cycle_03/dataset_33.nc",
+        ]
+
+    def test_iter_find_early_stop(self, test_layout):
+        tds_catalog = granule_discoverer.TDSCatalog
+        batches = TDSIterable(test_layout, max_workers=1).iter_find(
+            "https://tds.mock/catalog.xml"
+        )
+        assert [g["name"] for g in next(batches)] == ["https://tds.mock/dataset_01.nc"]
+        batches.close()
+
+        # The sub-catalogs queued behind the running one are not fetched
+        assert tds_catalog.call_count < 6
+
+    def test_find_cache(self, test_layout, tmp_path):
+        tds_catalog = granule_discoverer.TDSCatalog
+        with CatalogCache(tmp_path / "catalogs.sqlite") as cache:
+            TDSIterable(test_layout, cache=cache).find(
+                "https://tds.mock/catalog.xml", path_filter="B"
+            )
+
+        assert sorted(c.args for c in tds_catalog.call_args_list) == [
+            ("https://tds.mock/catalog.xml", cache, 0),
+            ("https://tds.mock/productB_path/catalog.xml", cache, 1),
+            ("https://tds.mock/productB_path/cycle_04/catalog.xml", cache, 2),
+        ]
+
+    @pytest.mark.parametrize("parser", ["siphon", "fast"])
+    def test_find_parser(self, mocker, mock_session_get, parser):
+        mocker.patch.object(granule_discoverer, "TDSCatalog", TDSCatalog)
+        documents = {
+            "https://tds.mock/thredds/catalog/catalog.xml": ROOT_CATALOG_XML,
+            "https://tds.mock/thredds/catalog/cycle_001/catalog.xml": CATALOG_XML,
+        }
+
+        def get(url, **kwargs):
+            response = mocker.Mock()
+            response.url = url
+            response.headers = {"content-type": "application/xml"}
+            response.content = documents[url]
+            return response
+
+        mock_session_get.side_effect = get
+
+        granules = TDSIterable(parser=parser).find(
+            "https://tds.mock/thredds/catalog/catalog.xml", detail=True
+        )
+
+        assert granules == [
+            {
+                "name": f"https://tds.mock/thredds/fileServer/{path}",
+                "size": size,
+                "modified": modified,
+                "ncss": f"https://tds.mock/thredds/ncss/grid/{path}",
+            }
+            for path, size, modified in [
+                ("root.nc", None, None),
+                (
+                    "cycle_001/a.nc",
+                    12_350_000,
+                    np.datetime64("2025-03-04T05:06:07"),
+                ),
+                ("cycle_001/b.nc", 512, None),
+                ("cycle_001/c.nc", None, None),
+            ]
+        ]
+
+    def test_invalid_parser(self):
+        with pytest.raises(ValueError, match="Invalid catalog parser 'lxml'"):
+            TDSIterable(parser="lxml")
+
+    def test_find_concurrent_error(self, test_layout):
+        tds_catalog = granule_discoverer.TDSCatalog
+        fetch = tds_catalog.side_effect
+
+        def failing_fetch(url):
+            if "productB" in url:
+                raise ProxyError("Unable to connect to proxy")
+            if "cycle" in url:
+                time.sleep(0.05)
+            return fetch(url)
+
+        tds_catalog.side_effect = failing_fetch
+        with pytest.raises(ProxyError):
+            TDSIterable(test_layout, max_workers=1).find("https://tds.mock/catalog.xml")
+
+        # The queued catalogs are not fetched
+        assert tds_catalog.call_count < 5
+
     def test_find_bad_url(self, tds_iterable):
         with pytest.raises(ProxyError) as exc_info:
             tds_iterable.find("https://bad_url/catalog.xml")
@@ -139,7 +382,13 @@ class Test_TDSIterable:
 
 
 def test_filter_granules():
-    urls = filter_granules(AvisoProduct(id="productA"))
+    with metrics.collect() as discovery_metrics:
+        urls = filter_granules(AvisoProduct(id="productA"))
+
+    assert discovery_metrics.counters[metrics.CATALOGS] == 3
+    assert discovery_metrics.histograms[metrics.CATALOG].count == 3
+    assert discovery_metrics.histograms[metrics.DISCOVERY].count == 1
+    assert discovery_metrics.counters[metrics.GRANULES] == 4
     assert list(urls) == [
         "https://tds.mock/productA_path/cycle_02/dataset_02.nc",
         "https://tds.mock/productA_path/cycle_02/dataset_22.nc",
@@ -150,6 +399,55 @@ def test_filter_granules():
     assert list(urls) == ["https://tds.mock/productA_path/cycle_03/dataset_03.nc"]
 
 
+def test_filter_granules_fast_parser(mocker, monkeypatch):
+    monkeypatch.setenv("AVISO_CATALOG_PARSER", "fast")
+    tds_catalog = granule_discoverer.TDSCatalog
+    fetch = mocker.patch.object(
+        granule_discoverer, "fetch_catalog", side_effect=tds_catalog.side_effect
+    )
+
+    urls = filter_granules(AvisoProduct(id="productA"), pass_number=3)
+    assert list(urls) == ["https://tds.mock/productA_path/cycle_03/dataset_03.nc"]
+    granules = list(stream_granules(AvisoProduct(id="productA"), pass_number=3))
+    assert [list(g.filename) for g in granules if len(g)] == [
+        ["https://tds.mock/productA_path/cycle_03/dataset_03.nc"]
+    ]
+
+    assert fetch.call_count == 6
+    tds_catalog.assert_not_called()
+
+
+def test_stream_granules():
+    with metrics.collect() as discovery_metrics:
+        batches = list(stream_granules(AvisoProduct(id="productA"), cycle_number=3))
+
+    # The product and cycle catalogs
+    assert discovery_metrics.counters[metrics.CATALOGS] == 2
+    assert discovery_metrics.histograms[metrics.DISCOVERY].count == 1
+    assert discovery_metrics.counters[metrics.GRANULES] == 2
+    assert [list(b.filename) for b in batches if not b.empty] == [
+        [
+            "https://tds.mock/productA_path/cycle_03/dataset_03.nc",
+            "https://tds.mock/productA_path/cycle_03/dataset_33.nc",
+        ]
+    ]
+    assert list(batches[-1]["size"]) == [3000, 33000]
+
+
+def test_filter_granules_detail():
+    granules = filter_granules(AvisoProduct(id="productA"), detail=True, cycle_number=3)
+
+    assert list(granules.filename) == [
+        "https://tds.mock/productA_path/cycle_03/dataset_03.nc",
+        "https://tds.mock/productA_path/cycle_03/dataset_33.nc",
+    ]
+    assert list(granules["size"]) == [3000, 33000]
+    assert list(granules.modified) == [
+        np.datetime64("2025-01-01T00:00:03"),
+        np.datetime64("2025-01-01T00:00:33"),
+    ]
+
+
 def test_load_convention_layout(patch_some, test_layout, test_filename_convention):
     conf = {"TEST_TYPE": ["FileNameConventionSwotL3", "AVISO_L3_LR_SSH_LAYOUT"]}
     with pytest.raises(
@@ -0,0 +1,276 @@
+import numpy as np
+import pandas as pd
+import pytest
+from fcollections.implementations import (
+    FileNameConventionGriddedSLA,
+    FileNameConventionSwotL2,
+    FileNameConventionSwotL3,
+)
+from fcollections.time import Period
+
+from altimetry_downloader_aviso.catalog_client import granule_discoverer
+from altimetry_downloader_aviso.catalog_client.geonetwork.models.model import (
+    AvisoProduct,
+)
+from altimetry_downloader_aviso.catalog_client.granule_discoverer import (
+    filter_granules,
+)
+from altimetry_downloader_aviso.catalog_client.granule_index import (
+    GranuleIndex,
+    InvalidIndexFilterError,
+    _decode,
+    _encode,
+    _mask,
+)
+
+PRODUCT = AvisoProduct(id="productA", short_name="sample_product_a")
+
+
+@pytest.fixture
+def index(tmp_path):
+    with GranuleIndex(tmp_path / "granules.sqlite") as index:
+        yield index
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        {},
+        {"pass_number": 3},
+        {"pass_number": [2, 22, 33]},
+        {"pass_number": slice(3, 30)},
+        {"pass_number": 5},
+    ],
+)
+def test_granule_index_query(index, filters):
+    assert index.refresh(PRODUCT) == 4
+
+    expected = filter_granules(PRODUCT, detail=True, **filters)
+    granules = index.query("sample_product_a", detail=True, **filters)
+
+    pd.testing.assert_frame_equal(
+        granules.reset_index(drop=True),
+        expected.reset_index(drop=True),
+        check_dtype=False,
+    )
+    assert list(index.query("sample_product_a", **filters)) == list(expected.filename)
+
+
+def test_granule_index_offline(index):
+    index.refresh(PRODUCT)
+    tds_catalog = granule_discoverer.TDSCatalog
+    tds_catalog.reset_mock()
+
+    for pass_number in (2, 3, 22):
+        assert len(index.query("sample_product_a", pass_number=pass_number)) == 1
+
+    tds_catalog.assert_not_called()
+
+
+def test_granule_index_persistent(tmp_path):
+    with GranuleIndex(tmp_path / "granules.sqlite") as index:
+        index.refresh(PRODUCT)
+        refreshed = index.refreshed("sample_product_a")
+
+    with GranuleIndex(tmp_path / "granules.sqlite") as index:
+        assert index.refreshed("sample_product_a") == refreshed
+        assert list(index.query("sample_product_a", pass_number=22)) == [
+            "https://tds.mock/productA_path/cycle_02/dataset_22.nc"
+        ]
+
+
+def test_granule_index_refresh(index, mocker):
+    index.refresh(PRODUCT)
+    assert len(index.query("sample_product_a")) == 4
+
+    mocker.patch(
+        "altimetry_downloader_aviso.catalog_client.granule_index.time.time",
+        return_value=index.refreshed("sample_product_a") + 10,
+    )
+    granules = filter_granules(PRODUCT, detail=True)
+    mocker.patch(
+        "altimetry_downloader_aviso.catalog_client.granule_index.filter_granules",
+        return_value=granules.iloc[:1],
+    )
+    assert index.refresh(PRODUCT) == 1
+    assert list(index.query("sample_product_a")) == [granules.filename.iloc[0]]
+
+
+def test_granule_index_outdated(tmp_path, mocker):
+    with GranuleIndex(tmp_path / "granules.sqlite", max_age=60) as index:
+        assert index.refreshed("sample_product_a") is None
+        assert index.is_outdated("sample_product_a")
+
+        index.refresh(PRODUCT)
+        refreshed = index.refreshed("sample_product_a")
+        assert not index.is_outdated("sample_product_a")
+
+        mocker.patch(
+            "altimetry_downloader_aviso.catalog_client.granule_index.time.time",
+            return_value=refreshed + 61,
+        )
+        assert index.is_outdated("sample_product_a")
+
+
+def test_granule_index_empty(index, mocker):
+    granules = filter_granules(PRODUCT, detail=True)
+    mocker.patch(
+        "altimetry_downloader_aviso.catalog_client.granule_index.filter_granules",
+        return_value=granules.iloc[:0],
+    )
+    assert index.refresh(PRODUCT) == 0
+    assert index.query("sample_product_a", detail=True, pass_number=3).empty
+
+
+def test_granule_index_not_indexed(index):
+    with pytest.raises(KeyError, match="sample_product_a is not indexed"):
+        index.query("sample_product_a")
+
+
+def test_granule_index_invalid_filter(index):
+    index.refresh(PRODUCT)
+    with pytest.raises(
+        InvalidIndexFilterError, match=r"Invalid filters \['cycle_number'\]"
+    ):
+        index.query("sample_product_a", cycle_number=3)
+
+
+def test_granule_index_default_filters(index, mocker):
+    mocker.patch(
+        "altimetry_downloader_aviso.catalog_client.granule_index.default_filters",
+        return_value={"path_filter": "A", "pass_number": 22},
+    )
+    index.refresh(PRODUCT)
+
+    # The default value of a field is searched in the index
+    assert list(index.query("sample_product_a", pass_number=22)) == [
+        "https://tds.mock/productA_path/cycle_02/dataset_22.nc"
+    ]
+
+    # Other values are not indexed
+    with pytest.raises(InvalidIndexFilterError, match="default filters"):
+        index.query("sample_product_a", pass_number=3)
+
+
+SWOT_L3_NAMES = [
+    f"SWOT_L3_LR_SSH_{subset}_{cycle:03d}_{pass_:03d}_{start}_{stop}_v{version}.nc"
+    for subset, cycle, pass_, start, stop, version in [
+        ("Expert", 1, 2, "20240101T000000", "20240101T010000", "1.0"),
+        ("Basic", 1, 3, "20240101T010000", "20240101T020000", "1.0"),
+        ("Expert", 2, 2, "20240122T000000", "20240122T010000", "2.0.1"),
+        ("Unsmoothed", 2, 17, "20240122T120000", "20240122T130000", "2.0.1"),
+    ]
+]
+
+SWOT_L2_NAMES = [
+    "SWOT_L2_LR_SSH_Expert_001_002_20240101T000000_20240101T010000_PIC0_01.nc",
+    "SWOT_L2_LR_SSH_Expert_001_003_20240101T010000_20240101T020000_PGC0_01.nc",
+    "SWOT_L2_LR_SSH_Basic_001_004_20240101T020000_20240101T030000_PIC0_02.nc",
+]
+
+GRIDDED_NAMES = [
+    "nrt_global_allsat_phy_l4_20240101_20240107.nc",
+    "dt_global_allsat_phy_l4_20240102_20240301.nc",
+    "nrt_global_allsat_phy_l4_20240103_20240109.nc",
+]
+
+
+@pytest.mark.parametrize(
+    "convention, names, field_name, reference",
+    [
+        (FileNameConventionSwotL3, SWOT_L3_NAMES, "cycle_number", 2),
+        (FileNameConventionSwotL3, SWOT_L3_NAMES, "pass_number", [2, 17]),
+        (FileNameConventionSwotL3, SWOT_L3_NAMES, "pass_number", slice(3, 18)),
+        (FileNameConventionSwotL3, SWOT_L3_NAMES, "time", "2024-01-01T01:00:00"),
+        (
+            FileNameConventionSwotL3,
+            SWOT_L3_NAMES,
+            "time",
+            ("2024-01-01T01:30:00", None),
+        ),
+        (
+            FileNameConventionSwotL3,
+            SWOT_L3_NAMES,
+            "time",
+            (None, "2024-01-01T01:00:00"),
+        ),
+        (
+            FileNameConventionSwotL3,
+            SWOT_L3_NAMES,
+            "time",
+            Period(
+                np.datetime64("2024-01-01T01:00:00"),
+                np.datetime64("2024-01-22T00:00:00"),
+                include_start=False,
+                include_stop=False,
+            ),
+        ),
+        (FileNameConventionSwotL3, SWOT_L3_NAMES, "subset", "Expert"),
+        (FileNameConventionSwotL3, SWOT_L3_NAMES, "subset", ["Basic", "Unsmoothed"]),
+        (FileNameConventionSwotL3, SWOT_L3_NAMES, "version", "2.0.1"),
+        (FileNameConventionSwotL2, SWOT_L2_NAMES, "version", "PIC0"),
+        (FileNameConventionSwotL2, SWOT_L2_NAMES, "version", "PIC0_02"),
+        (FileNameConventionGriddedSLA, GRIDDED_NAMES, "delay", "NRT"),
+        (FileNameConventionGriddedSLA, GRIDDED_NAMES, "time", "2024-01-02"),
+        (FileNameConventionGriddedSLA, GRIDDED_NAMES, "time", "2024-01-03T12"),
+        (FileNameConventionGriddedSLA, GRIDDED_NAMES, "time", ("2024-01-02", None)),
+        (
+            FileNameConventionGriddedSLA,
+            GRIDDED_NAMES,
+            "time",
+            ("2024-01-01T12", "2024-01-02T12"),
+        ),
+        (
+            FileNameConventionGriddedSLA,
+            GRIDDED_NAMES,
+            "production_date",
+            "2024-01-07",
+        ),
+        (
+            FileNameConventionGriddedSLA,
+            GRIDDED_NAMES,
+            "production_date",
+            ("2024-01-07", "2024-01-09"),
+        ),
+        (
+            FileNameConventionGriddedSLA,
+            GRIDDED_NAMES,
+            "production_date",
+            Period(
+                np.datetime64("2024-01-07"),
+                np.datetime64("2024-01-09"),
+                include_start=False,
+                include_stop=False,
+            ),
+        ),
+    ],
+)
+def test_mask(convention, names, field_name, reference):
+    convention = convention()
+    position = [f.name for f in convention.fields].index(field_name)
+    field = convention.fields[position]
+    values = [convention.parse(convention.match(n))[position] for n in names]
+
+    reference = field.sanitize(reference)
+    mask = _mask(field, reference, _encode(field, pd.Series(values)))
+
+    assert list(mask) == [field.test(reference, v) for v in values]
+
+
+@pytest.mark.parametrize(
+    "convention, names",
+    [
+        (FileNameConventionSwotL2, SWOT_L2_NAMES),
+        (FileNameConventionSwotL3, SWOT_L3_NAMES),
+        (FileNameConventionGriddedSLA, GRIDDED_NAMES),
+    ],
+)
+def test_decode(convention, names):
+    convention = convention()
+    records = [convention.parse(convention.match(n)) for n in names]
+    mask = np.array([True, False, True] + [False] * (len(names) - 3))
+
+    for position, field in enumerate(convention.fields):
+        values = [r[position] for r in records]
+        decoded = _decode(field, _encode(field, pd.Series(values)), mask)
+        assert list(decoded) == [v for v, m in zip(values, mask) if m]
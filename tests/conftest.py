@@ -2,6 +2,7 @@ import json
 import re
 from pathlib import Path
 
+import numpy as np
 import pytest
 from fcollections.core import (
     FileNameConvention,
@@ -84,6 +85,17 @@ def mock_get(mocker, product_response):
     return mock_get
 
 
+@pytest.fixture(autouse=True)
+def mock_session_get(mocker):
+    mock_session_get = mocker.patch("requests.Session.get")
+    mock_response = mocker.Mock()
+    mock_response.status_code = 200
+    mock_response.headers = {}
+    mock_response.iter_content.return_value = [b"fake file contents"]
+    mock_session_get.return_value = mock_response
+    return mock_session_get
+
+
 # PATCH GRANULES DISCOVERING
 
 
@@ -238,6 +250,12 @@ def mock_tds_catalog(mocker):
         mock_dataset.access_urls = {
             "HTTPServer": f"https://tds.mock{path}/dataset_{nb:0>2d}.nc"
         }
+        if nb != 33:
+            mock_dataset.access_urls["NetcdfSubset"] = (
+                f"https://tds.mock/ncss{path}/dataset_{nb:0>2d}.nc"
+            )
+        mock_dataset.data_size = 1000 * nb
+        mock_dataset.modified = np.datetime64("2025-01-01T00:00:00") + nb
         return mock_dataset
 
     mock_catalog_vA_2 = mocker.Mock()
@@ -286,7 +304,7 @@ def mock_tds_catalog(mocker):
     mock_ref_vB = mocker.Mock()
     mock_ref_vB.href = "https://tds.mock/productB_path/catalog.xml"
 
-    def tds_catalog_side_effect(url):
+    def tds_catalog_side_effect(url, *args):
         if url == "https://tds.mock/catalog.xml":
             mock_root = mocker.Mock()
             mock_root.datasets = {f"ds{nb}": _get_dataset("", nb) for nb in [1]}
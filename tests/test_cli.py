@@ -6,6 +6,11 @@ from typer import BadParameter
 from typer.testing import CliRunner
 
 import altimetry_downloader_aviso.core as ac_core
+from altimetry_downloader_aviso import metrics
+from altimetry_downloader_aviso.catalog_client.client import InvalidProductError
+from altimetry_downloader_aviso.catalog_client.granule_index import (
+    InvalidIndexFilterError,
+)
 from altimetry_downloader_aviso.cli import (
     _parse_ranges,
     _setup_logging,
@@ -13,6 +18,10 @@ from altimetry_downloader_aviso.cli import (
     comma_separated_ints,
     logger,
 )
+from altimetry_downloader_aviso.planning import (
+    DownloadEstimate,
+    InsufficientDiskSpaceError,
+)
 
 runner = CliRunner()
 
@@ -197,6 +206,19 @@ def test_get_simple_filters(mocker, tmp_path):
         pass_number=None,
         time=(None, None),
         overwrite=False,
+        max_workers=None,
+        incremental=False,
+        checksum=None,
+        adaptive=False,
+        job_file=None,
+        shard=None,
+        order=None,
+        check_disk_space=True,
+        variables=None,
+        bbox=None,
+        stream=False,
+        catalog_cache=None,
+        granule_index=None,
     )
 
 
@@ -238,6 +260,35 @@ def test_get_with_start_and_end(mocker, tmp_path):
     )
 
 
+def test_get_workers(mocker, tmp_path):
+    mocked_get = mocker.patch.object(ac_core, "get", return_value=["file.nc"])
+    result = runner.invoke(app, ["get", "SWOT", "--output", str(tmp_path), "-j", "8"])
+    assert result.exit_code == 0
+    assert mocked_get.call_args.kwargs["max_workers"] == 8
+
+    result = runner.invoke(
+        app, ["get", "SWOT", "--output", str(tmp_path), "--workers", "0"]
+    )
+    assert result.exit_code != 0
+
+
+@pytest.mark.parametrize(
+    "variable, value, options",
+    [
+        ("AVISO_MAX_WORKERS", "eight", []),
+        ("AVISO_CRAWL_WORKERS", "0", []),
+        ("AVISO_CATALOG_PARSER", "lxml", ["--dry-run"]),
+    ],
+)
+def test_get_bad_configuration(monkeypatch, tmp_path, variable, value, options):
+    monkeypatch.setenv(variable, value)
+    result = runner.invoke(
+        app, ["get", "sample_product_a", "--output", str(tmp_path), *options]
+    )
+    assert result.exit_code == 2
+    assert f"Invalid value: {variable}" in result.output
+
+
 def test_get_bad_options(tmp_path):
     result = runner.invoke(app, ["get", "SWOT"])
     assert result.exit_code != 0
@@ -256,3 +307,353 @@ def test_get_bad_product(tmp_path):
     assert (
         "Invalid value: 'bad_product' doesn't " "exist in Aviso catalog."
     ) in result.output
+
+
+def test_get_incremental(mocker, tmp_path):
+    mocked_get = mocker.patch.object(ac_core, "get", return_value=["file.nc"])
+    result = runner.invoke(app, ["get", "SWOT", "--output", str(tmp_path), "-i"])
+    assert result.exit_code == 0
+    assert mocked_get.call_args.kwargs["incremental"]
+
+
+def test_get_checksum(mocker, tmp_path):
+    mocked_get = mocker.patch.object(ac_core, "get", return_value=["file.nc"])
+    result = runner.invoke(
+        app, ["get", "SWOT", "--output", str(tmp_path), "--checksum", "sha256"]
+    )
+    assert result.exit_code == 0
+    assert mocked_get.call_args.kwargs["checksum"] == "sha256"
+
+    result = runner.invoke(
+        app, ["get", "SWOT", "--output", str(tmp_path), "--checksum", "crc"]
+    )
+    assert result.exit_code != 0
+    assert "Invalid checksum 'crc'" in result.output
+
+
+def test_get_adaptive(mocker, tmp_path):
+    mocked_get = mocker.patch.object(ac_core, "get", return_value=["file.nc"])
+    result = runner.invoke(
+        app, ["get", "SWOT", "--output", str(tmp_path), "-j", "16", "--adaptive"]
+    )
+    assert result.exit_code == 0
+    assert mocked_get.call_args.kwargs["adaptive"]
+    assert mocked_get.call_args.kwargs["max_workers"] == 16
+
+
+def test_get_job_file(mocker, tmp_path):
+    mocked_get = mocker.patch.object(ac_core, "get", return_value=["file.nc"])
+    job_file = tmp_path / "job.sqlite"
+    result = runner.invoke(
+        app, ["get", "SWOT", "--output", str(tmp_path), "--job-file", str(job_file)]
+    )
+    assert result.exit_code == 0
+    assert mocked_get.call_args.kwargs["job_file"] == job_file
+
+
+def test_get_shard(mocker, tmp_path):
+    mocked_get = mocker.patch.object(ac_core, "get", return_value=["file.nc"])
+    result = runner.invoke(
+        app, ["get", "SWOT", "--output", str(tmp_path), "--shard", "1/4"]
+    )
+    assert result.exit_code == 0
+    assert mocked_get.call_args.kwargs["shard"] == (1, 4)
+
+    for value in ["4/4", "1", "a/4"]:
+        result = runner.invoke(
+            app, ["get", "SWOT", "--output", str(tmp_path), "--shard", value]
+        )
+        assert result.exit_code != 0
+        assert "Invalid shard" in result.output
+
+
+def test_get_metrics_summary(mocker, tmp_path):
+    def fake_get(**kwargs):
+        metrics.count(metrics.FILES)
+        metrics.count(metrics.BYTES, 2_500_000)
+        metrics.observe(metrics.TRANSFER, 0.5)
+        return ["file.nc"]
+
+    mocker.patch.object(ac_core, "get", side_effect=fake_get)
+    result = runner.invoke(app, ["get", "SWOT", "--output", str(tmp_path)])
+
+    assert result.exit_code == 0
+    assert "File transfers" in result.output
+    assert "1 files downloaded, 0 skipped, 0 failed, 0 retries. 2.5 MB" in (
+        result.output
+    )
+
+
+def test_get_metrics_file(mocker, tmp_path):
+    mocker.patch.object(ac_core, "get", return_value=["file.nc"])
+    metrics_file = tmp_path / "aviso.prom"
+    result = runner.invoke(
+        app,
+        [
+            "get",
+            "SWOT",
+            "--output",
+            str(tmp_path),
+            "--metrics-file",
+            str(metrics_file),
+        ],
+    )
+
+    assert result.exit_code == 0
+    assert 'aviso_downloader_files_total{product="SWOT"} 0' in (
+        metrics_file.read_text()
+    )
+
+
+def test_get_metrics_file_authentication_error(tmp_path, fake_netrc_path):
+    fake_netrc_path.write_text("machine")
+    metrics_file = tmp_path / "aviso.prom"
+    metrics_file.write_text(
+        'aviso_downloader_last_success_timestamp_seconds{product="sample_product_a"}'
+        " 1735689600\n"
+    )
+    runner.invoke(
+        app,
+        [
+            "get",
+            "sample_product_a",
+            "--output",
+            str(tmp_path / "output"),
+            "--metrics-file",
+            str(metrics_file),
+        ],
+    )
+
+    # The run is not a success, and the time of the previous success is kept
+    text = metrics_file.read_text()
+    assert 'aviso_downloader_errors_total{product="sample_product_a"} 1' in text
+    assert 'aviso_downloader_success{product="sample_product_a"} 0' in text
+    assert (
+        'aviso_downloader_last_success_timestamp_seconds{product="sample_product_a"}'
+        " 1735689600"
+    ) in text
+
+
+def test_get_progress(mocker, tmp_path):
+    def fake_get(**kwargs):
+        metrics.count(metrics.PLANNED, 1)
+        metrics.count(metrics.FILES, 1, "https://tds.mock/file.nc")
+        return ["file.nc"]
+
+    mocker.patch.object(ac_core, "get", side_effect=fake_get)
+    result = runner.invoke(app, ["get", "SWOT", "--output", str(tmp_path)])
+    assert result.exit_code == 0
+    assert "1/1 files" in result.output
+
+    for option in ["--quiet", "--no-progress"]:
+        result = runner.invoke(app, ["get", "SWOT", "--output", str(tmp_path), option])
+        assert result.exit_code == 0
+        assert "1/1 files" not in result.output
+
+
+def test_get_order(mocker, tmp_path):
+    mocked_get = mocker.patch.object(ac_core, "get", return_value=["file.nc"])
+    result = runner.invoke(
+        app, ["get", "SWOT", "--output", str(tmp_path), "--order", "newest"]
+    )
+    assert result.exit_code == 0
+    assert mocked_get.call_args.kwargs["order"] == "newest"
+
+    result = runner.invoke(
+        app, ["get", "SWOT", "--output", str(tmp_path), "--order", "random"]
+    )
+    assert result.exit_code != 0
+    assert "Invalid order 'random'" in result.output
+
+
+def test_get_subset(mocker, tmp_path):
+    mocked_get = mocker.patch.object(ac_core, "get", return_value=["file.nc"])
+    result = runner.invoke(
+        app,
+        [
+            "get",
+            "SWOT",
+            "--output",
+            str(tmp_path),
+            "--variables",
+            "time, ssha,",
+            "--bbox",
+            "-10,30,10.5,50",
+        ],
+    )
+    assert result.exit_code == 0
+    assert mocked_get.call_args.kwargs["variables"] == ["time", "ssha"]
+    assert mocked_get.call_args.kwargs["bbox"] == (-10, 30, 10.5, 50)
+
+
+@pytest.mark.parametrize(
+    "option, message",
+    [
+        (["--variables", ","], "Invalid variables"),
+        (["--bbox", "-10,30,10"], "Invalid bounding box"),
+        (["--bbox", "-10,50,10,30"], "Invalid bounding box"),
+        (["--bbox", "a,b,c,d"], "Invalid bounding box"),
+    ],
+)
+def test_get_subset_invalid(mocker, tmp_path, option, message):
+    mocker.patch.object(ac_core, "get", return_value=["file.nc"])
+    result = runner.invoke(app, ["get", "SWOT", "--output", str(tmp_path), *option])
+    assert result.exit_code != 0
+    assert message in result.output
+
+
+def test_get_stream(mocker, tmp_path):
+    mocked_get = mocker.patch.object(ac_core, "get", return_value=["file.nc"])
+    result = runner.invoke(app, ["get", "SWOT", "--output", str(tmp_path), "--stream"])
+    assert result.exit_code == 0
+    assert mocked_get.call_args.kwargs["stream"]
+
+    mocked_get.reset_mock()
+    result = runner.invoke(
+        app,
+        ["get", "SWOT", "--output", str(tmp_path), "--stream", "--order", "newest"],
+    )
+    assert result.exit_code != 0
+    assert "Streamed downloads cannot be ordered" in result.output
+    mocked_get.assert_not_called()
+
+
+def test_get_error_during_download(mocker, tmp_path):
+    # Errors raised during the download are not reported as invalid arguments
+    mocker.patch.object(ac_core, "get", side_effect=ValueError("corrupted file"))
+    result = runner.invoke(app, ["get", "SWOT", "--output", str(tmp_path)])
+    assert result.exit_code != 0
+    assert "Invalid value" not in result.output
+    assert isinstance(result.exception, ValueError)
+
+
+def test_get_catalog_cache(mocker, tmp_path):
+    mocked_get = mocker.patch.object(ac_core, "get", return_value=["file.nc"])
+    cache_path = tmp_path / "catalogs.sqlite"
+    result = runner.invoke(
+        app,
+        [
+            "get",
+            "SWOT",
+            "--output",
+            str(tmp_path),
+            "--catalog-cache",
+            str(cache_path),
+            "--catalog-ttl",
+            "0,60,86400",
+        ],
+    )
+    assert result.exit_code == 0
+    cache = mocked_get.call_args.kwargs["catalog_cache"]
+    assert cache.path == cache_path
+    assert cache.ttls == (0, 60, 86400)
+    assert cache_path.exists()
+
+    result = runner.invoke(
+        app, ["get", "SWOT", "--output", str(tmp_path), "--catalog-ttl", "0,-1"]
+    )
+    assert result.exit_code != 0
+    assert "Invalid catalog TTLs" in result.output
+
+
+def test_get_granule_index(mocker, tmp_path):
+    mocked_get = mocker.patch.object(ac_core, "get", return_value=["file.nc"])
+    index_path = tmp_path / "granules.sqlite"
+    result = runner.invoke(
+        app,
+        [
+            "get",
+            "SWOT",
+            "--output",
+            str(tmp_path),
+            "--granule-index",
+            str(index_path),
+            "--index-max-age",
+            "86400",
+        ],
+    )
+    assert result.exit_code == 0
+    index = mocked_get.call_args.kwargs["granule_index"]
+    assert index.path == index_path
+    assert index.max_age == 86400
+    assert index_path.exists()
+
+    mocked_estimate = mocker.patch.object(
+        ac_core,
+        "estimate",
+        side_effect=InvalidIndexFilterError("Invalid filters ['time']"),
+    )
+    result = runner.invoke(
+        app,
+        [
+            "get",
+            "SWOT",
+            "--output",
+            str(tmp_path),
+            "--granule-index",
+            str(index_path),
+            "--dry-run",
+        ],
+    )
+    assert result.exit_code != 0
+    assert "Invalid filters" in result.output
+    assert mocked_estimate.call_args.kwargs["granule_index"].path == index_path
+
+    mocked_get.side_effect = InvalidIndexFilterError("Invalid filters {'version'")
+    result = runner.invoke(
+        app,
+        [
+            "get",
+            "SWOT",
+            "--output",
+            str(tmp_path),
+            "--granule-index",
+            str(index_path),
+            "--version",
+            "2.0",
+        ],
+    )
+    assert result.exit_code != 0
+    assert "Invalid filters" in result.output
+
+    mocked_get.side_effect = None
+    result = runner.invoke(app, ["get", "SWOT", "--output", str(tmp_path)])
+    assert result.exit_code == 0
+
+
+def test_get_dry_run(mocker, tmp_path):
+    mocked_get = mocker.patch.object(ac_core, "get")
+    mocked_estimate = mocker.patch.object(
+        ac_core,
+        "estimate",
+        return_value=DownloadEstimate(
+            files=2, size=3_000_000_000, unknown_sizes=0, free_space=10**10
+        ),
+    )
+    result = runner.invoke(
+        app, ["get", "SWOT", "--output", str(tmp_path), "--dry-run", "-c", "1"]
+    )
+
+    assert result.exit_code == 0
+    assert "2 files to download: 3.00 GB, 10.00 GB available" in result.output
+    mocked_get.assert_not_called()
+    assert mocked_estimate.call_args.kwargs["cycle_number"] == [1]
+
+    mocked_estimate.side_effect = InvalidProductError
+    result = runner.invoke(app, ["get", "bad", "--output", str(tmp_path), "--dry-run"])
+    assert result.exit_code != 0
+    assert "doesn't exist in Aviso catalog" in result.output
+
+
+def test_get_disk_space(mocker, tmp_path):
+    mocked_get = mocker.patch.object(
+        ac_core,
+        "get",
+        side_effect=InsufficientDiskSpaceError("Not enough space in /data"),
+    )
+    result = runner.invoke(app, ["get", "SWOT", "--output", str(tmp_path)])
+    assert result.exit_code == 1
+    assert "Not enough space in /data" in result.output
+
+    runner.invoke(app, ["get", "SWOT", "--output", str(tmp_path), "--no-space-check"])
+    assert not mocked_get.call_args.kwargs["check_disk_space"]
@@ -0,0 +1,177 @@
+import threading
+
+import pytest
+
+from altimetry_downloader_aviso.concurrency import (
+    AdaptiveConcurrency,
+    ByteBudget,
+    ByteBudgetClosed,
+)
+
+
+@pytest.fixture
+def clock(mocker):
+    now = [0.0]
+    mocker.patch(
+        "altimetry_downloader_aviso.concurrency.time.monotonic",
+        side_effect=lambda: now[0],
+    )
+    return now
+
+
+def _round(controller, clock, duration, size=1000, elapsed=1.0):
+    """Complete a round of successful downloads lasting duration seconds."""
+    clock[0] += duration
+    for _ in range(controller.level):
+        controller.record_success(elapsed, size)
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"max_level": 0},
+        {"max_level": 4, "min_level": 5},
+        {"max_level": 4, "initial_level": 5},
+        {"max_level": 4, "decrease_factor": 1},
+    ],
+)
+def test_adaptive_concurrency_invalid(kwargs):
+    with pytest.raises(ValueError):
+        AdaptiveConcurrency(**kwargs)
+
+
+def test_adaptive_concurrency_initial_level():
+    assert AdaptiveConcurrency(8).level == 4
+    assert AdaptiveConcurrency(1).level == 1
+    assert AdaptiveConcurrency(8, min_level=6).level == 6
+
+
+def test_adaptive_concurrency_increase(mocker, clock):
+    callback = mocker.Mock()
+    controller = AdaptiveConcurrency(4, initial_level=2, callback=callback)
+
+    _round(controller, clock, 1.0)
+    assert controller.level == 3
+
+    # Throughput grows with the concurrency
+    _round(controller, clock, 1.0)
+    assert controller.level == 4
+
+    # Maximum level reached
+    _round(controller, clock, 1.0)
+    assert controller.level == 4
+
+    assert callback.call_args_list == [mocker.call(3), mocker.call(4)]
+
+
+def test_adaptive_concurrency_throughput_drop(clock):
+    controller = AdaptiveConcurrency(8, initial_level=2)
+    _round(controller, clock, 1.0)
+    assert controller.level == 3
+
+    # 3000 bytes in 2 seconds is slower than 2000 bytes in 1 second
+    _round(controller, clock, 2.0)
+    assert controller.level == 3
+
+
+def test_adaptive_concurrency_latency(clock):
+    controller = AdaptiveConcurrency(8, initial_level=4, latency_tolerance=2.0)
+    _round(controller, clock, 1.0, elapsed=1.0)
+    assert controller.level == 5
+
+    _round(controller, clock, 1.0, elapsed=3.0)
+    assert controller.level == 2
+
+
+def test_adaptive_concurrency_failures(mocker, caplog):
+    callback = mocker.Mock()
+    controller = AdaptiveConcurrency(16, initial_level=8, callback=callback)
+
+    # Client errors are not related to the server load
+    controller.record_failure(404)
+    assert controller.level == 8
+
+    with caplog.at_level("INFO"):
+        controller.record_failure(429)
+    assert controller.level == 4
+    assert "Download concurrency decreased from 8 to 4" in caplog.text
+
+    # The downloads started at the previous level do not decrease it again
+    for _ in range(7):
+        controller.record_failure(503)
+    assert controller.level == 4
+
+    controller.record_failure()
+    assert controller.level == 2
+
+    # Wait for the completion of the downloads in flight at the previous level
+    for _ in range(3):
+        controller.record_failure(404)
+    controller.record_failure(500)
+    assert controller.level == 1
+
+    controller.record_failure(500)
+    assert controller.level == 1
+
+    assert callback.call_args_list == [mocker.call(4), mocker.call(2), mocker.call(1)]
+
+
+def test_adaptive_concurrency_instant_round(clock):
+    controller = AdaptiveConcurrency(4, initial_level=1)
+    _round(controller, clock, 0.0)
+    assert controller.level == 2
+
+
+def test_byte_budget_invalid():
+    with pytest.raises(ValueError, match="strictly positive"):
+        ByteBudget(0)
+
+
+def test_byte_budget_waits_for_release():
+    budget = ByteBudget(100)
+    budget.acquire(60)
+    acquired = threading.Event()
+
+    def acquire():
+        budget.acquire(60)
+        acquired.set()
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    assert not acquired.wait(0.05)
+
+    budget.release(60)
+    assert acquired.wait(1)
+    thread.join()
+    assert budget.used == 60
+
+
+def test_byte_budget_oversized():
+    budget = ByteBudget(100)
+    # Let through alone
+    budget.acquire(500)
+    assert budget.used == 500
+
+    budget.acquire(10, block=False)
+    assert budget.used == 510
+
+
+def test_byte_budget_close():
+    budget = ByteBudget(100)
+    budget.acquire(100)
+    errors = []
+
+    def acquire():
+        try:
+            budget.acquire(1)
+        except ByteBudgetClosed as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    budget.close()
+    thread.join(1)
+
+    assert len(errors) == 1
+    with pytest.raises(ByteBudgetClosed):
+        budget.acquire(1)
@@ -0,0 +1,56 @@
+import pytest
+
+from altimetry_downloader_aviso.config import (
+    CATALOG_PARSERS,
+    DEFAULT_CATALOG_PARSER,
+    DEFAULT_CRAWL_WORKERS,
+    DEFAULT_MAX_WORKERS,
+    ConfigurationError,
+    catalog_parser,
+    crawl_workers,
+    max_workers,
+)
+
+
+def test_max_workers(monkeypatch):
+    monkeypatch.delenv("AVISO_MAX_WORKERS", raising=False)
+    assert max_workers() == DEFAULT_MAX_WORKERS
+
+    monkeypatch.setenv("AVISO_MAX_WORKERS", "12")
+    assert max_workers() == 12
+
+
+@pytest.mark.parametrize("value", ["0", "-2", "many", ""])
+def test_max_workers_error(monkeypatch, value):
+    monkeypatch.setenv("AVISO_MAX_WORKERS", value)
+    with pytest.raises(
+        ConfigurationError,
+        match=f"AVISO_MAX_WORKERS must be a strictly positive integer, got '{value}'.",
+    ):
+        max_workers()
+
+
+def test_crawl_workers(monkeypatch):
+    monkeypatch.delenv("AVISO_CRAWL_WORKERS", raising=False)
+    assert crawl_workers() == DEFAULT_CRAWL_WORKERS
+
+    monkeypatch.setenv("AVISO_CRAWL_WORKERS", "32")
+    assert crawl_workers() == 32
+
+
+def test_catalog_parser(monkeypatch):
+    monkeypatch.delenv("AVISO_CATALOG_PARSER", raising=False)
+    assert catalog_parser() == DEFAULT_CATALOG_PARSER
+
+    for parser in CATALOG_PARSERS:
+        monkeypatch.setenv("AVISO_CATALOG_PARSER", parser)
+        assert catalog_parser() == parser
+
+
+def test_catalog_parser_error(monkeypatch):
+    monkeypatch.setenv("AVISO_CATALOG_PARSER", "lxml")
+    with pytest.raises(
+        ConfigurationError,
+        match="AVISO_CATALOG_PARSER must be one of siphon, fast, got 'lxml'.",
+    ):
+        catalog_parser()
@@ -1,12 +1,26 @@
+import hashlib
 import logging
 import netrc
 import os
+import time
 from datetime import datetime
 
+import pandas as pd
 import pytest
+import requests
 
+import altimetry_downloader_aviso.core as core
+from altimetry_downloader_aviso import metrics
+from altimetry_downloader_aviso.catalog_client import granule_discoverer
+from altimetry_downloader_aviso.catalog_client.catalog_cache import CatalogCache
 from altimetry_downloader_aviso.catalog_client.client import InvalidProductError
-from altimetry_downloader_aviso.core import details, get, summary
+from altimetry_downloader_aviso.catalog_client.granule_index import GranuleIndex
+from altimetry_downloader_aviso.core import details, estimate, get, summary
+from altimetry_downloader_aviso.jobs import JobFile
+from altimetry_downloader_aviso.planning import (
+    DownloadEstimate,
+    InsufficientDiskSpaceError,
+)
 
 
 def test_summary():
@@ -66,6 +80,51 @@ def test_get(tmp_path, short_name, filters, files):
     assert local_files == [os.path.join(tmp_path, f) for f in files]
 
 
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_get_workers(mocker, tmp_path, max_workers):
+    sequential = mocker.spy(core, "http_bulk_download")
+    parallel = mocker.spy(core, "http_bulk_download_parallel")
+
+    local_files = get(
+        product_short_name="sample_product_a",
+        output_dir=tmp_path,
+        max_workers=max_workers,
+    )
+
+    files = ["dataset_02.nc", "dataset_22.nc", "dataset_03.nc", "dataset_33.nc"]
+    assert local_files == [os.path.join(tmp_path, f) for f in files]
+    assert sequential.call_count == (max_workers == 1)
+    assert parallel.call_count == (max_workers > 1)
+    if max_workers > 1:
+        assert parallel.call_args.kwargs["max_workers"] == max_workers
+
+
+def test_get_adaptive(mocker, tmp_path):
+    parallel = mocker.spy(core, "http_bulk_download_parallel")
+
+    local_files = get(
+        product_short_name="sample_product_a",
+        output_dir=tmp_path,
+        cycle_number=2,
+        max_workers=8,
+        adaptive=True,
+    )
+
+    assert local_files == [
+        os.path.join(tmp_path, f) for f in ["dataset_02.nc", "dataset_22.nc"]
+    ]
+    assert parallel.call_args.kwargs["adaptive"]
+
+
+def test_get_workers_from_config(mocker, monkeypatch, tmp_path):
+    parallel = mocker.spy(core, "http_bulk_download_parallel")
+    monkeypatch.setenv("AVISO_MAX_WORKERS", "7")
+
+    get(product_short_name="sample_product_a", output_dir=tmp_path)
+
+    assert parallel.call_args.kwargs["max_workers"] == 7
+
+
 def test_get_overwrite(tmp_path):
     short_name = "sample_product_a"
     filters = {"cycle_number": 2, "overwrite": False}
@@ -75,14 +134,105 @@ def test_get_overwrite(tmp_path):
 
     filters = {"cycle_number": [2, 3], "overwrite": False}
     files3 = ["dataset_03.nc", "dataset_33.nc"]
-    local_files = get(product_short_name=short_name, output_dir=tmp_path, **filters)
+    with metrics.collect() as download_metrics:
+        local_files = get(product_short_name=short_name, output_dir=tmp_path, **filters)
     assert local_files == [os.path.join(tmp_path, f) for f in files3]
+    assert download_metrics.counters[metrics.GRANULES] == 4
+    assert download_metrics.counters[metrics.PLANNED] == 2
+    assert download_metrics.counters[metrics.FILES] == 2
 
     filters["overwrite"] = True
     local_files = get(product_short_name=short_name, output_dir=tmp_path, **filters)
     assert local_files == [os.path.join(tmp_path, f) for f in files2 + files3]
 
 
+def _write_granule(path, size, modified):
+    path.write_bytes(b"0" * size)
+    mtime = pd.Timestamp(modified).timestamp()
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_get_incremental(mocker, tmp_path, max_workers):
+    # Catalog metadata: dataset_02.nc has 2000 bytes, dataset_22.nc 22000 bytes
+    _write_granule(tmp_path / "dataset_02.nc", 2000, "2025-01-01T00:00:02")
+    _write_granule(tmp_path / "dataset_22.nc", 10, "2025-01-01T00:00:22")
+    head_response = mocker.Mock()
+    head_response.headers = {"Content-Length": "22000"}
+    mock_head = mocker.patch("requests.Session.head", return_value=head_response)
+
+    local_files = get(
+        product_short_name="sample_product_a",
+        output_dir=tmp_path,
+        cycle_number=2,
+        max_workers=max_workers,
+        incremental=True,
+    )
+
+    assert local_files == [os.path.join(tmp_path, "dataset_22.nc")]
+    assert (tmp_path / "dataset_22.nc").read_bytes() == b"fake file contents"
+    assert (tmp_path / "dataset_02.nc").stat().st_size == 2000
+    mock_head.assert_called_once()
+    assert mock_head.call_args.args[0].endswith("dataset_22.nc")
+
+
+def test_get_checksum(tmp_path):
+    local_files = get(
+        product_short_name="sample_product_a",
+        output_dir=tmp_path,
+        pass_number=3,
+        checksum="sha256",
+    )
+
+    digest = hashlib.sha256(b"fake file contents").hexdigest()
+    assert local_files == [os.path.join(tmp_path, "dataset_03.nc")]
+    assert local_files[0].digest == digest
+    assert (tmp_path / "dataset_03.nc.sha256").read_text().split() == [
+        digest,
+        "dataset_03.nc",
+    ]
+
+
+def test_get_checksum_invalid(mocker, tmp_path):
+    search = mocker.spy(core, "search_granules")
+    job_file = tmp_path / "job.sqlite"
+
+    # The algorithm is checked before browsing the catalogs and planning the job
+    with pytest.raises(ValueError, match="Unsupported checksum algorithm 'sha-256'"):
+        get(
+            product_short_name="sample_product_a",
+            output_dir=tmp_path,
+            checksum="sha-256",
+            job_file=job_file,
+        )
+    search.assert_not_called()
+    with JobFile(job_file) as job:
+        assert not job.is_planned()
+
+    for name in ["a.nc", "b.nc", "c.nc", "d.nc"]:
+        _write_granule(tmp_path / name, 1000, "2025-01-01")
+    granules = pd.DataFrame(
+        {
+            "filename": [
+                f"https://tds.mock/{name}"
+                for name in ["a.nc", "b.nc", "c.nc", "d.nc", "e.nc"]
+            ],
+            # Catalog sizes are rounded
+            "size": [1000.4, 2000, None, None, 1000],
+            "modified": pd.to_datetime(
+                ["2024-12-31", "2024-12-31", "2025-01-02", None, "2024-12-31"]
+            ),
+        }
+    )
+
+    assert core._outdated_granules(granules, tmp_path) == [
+        "https://tds.mock/b.nc",
+        "https://tds.mock/c.nc",
+        "https://tds.mock/d.nc",
+        "https://tds.mock/e.nc",
+    ]
+
+
 def test_get_error(tmp_path):
     with pytest.raises(InvalidProductError):
         get(product_short_name="bad_short_name", output_dir=tmp_path)
@@ -100,10 +250,11 @@ def test_get_auth_error(mocker, tmp_path, caplog):
         side_effect=netrc.NetrcParseError("Invalid netrc"),
     )
 
-    with caplog.at_level(logging.ERROR):
-        get(product_short_name="sample_product_a", output_dir=tmp_path)
+    with caplog.at_level(logging.ERROR), metrics.collect() as download_metrics:
+        assert get(product_short_name="sample_product_a", output_dir=tmp_path) == []
 
     assert "Syntax error in .netrc file: Invalid netrc" in caplog.text
+    assert download_metrics.counters[metrics.ERRORS] == 1
 
 
 @pytest.mark.parametrize(
@@ -121,3 +272,467 @@ def test_get_auth_error(mocker, tmp_path, caplog):
 )
 def test_get_bad_filter(tmp_path, short_name, filters):
     assert get(product_short_name=short_name, output_dir=tmp_path, **filters) == []
+
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_get_job_file(mocker, mock_session_get, tmp_path, max_workers):
+    job_file = tmp_path / "job.sqlite"
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    (output_dir / "dataset_22.nc").write_bytes(b"existing")
+
+    response = mock_session_get.return_value
+    not_found = requests.exceptions.HTTPError(
+        "404 Client Error", response=mocker.Mock(status_code=404, headers={})
+    )
+    mock_session_get.side_effect = lambda url, **kwargs: (
+        _raise(not_found) if url.endswith("dataset_03.nc") else response
+    )
+
+    with pytest.warns(UserWarning, match="dataset_03.nc"):
+        local_files = get(
+            product_short_name="sample_product_a",
+            output_dir=output_dir,
+            max_workers=max_workers,
+            job_file=job_file,
+        )
+
+    assert local_files == [
+        str(output_dir / "dataset_02.nc"),
+        str(output_dir / "dataset_33.nc"),
+    ]
+    with JobFile(job_file) as job:
+        assert [
+            (os.path.basename(g["url"]), g["state"], g["bytes"], g["attempts"])
+            for g in job.granules()
+        ] == [
+            ("dataset_02.nc", "done", 18, 1),
+            ("dataset_22.nc", "done", 8, 0),
+            ("dataset_03.nc", "failed", None, 1),
+            ("dataset_33.nc", "done", 18, 1),
+        ]
+
+    # The rerun resumes the failed granule without browsing the catalog
+    mock_session_get.side_effect = None
+    search = mocker.spy(core, "search_granules")
+    local_files = get(
+        product_short_name="sample_product_a",
+        output_dir=output_dir,
+        max_workers=max_workers,
+        job_file=job_file,
+    )
+
+    assert local_files == [str(output_dir / "dataset_03.nc")]
+    search.assert_not_called()
+    with JobFile(job_file) as job:
+        assert job.remaining() == []
+        assert job.granules()[2]["attempts"] == 2
+
+    # Nothing left to download
+    assert (
+        get(
+            product_short_name="sample_product_a",
+            output_dir=output_dir,
+            overwrite=True,
+            job_file=job_file,
+        )
+        == []
+    )
+
+
+def test_get_job_file_scheduled(mock_session_get, tmp_path):
+    job_file = tmp_path / "job.sqlite"
+    states = []
+
+    def session_get(url, **kwargs):
+        with JobFile(job_file) as job:
+            states.append(
+                [(os.path.basename(g["url"]), g["state"]) for g in job.granules()]
+            )
+        return mock_session_get.return_value
+
+    mock_session_get.side_effect = session_get
+
+    get(
+        product_short_name="sample_product_a",
+        output_dir=tmp_path,
+        max_workers=1,
+        cycle_number=2,
+        job_file=job_file,
+    )
+
+    # Each granule is started when its download is scheduled
+    assert states == [
+        [("dataset_02.nc", "in-progress"), ("dataset_22.nc", "pending")],
+        [("dataset_02.nc", "done"), ("dataset_22.nc", "in-progress")],
+    ]
+
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_get_job_file_failed_refresh(mocker, mock_session_get, tmp_path, max_workers):
+    job_file = tmp_path / "job.sqlite"
+    # Catalog metadata: dataset_02.nc has 2000 bytes, dataset_22.nc 22000 bytes
+    _write_granule(tmp_path / "dataset_02.nc", 2000, "2025-01-01T00:00:02")
+    _write_granule(tmp_path / "dataset_22.nc", 10, "2025-01-01T00:00:22")
+    head_response = mocker.Mock()
+    head_response.headers = {"Content-Length": "22000"}
+    mocker.patch("requests.Session.head", return_value=head_response)
+    mock_session_get.side_effect = requests.exceptions.HTTPError(
+        "404 Client Error", response=mocker.Mock(status_code=404, headers={})
+    )
+
+    with pytest.warns(UserWarning, match="dataset_22.nc"):
+        local_files = get(
+            product_short_name="sample_product_a",
+            output_dir=tmp_path,
+            cycle_number=2,
+            max_workers=max_workers,
+            incremental=True,
+            job_file=job_file,
+        )
+
+    assert local_files == []
+    # The stale local copy of dataset_22.nc is not taken for a done granule
+    with JobFile(job_file) as job:
+        assert [(os.path.basename(g["url"]), g["state"]) for g in job.granules()] == [
+            ("dataset_02.nc", "done"),
+            ("dataset_22.nc", "failed"),
+        ]
+
+
+def _raise(error):
+    raise error
+
+
+@pytest.mark.parametrize("incremental", [False, True])
+def test_get_shard(tmp_path, incremental):
+    all_files = set()
+    for index in range(3):
+        local_files = get(
+            product_short_name="sample_product_a",
+            output_dir=tmp_path / str(index),
+            incremental=incremental,
+            shard=(index, 3),
+        )
+        names = {os.path.basename(f) for f in local_files}
+        assert not names & all_files
+        all_files |= names
+
+    assert all_files == {
+        "dataset_02.nc",
+        "dataset_22.nc",
+        "dataset_03.nc",
+        "dataset_33.nc",
+    }
+
+
+def test_get_shard_overwrite(tmp_path):
+    local_files = get(
+        product_short_name="sample_product_a",
+        output_dir=tmp_path,
+        overwrite=True,
+        shard=(0, 1),
+    )
+    assert len(local_files) == 4
+
+    with pytest.raises(ValueError, match="Invalid shard"):
+        get(product_short_name="sample_product_a", output_dir=tmp_path, shard=(3, 3))
+
+
+@pytest.mark.parametrize(
+    "order, incremental, expected",
+    [
+        ("newest", False, ["dataset_33.nc", "dataset_22.nc", "dataset_03.nc"]),
+        ("smallest", True, ["dataset_03.nc", "dataset_22.nc", "dataset_33.nc"]),
+        ("catalog", False, ["dataset_22.nc", "dataset_03.nc", "dataset_33.nc"]),
+    ],
+)
+def test_get_order(mock_session_get, tmp_path, order, incremental, expected):
+    _write_granule(tmp_path / "dataset_02.nc", 2000, "2025-01-01T00:00:02")
+
+    local_files = get(
+        product_short_name="sample_product_a",
+        output_dir=tmp_path,
+        max_workers=1,
+        incremental=incremental,
+        order=order,
+    )
+
+    assert local_files == [str(tmp_path / f) for f in expected]
+    assert [
+        os.path.basename(c.args[0]) for c in mock_session_get.call_args_list
+    ] == expected
+
+
+def test_get_order_invalid(tmp_path):
+    with pytest.raises(ValueError, match="Invalid order"):
+        get(product_short_name="sample_product_a", output_dir=tmp_path, order="bad")
+
+
+def test_get_subset(mock_session_get, tmp_path):
+    # The whole granule is not taken for its subset, unlike a previous subset
+    (tmp_path / "dataset_02.nc").write_bytes(b"whole")
+    (tmp_path / "dataset_03.b0ac3ec4.nc").write_bytes(b"subset")
+
+    with pytest.warns(UserWarning, match="1 of 4 granules are not served"):
+        local_files = get(
+            product_short_name="sample_product_a",
+            output_dir=tmp_path,
+            max_workers=1,
+            variables=["time", "ssha"],
+            bbox=(-10, 30, 10, 50),
+        )
+
+    assert local_files == [
+        str(tmp_path / f)
+        for f in ["dataset_02.b0ac3ec4.nc", "dataset_22.b0ac3ec4.nc", "dataset_33.nc"]
+    ]
+    assert [c.args[0] for c in mock_session_get.call_args_list] == [
+        "https://tds.mock/ncss/productA_path/cycle_02/dataset_02.nc?var=time&var=ssha"
+        "&north=50&south=30&east=10&west=-10&accept=netcdf4",
+        "https://tds.mock/ncss/productA_path/cycle_02/dataset_22.nc?var=time&var=ssha"
+        "&north=50&south=30&east=10&west=-10&accept=netcdf4",
+        "https://tds.mock/productA_path/cycle_03/dataset_33.nc",
+    ]
+    assert (tmp_path / "dataset_02.nc").read_bytes() == b"whole"
+
+
+def test_get_subset_job(tmp_path):
+    job_file = tmp_path / "job.sqlite"
+    output_dir = tmp_path / "output"
+    with pytest.warns(UserWarning, match="not served"):
+        get(
+            product_short_name="sample_product_a",
+            output_dir=output_dir,
+            job_file=job_file,
+            variables=["ssha"],
+        )
+
+    url = (
+        "https://tds.mock/ncss/productA_path/cycle_02/dataset_02.nc"
+        "?var=ssha&accept=netcdf4"
+    )
+    with JobFile(job_file) as job:
+        granules = job.granules()
+        job.fail(url)
+    assert granules[0]["url"] == url
+    assert {g["state"] for g in granules} == {"done"}
+
+    # The subset is resumed from the job file
+    (output_dir / "dataset_02.d1ac12f6.nc").unlink()
+    assert get(
+        product_short_name="sample_product_a",
+        output_dir=output_dir,
+        job_file=job_file,
+    ) == [str(output_dir / "dataset_02.d1ac12f6.nc")]
+
+
+def test_get_subset_invalid(tmp_path):
+    with pytest.raises(ValueError, match="Invalid bounding box"):
+        get(
+            product_short_name="sample_product_a",
+            output_dir=tmp_path,
+            bbox=(0, 10, 0, -10),
+        )
+    with pytest.raises(ValueError, match="cannot be combined with subsetting"):
+        get(
+            product_short_name="sample_product_a",
+            output_dir=tmp_path,
+            variables=["ssha"],
+            incremental=True,
+        )
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_get_stream(mocker, tmp_path, mock_session_get, caplog, max_workers):
+    events = []
+    fetch = granule_discoverer.TDSCatalog.side_effect
+
+    def slow_fetch(url):
+        # The last catalog is received after the first downloads
+        if "cycle_03" in url:
+            time.sleep(0.2)
+        events.append(url)
+        return fetch(url)
+
+    granule_discoverer.TDSCatalog.side_effect = slow_fetch
+    mock_session_get.side_effect = lambda url, **kwargs: (
+        events.append(url) or mock_session_get.return_value
+    )
+    (tmp_path / "dataset_22.nc").write_bytes(b"existing")
+
+    with caplog.at_level(logging.INFO), metrics.collect() as download_metrics:
+        local_files = get(
+            product_short_name="sample_product_a",
+            output_dir=tmp_path,
+            max_workers=max_workers,
+            stream=True,
+        )
+
+    assert local_files == [
+        str(tmp_path / f) for f in ["dataset_02.nc", "dataset_03.nc", "dataset_33.nc"]
+    ]
+    assert download_metrics.counters[metrics.PLANNED] == 3
+    assert download_metrics.histograms[metrics.DISCOVERY].count == 1
+    # A single count of the granules of all the catalogs, once they are received
+    assert [r.getMessage() for r in caplog.records if "files to" in r.getMessage()] == [
+        "3 files to download. 1 files already exist."
+    ]
+    assert events.index(
+        "https://tds.mock/productA_path/cycle_02/dataset_02.nc"
+    ) < events.index("https://tds.mock/productA_path/cycle_03/catalog.xml")
+
+
+def test_get_stream_filters(mocker, tmp_path):
+    download = mocker.spy(core, "http_bulk_download")
+    _write_granule(tmp_path / "dataset_03.nc", 3000, "2025-01-01T00:00:03")
+
+    with pytest.warns(UserWarning, match="not served"):
+        local_files = get(
+            product_short_name="sample_product_a",
+            output_dir=tmp_path,
+            max_workers=1,
+            incremental=True,
+            shard=(0, 1),
+            stream=True,
+        ) + get(
+            product_short_name="sample_product_a",
+            output_dir=tmp_path,
+            max_workers=1,
+            overwrite=True,
+            variables=["ssha"],
+            cycle_number=3,
+            stream=True,
+        )
+
+    assert sorted(local_files) == [
+        str(tmp_path / f)
+        for f in ["dataset_02.nc", "dataset_03.d1ac12f6.nc", "dataset_22.nc"]
+        + ["dataset_33.nc", "dataset_33.nc"]
+    ]
+    assert not isinstance(download.call_args.kwargs["urls"], list)
+
+
+@pytest.mark.parametrize("kwargs", [{"order": "newest"}, {"job_file": "job.sqlite"}])
+def test_get_stream_invalid(tmp_path, kwargs):
+    with pytest.raises(ValueError, match="Streamed downloads cannot be ordered"):
+        get(
+            product_short_name="sample_product_a",
+            output_dir=tmp_path,
+            stream=True,
+            **kwargs,
+        )
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_get_catalog_cache(tmp_path, stream):
+    tds_catalog = granule_discoverer.TDSCatalog
+    output_dir = tmp_path / "output"
+    with CatalogCache(tmp_path / "catalogs.sqlite") as cache:
+        local_files = get(
+            product_short_name="sample_product_a",
+            output_dir=output_dir,
+            stream=stream,
+            catalog_cache=cache,
+        )
+        assert estimate(
+            product_short_name="sample_product_a",
+            output_dir=output_dir,
+            overwrite=True,
+            catalog_cache=cache,
+        ).files == len(local_files)
+
+    assert len(local_files) == 4
+    assert all(c.args[1] is cache for c in tds_catalog.call_args_list)
+
+
+def test_get_granule_index(tmp_path):
+    tds_catalog = granule_discoverer.TDSCatalog
+    output_dir = tmp_path / "output"
+    with GranuleIndex(tmp_path / "granules.sqlite") as index:
+        local_files = get(
+            product_short_name="sample_product_a",
+            output_dir=output_dir,
+            pass_number=[3, 22],
+            granule_index=index,
+        )
+        assert sorted(local_files) == [
+            str(output_dir / "dataset_03.nc"),
+            str(output_dir / "dataset_22.nc"),
+        ]
+
+        tds_catalog.reset_mock()
+        assert (
+            estimate(
+                product_short_name="sample_product_a",
+                output_dir=output_dir,
+                pass_number=2,
+                granule_index=index,
+            ).files
+            == 1
+        )
+        tds_catalog.assert_not_called()
+
+        with pytest.raises(ValueError, match="Invalid filters"):
+            get(
+                product_short_name="sample_product_a",
+                output_dir=output_dir,
+                cycle_number=2,
+                granule_index=index,
+            )
+        with pytest.raises(ValueError, match="cannot use a granule index"):
+            get(
+                product_short_name="sample_product_a",
+                output_dir=output_dir,
+                stream=True,
+                granule_index=index,
+            )
+
+
+def test_get_disk_space(mocker, tmp_path):
+    # The 4 granules weigh 60 kB in the catalog
+    mocker.patch(
+        "altimetry_downloader_aviso.planning.shutil.disk_usage",
+        return_value=mocker.Mock(free=50_000),
+    )
+    download = mocker.spy(core, "http_bulk_download_parallel")
+
+    with pytest.raises(InsufficientDiskSpaceError, match="4 files to download"):
+        get(product_short_name="sample_product_a", output_dir=tmp_path)
+    download.assert_not_called()
+
+    with pytest.warns(UserWarning, match="Not enough space"):
+        local_files = get(
+            product_short_name="sample_product_a",
+            output_dir=tmp_path,
+            check_disk_space=False,
+        )
+    assert len(local_files) == 4
+
+    # Existing files are not counted
+    get(product_short_name="sample_product_a", output_dir=tmp_path)
+
+
+@pytest.mark.parametrize(
+    "kwargs, files, size",
+    [
+        ({}, 3, 58000),
+        ({"overwrite": True}, 4, 60000),
+        ({"incremental": True}, 3, 58000),
+        ({"shard": (0, 1), "cycle_number": 3}, 2, 36000),
+    ],
+)
+def test_estimate(mocker, tmp_path, kwargs, files, size):
+    _write_granule(tmp_path / "dataset_02.nc", 2000, "2025-01-01T00:00:02")
+    mocker.patch(
+        "altimetry_downloader_aviso.planning.shutil.disk_usage",
+        return_value=mocker.Mock(free=10**9),
+    )
+    download = mocker.spy(core, "http_bulk_download_parallel")
+
+    download_estimate = estimate(
+        product_short_name="sample_product_a", output_dir=tmp_path, **kwargs
+    )
+
+    assert download_estimate == DownloadEstimate(files, size, 0, 10**9)
+    download.assert_not_called()
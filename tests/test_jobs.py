@@ -0,0 +1,44 @@
+import sqlite3
+
+from altimetry_downloader_aviso.jobs import DONE, FAILED, IN_PROGRESS, PENDING, JobFile
+
+
+def test_job_file(tmp_path):
+    path = tmp_path / "job.sqlite"
+    urls = ["https://tds.mock/a.nc", "https://tds.mock/b.nc", "https://tds.mock/c.nc"]
+
+    with JobFile(path) as job:
+        assert not job.is_planned()
+        assert job.remaining() == []
+
+        job.plan(urls)
+        assert job.is_planned()
+        assert job.summary() == {PENDING: 3, IN_PROGRESS: 0, DONE: 0, FAILED: 0}
+
+        job.start(urls[:2])
+        job.done(urls[0], 1234)
+        job.fail(urls[1])
+
+    # The states are persisted
+    with JobFile(path) as job:
+        assert job.remaining() == urls[1:]
+        assert job.summary() == {PENDING: 1, IN_PROGRESS: 0, DONE: 1, FAILED: 1}
+
+        # Planning again keeps the known granules and appends the new ones
+        job.plan(["https://tds.mock/d.nc", urls[0]])
+        job.start(urls[1:2])
+        assert job.granules() == [
+            {"url": urls[0], "state": DONE, "bytes": 1234, "attempts": 1},
+            {"url": urls[1], "state": IN_PROGRESS, "bytes": None, "attempts": 2},
+            {"url": urls[2], "state": PENDING, "bytes": None, "attempts": 0},
+            {
+                "url": "https://tds.mock/d.nc",
+                "state": PENDING,
+                "bytes": None,
+                "attempts": 0,
+            },
+        ]
+
+    with sqlite3.connect(path) as connection:
+        (count,) = connection.execute("SELECT COUNT(*) FROM granules").fetchone()
+    assert count == 4
@@ -0,0 +1,150 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from altimetry_downloader_aviso import metrics
+from altimetry_downloader_aviso.metrics import DownloadMetrics, Histogram, collect
+
+
+def test_histogram():
+    histogram = Histogram(buckets=(0.1, 1.0, float("inf")))
+    assert histogram.quantile(0.5) is None
+
+    for value in [0.05, 0.1, 0.5, 0.7, 20.0]:
+        histogram.observe(value)
+
+    assert histogram.counts == [2, 2, 1]
+    assert histogram.count == 5
+    assert histogram.sum == pytest.approx(21.35)
+    assert (histogram.min, histogram.max) == (0.05, 20.0)
+    assert histogram.quantile(0.4) == 0.1
+    assert histogram.quantile(0.5) == 1.0
+    # The infinite bucket is bounded by the maximum
+    assert histogram.quantile(1.0) == 20.0
+
+
+def test_collect(mocker):
+    hook = mocker.Mock()
+
+    # Nothing is recorded outside of a collection
+    metrics.count(metrics.FILES)
+
+    with collect(DownloadMetrics(hooks=[hook])) as m1:
+        with collect() as m2:
+            metrics.count(metrics.BYTES, 100, "https://tds.mock/a.nc")
+            with metrics.timed(metrics.CATALOG, "https://tds.mock/catalog.xml"):
+                pass
+        metrics.count(metrics.FILES, 1, "https://tds.mock/a.nc")
+
+    metrics.count(metrics.FILES)
+
+    assert m1.counters[metrics.FILES] == 1
+    assert m2.counters[metrics.FILES] == 0
+    for m in [m1, m2]:
+        assert m.counters[metrics.BYTES] == 100
+        assert m.histograms[metrics.CATALOG].count == 1
+
+    assert hook.call_args_list[0] == mocker.call(
+        metrics.BYTES, 100, "https://tds.mock/a.nc"
+    )
+    assert hook.call_args_list[1].args[0] == metrics.CATALOG
+    assert hook.call_count == 3
+
+
+def test_collect_threads():
+    with collect() as m, ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [
+            metrics.submit(
+                executor,
+                lambda: [metrics.count(metrics.BYTES, 1) for _ in range(1000)],
+            )
+            for _ in range(8)
+        ]
+        for future in futures:
+            future.result()
+
+    assert m.counters[metrics.BYTES] == 8000
+
+
+def test_collect_concurrent_scopes():
+    barrier = threading.Barrier(2)
+    collected = {}
+
+    def run(name, value):
+        with collect() as m:
+            # Both scopes are open while the threads count
+            barrier.wait()
+            metrics.count(metrics.BYTES, value)
+            barrier.wait()
+        collected[name] = m.counters[metrics.BYTES]
+
+    threads = [
+        threading.Thread(target=run, args=("a", 1)),
+        threading.Thread(target=run, args=("b", 10)),
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert collected == {"a": 1, "b": 10}
+
+
+def test_summary(mocker):
+    now = [100.0]
+    mocker.patch(
+        "altimetry_downloader_aviso.metrics.time.monotonic", side_effect=lambda: now[0]
+    )
+    m = DownloadMetrics()
+    m.add_hook(mocker.Mock())
+    assert m.summary()["throughput"] == 0.0
+
+    m.observe(metrics.DISCOVERY, 2.0)
+    m.observe(metrics.TRANSFER, 0.3, "https://tds.mock/a.nc")
+    m.observe("custom", 1.0)
+    m.count(metrics.BYTES, 8000)
+    m.count(metrics.FILES)
+    now[0] += 6.0
+    m.stop()
+    now[0] += 10.0
+
+    summary = m.summary()
+    assert summary["elapsed"] == 6.0
+    assert summary["transfer_time"] == pytest.approx(0.3)
+    assert summary["throughput"] == pytest.approx(8000 / 0.3)
+    assert summary["counters"][metrics.FILES] == 1
+    assert summary["latencies"][metrics.TRANSFER] == {
+        "count": 1,
+        "sum": 0.3,
+        "p50": 0.3,
+        "p95": 0.3,
+        "max": 0.3,
+    }
+    assert summary["latencies"][metrics.CATALOG]["p50"] is None
+    assert summary["latencies"]["custom"]["count"] == 1
+
+
+def test_transfer_time(mocker):
+    now = [0.0]
+    mocker.patch(
+        "altimetry_downloader_aviso.metrics.time.monotonic", side_effect=lambda: now[0]
+    )
+    m = DownloadMetrics()
+
+    # Transfers ending at 10 [5, 10], 12 [8, 12], 13 [11, 13], 30 [25, 30] and
+    # 31 [2, 31]: the first three overlap, the last one covers all the others
+    for stop, seconds, expected in [
+        (10, 5, 5),
+        (12, 4, 7),
+        (13, 2, 8),
+        (30, 5, 8 + 5),
+        (31, 29, 29),
+    ]:
+        now[0] = stop
+        m.observe(metrics.TRANSFER, seconds)
+        assert m.transfer_time == expected
+
+    # Discovery overlapping the transfers is not deducted
+    m.observe(metrics.DISCOVERY, 20.0)
+    assert m.transfer_time == 29
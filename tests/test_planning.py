@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+import pytest
+from fcollections.time import Period
+
+from altimetry_downloader_aviso.planning import (
+    DownloadEstimate,
+    estimate_download,
+    order_granules,
+    select_shard,
+    shard_of,
+)
+
+
+def _urls(n):
+    return [f"https://tds.mock/cycle_{i % 7:03d}/granule_{i:05d}.nc" for i in range(n)]
+
+
+def test_shard_of():
+    assert shard_of("https://tds.mock/a/granule.nc", 8) == shard_of("granule.nc", 8)
+    assert shard_of("granule.nc", 1) == 0
+
+
+@pytest.mark.parametrize("index, count", [(0, 0), (-1, 4), (4, 4)])
+def test_select_shard_invalid(index, count):
+    with pytest.raises(ValueError, match="Invalid shard"):
+        select_shard(_urls(10), index, count)
+
+
+def test_select_shard_partition(caplog):
+    urls = _urls(4000)
+    with caplog.at_level("INFO"):
+        shards = [select_shard(iter(urls), i, 4) for i in range(4)]
+
+    assert "Shard 0/4:" in caplog.text
+    # Disjoint, complete, and in the order of the plan
+    assert sorted(sum(shards, [])) == sorted(urls)
+    for shard in shards:
+        assert shard == [u for u in urls if u in set(shard)]
+        assert 900 < len(shard) < 1100
+
+
+def test_select_shard_stable():
+    urls = _urls(1000)
+    before = select_shard(urls, 1, 3)
+
+    # Granules added to or removed from the plan do not move the others
+    after = select_shard(urls[10:] + _urls(1100)[1000:], 1, 3)
+    assert set(before) - set(urls[:10]) <= set(after)
+
+
+@pytest.fixture
+def granules():
+    return pd.DataFrame(
+        {
+            "filename": ["a.nc", "b.nc", "c.nc", "d.nc", "e.nc"],
+            "cycle_number": [2, 1, 2, None, 1],
+            "pass_number": [5, 7, 1, 3, None],
+            "time": [
+                Period(np.datetime64("2024-01-03"), np.datetime64("2024-01-04")),
+                Period(np.datetime64("2024-01-01"), np.datetime64("2024-01-02")),
+                None,
+                None,
+                Period(np.datetime64("2024-01-02"), np.datetime64("2024-01-03")),
+            ],
+            "size": [300, 100, None, 500, 200],
+            "modified": pd.to_datetime(
+                ["2025-01-01", "2025-01-01", "2023-12-31", None, "2025-01-01"]
+            ),
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "order, expected",
+    [
+        ("catalog", ["a.nc", "b.nc", "c.nc", "d.nc", "e.nc"]),
+        # c.nc has no time in its name, but a modification date
+        ("oldest", ["c.nc", "b.nc", "e.nc", "a.nc", "d.nc"]),
+        ("newest", ["a.nc", "e.nc", "b.nc", "c.nc", "d.nc"]),
+        ("smallest", ["b.nc", "e.nc", "a.nc", "d.nc", "c.nc"]),
+        ("largest", ["d.nc", "a.nc", "e.nc", "b.nc", "c.nc"]),
+        ("cycle-pass", ["e.nc", "b.nc", "c.nc", "a.nc", "d.nc"]),
+        (lambda g: -ord(g["filename"][0]), ["e.nc", "d.nc", "c.nc", "b.nc", "a.nc"]),
+    ],
+)
+def test_order_granules(granules, order, expected):
+    assert list(order_granules(granules, order).filename) == expected
+
+
+def test_order_granules_missing_fields():
+    granules = pd.DataFrame({"filename": ["a.nc", "b.nc"]})
+    assert list(order_granules(granules, "newest").filename) == ["a.nc", "b.nc"]
+    assert list(order_granules(granules, "cycle-pass").filename) == ["a.nc", "b.nc"]
+
+
+def test_order_granules_invalid(granules):
+    with pytest.raises(ValueError, match="Invalid order 'random'"):
+        order_granules(granules, "random")
+
+
+def test_estimate_download(mocker, tmp_path):
+    disk_usage = mocker.patch(
+        "altimetry_downloader_aviso.planning.shutil.disk_usage",
+        return_value=mocker.Mock(free=2_500_000_000),
+    )
+    granules = pd.DataFrame(
+        {"filename": ["a.nc", "b.nc", "c.nc"], "size": [1e9, None, 2e9]}
+    )
+
+    estimate = estimate_download(granules, tmp_path / "new" / "dir")
+
+    # The closest existing parent is measured
+    disk_usage.assert_called_once_with(tmp_path)
+    assert estimate == DownloadEstimate(
+        files=3, size=3_000_000_000, unknown_sizes=1, free_space=2_500_000_000
+    )
+    assert not estimate.fits
+    assert str(estimate) == (
+        "3 files to download: 3.00 GB (1 files of unknown size), 2.50 GB available"
+    )
+
+    estimate = estimate_download(granules.iloc[:1], tmp_path)
+    assert estimate.fits
+    assert str(estimate) == "1 files to download: 1.00 GB, 2.50 GB available"
+
+    estimate = estimate_download(pd.DataFrame({"filename": ["a.nc"]}), tmp_path)
+    assert (estimate.size, estimate.unknown_sizes) == (0, 1)
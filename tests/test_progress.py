@@ -0,0 +1,82 @@
+import io
+import time
+
+from rich.console import Console
+
+from altimetry_downloader_aviso import metrics
+from altimetry_downloader_aviso.progress import DownloadProgress
+
+
+def _console():
+    return Console(file=io.StringIO(), width=120)
+
+
+def _infos(display):
+    return {task.description: task.fields["info"] for task in display.progress.tasks}
+
+
+def test_download_progress(mocker):
+    now = [100.0]
+    mocker.patch(
+        "altimetry_downloader_aviso.progress.time.monotonic",
+        side_effect=lambda: now[0],
+    )
+    display = DownloadProgress(_console(), refresh_per_second=1e-3, max_transfers=2)
+
+    with display:
+        assert _infos(display) == {"Total": ""}
+
+        display(metrics.PLANNED, 4)
+        display(metrics.CATALOG, 0.5, "https://tds.mock/catalog.xml")
+        display(metrics.BYTES, 1000, "https://tds.mock/a.nc")
+        now[0] += 1
+        display(metrics.BYTES, 1000, "https://tds.mock/a.nc")
+        display(metrics.BYTES, 500, "https://tds.mock/b.nc")
+        display(metrics.BYTES, 500, "https://tds.mock/c.nc")
+        display(metrics.BYTES, 500)
+        now[0] += 1
+        display.refresh()
+
+        # Only max_transfers transfers are displayed
+        assert _infos(display) == {
+            "Total": "0/4 files, 3.5 kB, 1.8 kB/s",
+            "a.nc": "2.0 kB, 1.0 kB/s",
+            "b.nc": "500 bytes, 500 bytes/s",
+        }
+        assert display.progress.tasks[0].total == 4
+
+        display(metrics.FILES, 1, "https://tds.mock/a.nc")
+        display(metrics.FAILURES, 1, "https://tds.mock/b.nc")
+        display.refresh()
+        assert _infos(display) == {
+            "Total": "2/4 files (1 failed), 3.5 kB, 1.8 kB/s, ETA 0:00:02",
+            "c.nc": "500 bytes, 500 bytes/s",
+        }
+
+        display(metrics.SKIPPED, 1, "https://tds.mock/d.nc")
+        display(metrics.FILES, 1, "https://tds.mock/c.nc")
+
+    assert _infos(display) == {"Total": "4/4 files (1 failed), 3.5 kB, 1.8 kB/s"}
+    assert display.progress.tasks[0].completed == 4
+
+
+def test_download_progress_refresh():
+    console = _console()
+    display = DownloadProgress(console, refresh_per_second=1000)
+    with display:
+        display(metrics.BYTES, 10, "https://tds.mock/a.nc")
+        time.sleep(0.05)
+
+    assert "Total" in console.file.getvalue()
+    assert "0/? files" in console.file.getvalue()
+
+
+def test_download_progress_no_time(mocker):
+    mocker.patch(
+        "altimetry_downloader_aviso.progress.time.monotonic", return_value=100.0
+    )
+    display = DownloadProgress(_console(), refresh_per_second=1e-3)
+    with display:
+        display(metrics.BYTES, 10, "https://tds.mock/a.nc")
+
+    assert _infos(display)["a.nc"] == "10 bytes, -/s"
@@ -0,0 +1,193 @@
+import os
+import stat
+import threading
+
+import pytest
+
+from altimetry_downloader_aviso import metrics
+from altimetry_downloader_aviso.metrics import DownloadMetrics, Histogram
+from altimetry_downloader_aviso.prometheus import (
+    TextfileExporter,
+    format_metrics,
+    write_textfile,
+)
+
+
+@pytest.fixture
+def download_metrics(mocker):
+    mocker.patch(
+        "altimetry_downloader_aviso.prometheus.time.time", return_value=1735689600.5
+    )
+    m = DownloadMetrics()
+    m.histograms = {metrics.TRANSFER: Histogram(buckets=(0.5, 1.0, float("inf")))}
+    m.count(metrics.FILES, 2)
+    m.count(metrics.BYTES, 1024)
+    m.count("custom")
+    m.observe(metrics.TRANSFER, 0.25)
+    m.observe(metrics.TRANSFER, 2.0)
+    m.observe("custom", 0.1)
+    m.stop()
+    return m
+
+
+def test_format_metrics(download_metrics):
+    text = format_metrics(download_metrics, {"product": 'SWOT "L3"'}, running=True)
+    lines = text.splitlines()
+
+    assert "# TYPE aviso_downloader_files_total counter" in lines
+    assert 'aviso_downloader_files_total{product="SWOT \\"L3\\""} 2' in lines
+    assert 'aviso_downloader_bytes_total{product="SWOT \\"L3\\""} 1024' in lines
+    assert "# HELP aviso_downloader_custom_total custom count." in lines
+    assert "# TYPE aviso_downloader_transfer_seconds histogram" in lines
+    assert [line.split("{")[1] for line in lines if "transfer_seconds_b" in line] == [
+        'product="SWOT \\"L3\\"",le="0.5"} 1',
+        'product="SWOT \\"L3\\"",le="1"} 1',
+        'product="SWOT \\"L3\\"",le="+Inf"} 2',
+    ]
+    assert 'aviso_downloader_transfer_seconds_sum{product="SWOT \\"L3\\""} 2.25' in (
+        lines
+    )
+    assert "# HELP aviso_downloader_custom_seconds Duration of custom in seconds." in (
+        lines
+    )
+    assert 'aviso_downloader_running{product="SWOT \\"L3\\""} 1' in lines
+    assert 'aviso_downloader_success{product="SWOT \\"L3\\""} 0' in lines
+    assert not [line for line in lines if "last_success" in line]
+    assert (
+        'aviso_downloader_last_update_timestamp_seconds{product="SWOT \\"L3\\""} '
+        "1735689600.5"
+    ) in lines
+    assert text.endswith("\n")
+
+
+def test_format_metrics_no_labels(download_metrics):
+    lines = format_metrics(download_metrics).splitlines()
+    assert "aviso_downloader_files_total 2" in lines
+    assert "aviso_downloader_running 0" in lines
+
+
+def test_format_metrics_success(download_metrics):
+    lines = format_metrics(download_metrics, success=True).splitlines()
+    assert "aviso_downloader_success 1" in lines
+    assert "aviso_downloader_last_success_timestamp_seconds 1735689600.5" in lines
+
+
+def test_write_textfile(download_metrics, tmp_path):
+    tmp_path = tmp_path / "textfiles"
+    tmp_path.mkdir()
+    path = tmp_path / "aviso.prom"
+    write_textfile(download_metrics, path)
+
+    assert "aviso_downloader_files_total 2" in path.read_text()
+    assert stat.S_IMODE(path.stat().st_mode) == 0o644
+    assert os.listdir(tmp_path) == ["aviso.prom"]
+
+
+def test_write_textfile_error(mocker, download_metrics, tmp_path):
+    mocker.patch(
+        "altimetry_downloader_aviso.prometheus.os.replace",
+        side_effect=OSError("read-only"),
+    )
+    tmp_path = tmp_path / "textfiles"
+    tmp_path.mkdir()
+    with pytest.raises(OSError):
+        write_textfile(download_metrics, tmp_path / "aviso.prom")
+    assert os.listdir(tmp_path) == []
+
+
+def test_textfile_exporter(mocker, tmp_path, caplog):
+    path = tmp_path / "aviso.prom"
+    m = DownloadMetrics()
+    written = threading.Event()
+    write = mocker.patch(
+        "altimetry_downloader_aviso.prometheus.write_textfile",
+        side_effect=_side_effects(OSError("disk full"), written.set),
+    )
+
+    with TextfileExporter(m, path, interval=0.01, labels={"product": "SWOT"}):
+        assert written.wait(5)
+
+    assert "Cannot write the metrics" in caplog.text
+    assert write.call_args_list[0] == mocker.call(
+        m, path, {"product": "SWOT"}, running=True
+    )
+    # Final export
+    assert write.call_args == mocker.call(m, path, {"product": "SWOT"}, success=True)
+
+
+def test_textfile_exporter_failed_run(tmp_path):
+    path = tmp_path / "aviso.prom"
+
+    with pytest.raises(RuntimeError, match="crash"):
+        with TextfileExporter(DownloadMetrics(), path, interval=60):
+            raise RuntimeError("crash")
+
+    lines = path.read_text().splitlines()
+    assert "aviso_downloader_success 0" in lines
+    assert not [line for line in lines if "last_success" in line]
+
+
+@pytest.mark.parametrize("counter", [metrics.FAILURES, metrics.ERRORS])
+def test_textfile_exporter_failures(mocker, tmp_path, counter):
+    path = tmp_path / "aviso.prom"
+    mocker.patch(
+        "altimetry_downloader_aviso.prometheus.time.time", return_value=1735689600
+    )
+    with TextfileExporter(DownloadMetrics(), path, interval=60):
+        pass
+    success_line = "aviso_downloader_last_success_timestamp_seconds 1735689600"
+    assert success_line in path.read_text().splitlines()
+
+    # A run with failed downloads or stopped by an error is not a success, and
+    # keeps the time of the previous success
+    mocker.patch(
+        "altimetry_downloader_aviso.prometheus.time.time", return_value=1735693200
+    )
+    download_metrics = DownloadMetrics()
+    download_metrics.count(counter)
+    with TextfileExporter(download_metrics, path, interval=60):
+        pass
+    lines = path.read_text().splitlines()
+    assert "aviso_downloader_success 0" in lines
+    assert success_line in lines
+
+
+@pytest.mark.parametrize(
+    "text", ["", "aviso_downloader_last_success_timestamp_seconds abc\n"]
+)
+def test_write_textfile_invalid_last_success(download_metrics, tmp_path, text):
+    path = tmp_path / "aviso.prom"
+    path.write_text(text)
+    write_textfile(download_metrics, path)
+    assert "last_success" not in path.read_text()
+
+
+def test_textfile_exporter_final_write_error(mocker, tmp_path, caplog):
+    mocker.patch(
+        "altimetry_downloader_aviso.prometheus.write_textfile",
+        side_effect=OSError("disk full"),
+    )
+
+    # The error of the run is not hidden by the error of the export
+    with pytest.raises(RuntimeError, match="crash"):
+        with TextfileExporter(DownloadMetrics(), tmp_path / "aviso.prom", 60):
+            raise RuntimeError("crash")
+    assert "Cannot write the metrics" in caplog.text
+
+    # Without error in the run, the error of the export is raised
+    with pytest.raises(OSError, match="disk full"):
+        with TextfileExporter(DownloadMetrics(), tmp_path / "aviso.prom", 60):
+            pass
+
+
+def _side_effects(error, callback):
+    """First call raises error, the next ones call callback."""
+    calls = []
+
+    def side_effect(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise error
+        callback()
+
+    return side_effect
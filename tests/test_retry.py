@@ -0,0 +1,103 @@
+import pytest
+
+from altimetry_downloader_aviso.retry import (
+    MAX_BACKOFF,
+    CircuitBreaker,
+    decorrelated_jitter,
+    is_retryable_status,
+    parse_retry_after,
+)
+
+
+@pytest.fixture
+def clock(mocker):
+    now = [1000.0]
+    mocker.patch(
+        "altimetry_downloader_aviso.retry.time.monotonic", side_effect=lambda: now[0]
+    )
+
+    def fake_sleep(seconds):
+        now[0] += seconds
+
+    return now, mocker.patch(
+        "altimetry_downloader_aviso.retry.time.sleep", side_effect=fake_sleep
+    )
+
+
+@pytest.mark.parametrize(
+    "status_code, expected",
+    [(200, True), (401, False), (404, False), (429, True), (500, True), (503, True)],
+)
+def test_is_retryable_status(status_code, expected):
+    assert is_retryable_status(status_code) == expected
+
+
+def test_decorrelated_jitter(mocker):
+    uniform = mocker.patch(
+        "altimetry_downloader_aviso.retry.random.uniform", side_effect=lambda a, b: b
+    )
+
+    assert decorrelated_jitter(1, 1) == 3
+    assert decorrelated_jitter(1, 3) == 9
+    assert decorrelated_jitter(1, 1000) == MAX_BACKOFF
+    uniform.assert_called_with(1, 3000)
+
+    uniform.side_effect = None
+    uniform.return_value = 0
+    assert decorrelated_jitter(0, 0) == 0
+
+
+def test_parse_retry_after(mocker):
+    mocker.patch("altimetry_downloader_aviso.retry.time.time", return_value=1735689600)
+
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("120") == 120
+    assert parse_retry_after("-1") == 0
+    assert parse_retry_after("Wed, 01 Jan 2025 00:01:00 GMT") == 60
+    assert parse_retry_after("Tue, 31 Dec 2024 00:00:00 GMT") == 0
+    assert parse_retry_after("soon") is None
+
+
+def test_circuit_breaker(clock, caplog):
+    now, sleep = clock
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    url = "https://tds.mock/a.nc"
+
+    breaker.record_failure(url)
+    assert breaker.remaining(url) == 0
+
+    breaker.record_success(url)
+    breaker.record_failure(url)
+    assert breaker.remaining(url) == 0
+
+    breaker.record_failure(url)
+    assert breaker.remaining(url) == 30
+    # Other hosts are not paused
+    assert breaker.remaining("https://other.mock/a.nc") == 0
+    assert "Pause the requests to tds.mock for 30 s" in caplog.text
+
+    breaker.wait("https://tds.mock/b.nc")
+    assert now[0] == 1030
+    sleep.assert_called_once_with(30)
+
+    # Half open: the next failure reopens the circuit
+    breaker.record_failure(url)
+    assert breaker.remaining(url) == 30
+
+    breaker.record_success(url)
+    now[0] += 30
+    breaker.record_failure(url)
+    assert breaker.remaining(url) == 0
+
+
+def test_circuit_breaker_pause(clock, caplog):
+    breaker = CircuitBreaker()
+    url = "https://tds.mock/a.nc"
+
+    breaker.pause(url, 10)
+    breaker.pause(url, 5)
+    assert breaker.remaining(url) == 10
+
+    breaker.pause(url, 20)
+    assert breaker.remaining(url) == 20
+    assert caplog.text.count("Pause the requests") == 1
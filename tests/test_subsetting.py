@@ -0,0 +1,58 @@
+import pandas as pd
+import pytest
+
+from altimetry_downloader_aviso.subsetting import (
+    check_subset,
+    subset_granules,
+    subset_url,
+)
+
+
+@pytest.mark.parametrize(
+    "variables, bbox",
+    [
+        ([], None),
+        ("ssha", None),
+        (None, (0, 10, 20)),
+        (None, (0, 10, 20, 5)),
+        (None, (0, -95, 20, 10)),
+        (None, (0, 10, 20, 95)),
+    ],
+)
+def test_check_subset_invalid(variables, bbox):
+    with pytest.raises(ValueError):
+        check_subset(variables, bbox)
+
+
+def test_subset_url():
+    url = "https://tds.mock/thredds/ncss/grid/a.nc"
+
+    assert (
+        subset_url(url, ["time", "ssha"]) == f"{url}?var=time&var=ssha&accept=netcdf4"
+    )
+    assert subset_url(url, bbox=(-10.5, 30, 10, 50)) == (
+        f"{url}?var=all&north=50&south=30&east=10&west=-10.5&accept=netcdf4"
+    )
+
+
+def test_subset_granules():
+    granules = pd.DataFrame(
+        {
+            "filename": ["https://tds.mock/a.nc", "https://tds.mock/b.nc"],
+            "ncss": ["https://tds.mock/ncss/a.nc", None],
+        }
+    )
+
+    with pytest.warns(UserWarning, match="1 of 2 granules"):
+        subset = subset_granules(granules, ["ssha"])
+
+    assert list(subset.filename) == [
+        "https://tds.mock/ncss/a.nc?var=ssha&accept=netcdf4",
+        "https://tds.mock/b.nc",
+    ]
+    # The input is not modified
+    assert granules.filename[0] == "https://tds.mock/a.nc"
+
+    with pytest.warns(UserWarning, match="2 of 2 granules"):
+        subset = subset_granules(granules[["filename"]], ["ssha"])
+    assert list(subset.filename) == list(granules.filename)
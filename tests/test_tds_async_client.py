@@ -0,0 +1,382 @@
+import asyncio
+import hashlib
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import altimetry_downloader_aviso.tds_async_client
+from altimetry_downloader_aviso import metrics
+from altimetry_downloader_aviso.retry import CircuitBreaker
+from altimetry_downloader_aviso.tds_async_client import (
+    http_bulk_download_async,
+    http_single_download_async,
+    http_single_download_with_retries_async,
+)
+
+FILES = {"a.nc": b"0123456789", "b.nc": b"abcdefghij", "c.nc": b"ABCDEFGHIJ"}
+
+ETAG = '"v1"'
+
+REQUESTS = web.AppKey("requests", list)
+
+
+async def _handler(request):
+    request.app[REQUESTS].append((request.path, request.headers.get("Range")))
+    if request.match_info["name"] == "busy.nc":
+        raise web.HTTPServiceUnavailable(headers={"Retry-After": "7"})
+    data = FILES.get(request.match_info["name"])
+    if data is None:
+        raise web.HTTPNotFound()
+
+    range_header = request.headers.get("Range")
+    if range_header is None or request.headers.get("If-Range", ETAG) != ETAG:
+        return web.Response(body=data, headers={"ETag": ETAG})
+
+    start = int(range_header.removeprefix("bytes=").rstrip("-"))
+    if start >= len(data):
+        return web.Response(
+            status=416, headers={"Content-Range": f"bytes */{len(data)}"}
+        )
+    return web.Response(
+        status=206,
+        body=data[start:],
+        headers={"Content-Range": f"bytes {start}-{len(data) - 1}/{len(data)}"},
+    )
+
+
+def _run(coroutine_function, *args):
+    """Run a coroutine against a local test server."""
+
+    async def main():
+        app = web.Application()
+        app[REQUESTS] = []
+        app.router.add_get("/{name}", _handler)
+        async with TestServer(app) as server:
+            async with aiohttp.ClientSession() as session:
+                base_url = str(server.make_url(""))
+                return (
+                    await coroutine_function(base_url, session, *args),
+                    app[REQUESTS],
+                )
+
+    return asyncio.run(main())
+
+
+def test_http_single_download_async(tmp_path):
+    async def download(base_url, session):
+        first = await http_single_download_async(f"{base_url}/a.nc", tmp_path, session)
+        second = await http_single_download_async(f"{base_url}/a.nc", tmp_path, session)
+        return first, second
+
+    (first, second), requests = _run(download)
+
+    assert first == str(tmp_path / "a.nc")
+    assert second is None
+    assert (tmp_path / "a.nc").read_bytes() == b"0123456789"
+    assert not (tmp_path / "a.nc.part").exists()
+    assert not (tmp_path / "a.nc.part.validator").exists()
+    assert requests == [("/a.nc", None)]
+
+
+def test_http_single_download_async_validator(mocker, tmp_path):
+    async def download(base_url, session):
+        return await http_single_download_async(f"{base_url}/a.nc", tmp_path, session)
+
+    mocker.patch(
+        "altimetry_downloader_aviso.tds_async_client._complete_download",
+        side_effect=aiohttp.ClientPayloadError("interrupted"),
+    )
+    with pytest.raises(aiohttp.ClientPayloadError):
+        _run(download)
+
+    assert (tmp_path / "a.nc.part.validator").read_text() == ETAG
+
+
+@pytest.mark.parametrize("partial", [b"01234", b"0123456789"])
+def test_http_single_download_async_resume(tmp_path, partial):
+    (tmp_path / "a.nc.part").write_bytes(partial)
+    (tmp_path / "a.nc.part.validator").write_text(ETAG)
+
+    async def download(base_url, session):
+        return await http_single_download_async(
+            f"{base_url}/a.nc", tmp_path, session, overwrite=True, chunk_size=2
+        )
+
+    result, requests = _run(download)
+
+    assert result == str(tmp_path / "a.nc")
+    assert (tmp_path / "a.nc").read_bytes() == b"0123456789"
+    assert requests == [("/a.nc", f"bytes={len(partial)}-")]
+
+
+def test_http_single_download_async_resume_changed(tmp_path):
+    (tmp_path / "a.nc.part").write_bytes(b"98765")
+    (tmp_path / "a.nc.part.validator").write_text('"v0"')
+
+    async def download(base_url, session):
+        return await http_single_download_async(f"{base_url}/a.nc", tmp_path, session)
+
+    _run(download)
+
+    assert (tmp_path / "a.nc").read_bytes() == b"0123456789"
+
+
+@pytest.mark.parametrize("partial", [None, b"01234", b"0123456789"])
+def test_http_single_download_async_checksum(tmp_path, partial):
+    if partial is not None:
+        (tmp_path / "a.nc.part").write_bytes(partial)
+        (tmp_path / "a.nc.part.validator").write_text(ETAG)
+
+    async def download(base_url, session):
+        return await http_single_download_async(
+            f"{base_url}/a.nc", tmp_path, session, chunk_size=3, checksum="sha256"
+        )
+
+    result, _ = _run(download)
+
+    digest = hashlib.sha256(b"0123456789").hexdigest()
+    assert result.digest == digest
+    assert (tmp_path / "a.nc.sha256").read_text() == f"{digest}  a.nc\n"
+
+
+def test_http_single_download_async_invalid_part(tmp_path):
+    (tmp_path / "a.nc.part").write_bytes(b"0123456789ABC")
+    (tmp_path / "a.nc.part.validator").write_text(ETAG)
+
+    async def download(base_url, session):
+        return await http_single_download_async(f"{base_url}/a.nc", tmp_path, session)
+
+    with pytest.raises(aiohttp.ClientResponseError):
+        _run(download)
+
+    assert not (tmp_path / "a.nc.part").exists()
+    assert not (tmp_path / "a.nc.part.validator").exists()
+    assert not (tmp_path / "a.nc").exists()
+
+
+def test_http_single_download_with_retries_async(mocker, tmp_path):
+    mock_sleep = mocker.patch(
+        "altimetry_downloader_aviso.tds_async_client.asyncio.sleep"
+    )
+    mocker.patch(
+        "altimetry_downloader_aviso.retry.random.uniform", side_effect=lambda a, b: b
+    )
+
+    async def download(base_url, session):
+        return await http_single_download_with_retries_async(
+            f"{base_url}/busy.nc", tmp_path, session, retries=3, backoff=2
+        )
+
+    with pytest.raises(aiohttp.ClientResponseError) as exc_info:
+        _run(download)
+
+    assert exc_info.value.status == 503
+    # The Retry-After delay extends the first waiting time
+    mock_sleep.assert_has_calls([mocker.call(7), mocker.call(21)])
+
+
+def test_http_single_download_with_retries_async_invalid_url(mocker, tmp_path):
+    mock_download = mocker.patch(
+        "altimetry_downloader_aviso.tds_async_client.http_single_download_async",
+        side_effect=aiohttp.InvalidURL("x.com/a.nc"),
+    )
+
+    with pytest.raises(aiohttp.InvalidURL):
+        asyncio.run(
+            http_single_download_with_retries_async("x.com/a.nc", tmp_path, None)
+        )
+
+    assert mock_download.call_count == 1
+
+
+def test_http_single_download_with_retries_async_not_retryable(mocker, tmp_path):
+    mock_download = mocker.spy(
+        altimetry_downloader_aviso.tds_async_client, "http_single_download_async"
+    )
+
+    async def download(base_url, session):
+        return await http_single_download_with_retries_async(
+            f"{base_url}/missing.nc", tmp_path, session, retries=3, backoff=0
+        )
+
+    with pytest.raises(aiohttp.ClientResponseError):
+        _run(download)
+
+    assert mock_download.call_count == 1
+
+
+def test_http_single_download_with_retries_async_breaker(mocker, tmp_path):
+    now = [0.0]
+    mocker.patch(
+        "altimetry_downloader_aviso.retry.time.monotonic", side_effect=lambda: now[0]
+    )
+
+    async def fake_sleep(seconds):
+        now[0] += seconds
+
+    mock_sleep = mocker.patch(
+        "altimetry_downloader_aviso.tds_async_client.asyncio.sleep",
+        side_effect=fake_sleep,
+    )
+    mocker.patch(
+        "altimetry_downloader_aviso.tds_async_client.http_single_download_async",
+        side_effect=[
+            aiohttp.ServerDisconnectedError(),
+            aiohttp.ClientResponseError(
+                mocker.Mock(), (), status=429, headers={"Retry-After": "5"}
+            ),
+            "/tmp/a.nc",
+        ],
+    )
+    circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+
+    result = asyncio.run(
+        http_single_download_with_retries_async(
+            "https://x.com/a.nc",
+            tmp_path,
+            None,
+            backoff=0,
+            circuit_breaker=circuit_breaker,
+        )
+    )
+
+    assert result == "/tmp/a.nc"
+    # The circuit opened after the first failure: the retry waited for it to
+    # close. The second retry waited for the Retry-After delay, then for the
+    # reopened circuit to close
+    assert [c.args[0] for c in mock_sleep.call_args_list if c.args[0]] == [30, 5, 25]
+
+
+def test_http_bulk_download_async(tmp_path):
+    async def download(base_url, session):
+        urls = [f"{base_url}/{name}" for name in ["a.nc", "missing.nc", "b.nc", "c.nc"]]
+        return [
+            path
+            async for path in http_bulk_download_async(
+                iter(urls),
+                tmp_path / "out",
+                retries=1,
+                max_concurrency=2,
+                session=session,
+            )
+        ]
+
+    with pytest.warns(UserWarning) as record, metrics.collect() as download_metrics:
+        results, _ = _run(download)
+
+    assert sorted(results) == [str(tmp_path / "out" / f) for f in FILES]
+    for name, data in FILES.items():
+        assert (tmp_path / "out" / name).read_bytes() == data
+
+    assert len(record) == 1
+    assert "Failed to download" in str(record[0].message)
+    assert "missing.nc" in str(record[0].message)
+
+    assert download_metrics.counters[metrics.FILES] == 3
+    assert download_metrics.counters[metrics.BYTES] == 30
+    assert download_metrics.counters[metrics.FAILURES] == 1
+    assert download_metrics.histograms[metrics.TRANSFER].count == 3
+
+
+def test_http_single_download_with_retries_async_metrics(mocker, tmp_path):
+    mocker.patch("altimetry_downloader_aviso.tds_async_client.asyncio.sleep")
+
+    async def download(base_url, session):
+        await http_single_download_with_retries_async(
+            f"{base_url}/a.nc", tmp_path, session
+        )
+        await http_single_download_with_retries_async(
+            f"{base_url}/a.nc", tmp_path, session
+        )
+        with pytest.raises(aiohttp.ClientResponseError):
+            await http_single_download_with_retries_async(
+                f"{base_url}/busy.nc", tmp_path, session, retries=2, backoff=0
+            )
+
+    with metrics.collect() as download_metrics:
+        _run(download)
+
+    assert download_metrics.counters[metrics.FILES] == 1
+    assert download_metrics.counters[metrics.SKIPPED] == 1
+    assert download_metrics.counters[metrics.RETRIES] == 1
+    assert download_metrics.counters[metrics.FAILURES] == 1
+
+
+def test_http_bulk_download_async_own_session(mocker, tmp_path):
+    mock_download = mocker.patch(
+        "altimetry_downloader_aviso.tds_async_client.http_single_download_async",
+        side_effect=lambda url, *_: url,
+    )
+
+    async def download():
+        return [
+            path
+            async for path in http_bulk_download_async(
+                ["https://x.com/a.nc", "https://x.com/b.nc"], tmp_path
+            )
+        ]
+
+    results = asyncio.run(download())
+
+    assert sorted(results) == ["https://x.com/a.nc", "https://x.com/b.nc"]
+    session = mock_download.call_args.args[2]
+    assert session.headers["Authorization"] == "Basic dGVzdHVzZXI6dGVzdHBhc3M="
+    # Large granules may take longer than any total timeout
+    assert session.timeout.total is None
+    assert session.timeout.sock_read is not None
+    assert session.closed
+
+
+@pytest.mark.parametrize(
+    "kwargs, match",
+    [
+        ({"chunk_size": 0}, "Invalid chunk size"),
+        ({"checksum": "crc32"}, "Unsupported checksum algorithm"),
+    ],
+)
+def test_http_bulk_download_async_bad_arguments(tmp_path, kwargs, match):
+    async def download():
+        return [
+            path
+            async for path in http_bulk_download_async(
+                ["https://x.com/a.nc"], tmp_path, **kwargs
+            )
+        ]
+
+    with pytest.raises(ValueError, match=match):
+        asyncio.run(download())
+
+
+def test_http_bulk_download_async_early_stop(mocker, tmp_path):
+    cancelled = []
+
+    async def fake_download(url, *_):
+        if url.endswith("a.nc"):
+            return url
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(url)
+            raise
+
+    mocker.patch(
+        "altimetry_downloader_aviso.tds_async_client.http_single_download_async",
+        side_effect=fake_download,
+    )
+
+    async def download():
+        downloads = http_bulk_download_async(
+            ["https://x.com/a.nc", "https://x.com/b.nc"],
+            tmp_path,
+            session=mocker.Mock(),
+        )
+        first = await anext(downloads)
+        await downloads.aclose()
+        # The cancelled downloads are awaited
+        assert cancelled == ["https://x.com/b.nc"]
+        return first
+
+    assert asyncio.run(download()) == "https://x.com/a.nc"
+    assert cancelled == ["https://x.com/b.nc"]
@@ -1,19 +1,34 @@
+import hashlib
 import logging
 import os
+import threading
+import time
 
 import pytest
 import requests
 
+from altimetry_downloader_aviso import metrics
+from altimetry_downloader_aviso.concurrency import AdaptiveConcurrency, ByteBudget
+from altimetry_downloader_aviso.retry import MAX_BACKOFF, CircuitBreaker
 from altimetry_downloader_aviso.tds_client import (
+    MAX_CHUNK_SIZE,
+    create_session,
     http_bulk_download,
     http_bulk_download_parallel,
+    http_bulk_fetch,
+    http_fetch,
     http_single_download,
     http_single_download_with_retries,
+    local_file_is_up_to_date,
+    url_filename,
 )
 
 # coverage run --source=altimetry_downloader_aviso  -m pytest
 # coverage report -m
 
+LAST_MODIFIED = "Wed, 01 Jan 2025 00:00:00 GMT"
+LAST_MODIFIED_TIMESTAMP = 1735689600
+
 
 def test_http_single_download_success(mocker, tmp_path):
     url = "https://example.com/file.txt"
@@ -21,24 +36,34 @@ def test_http_single_download_success(mocker, tmp_path):
     expected_path = tmp_path / filename
 
     mock_response = mocker.Mock()
+    mock_response.headers = {}
     fake_data = b"dummy data"
-    mock_response.content = fake_data
+    mock_response.iter_content.return_value = [b"dummy", b" data"]
     mock_response.raise_for_status = mocker.Mock()
 
-    mocker.patch("requests.get", return_value=mock_response)
+    mock_get = mocker.patch("requests.get", return_value=mock_response)
 
     mocker.patch(
         "altimetry_downloader_aviso.auth.ensure_credentials",
         return_value=("user", "pass"),
     )
 
-    result_path = http_single_download(url, tmp_path)
+    with metrics.collect() as download_metrics:
+        result_path = http_single_download(url, tmp_path, chunk_size=5)
+        assert not http_single_download(url, tmp_path)
+
+    assert download_metrics.counters[metrics.BYTES] == len(fake_data)
+    assert download_metrics.counters[metrics.SKIPPED] == 1
 
     assert os.path.exists(result_path)
     assert result_path == str(expected_path)
     with open(result_path, "rb") as f:
         assert f.read() == fake_data
 
+    assert mock_get.call_args.kwargs["stream"]
+    mock_response.iter_content.assert_called_with(chunk_size=5)
+    mock_response.close.assert_called()
+
     result_path = http_single_download(url, tmp_path)
     assert not result_path
 
@@ -48,6 +73,451 @@ def test_http_single_download_success(mocker, tmp_path):
         assert f.read() == fake_data
 
 
+def test_http_single_download_session(mocker, tmp_path, mock_session_get):
+    mock_get = mocker.patch("requests.get")
+    session = create_session(username="user", password="pass")
+
+    result_path = http_single_download(
+        "https://example.com/file.txt", tmp_path, session=session
+    )
+
+    assert result_path == str(tmp_path / "file.txt")
+    mock_get.assert_not_called()
+    mock_session_get.assert_called_once()
+
+
+def _range_response(mocker, status_code, chunks=(), content_range=None):
+    response = mocker.Mock()
+    response.status_code = status_code
+    response.headers = {"Content-Range": content_range} if content_range else {}
+    response.iter_content.return_value = list(chunks)
+    if status_code >= 400:
+        response.raise_for_status.side_effect = requests.exceptions.HTTPError(
+            f"{status_code} Client Error"
+        )
+    return response
+
+
+def test_http_single_download_part_file(mocker, tmp_path):
+    def interrupted_stream(chunk_size):
+        assert (tmp_path / "file.txt.part").exists()
+        yield b"dummy"
+        raise requests.exceptions.ConnectionError("Connection reset")
+
+    response = _range_response(mocker, 200)
+    response.headers = {"ETag": '"v1"', "Last-Modified": LAST_MODIFIED}
+    response.iter_content.side_effect = interrupted_stream
+    mocker.patch("requests.get", return_value=response)
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        http_single_download("https://example.com/file.txt", tmp_path)
+
+    assert not (tmp_path / "file.txt").exists()
+    assert (tmp_path / "file.txt.part").read_bytes() == b"dummy"
+    assert (tmp_path / "file.txt.part.validator").read_text() == '"v1"'
+
+
+@pytest.mark.parametrize(
+    "headers, validator",
+    [
+        ({"ETag": '"v1"', "Last-Modified": LAST_MODIFIED}, '"v1"'),
+        # Weak ETags cannot be used in If-Range
+        ({"ETag": 'W/"v1"', "Last-Modified": LAST_MODIFIED}, LAST_MODIFIED),
+        ({"Last-Modified": LAST_MODIFIED}, LAST_MODIFIED),
+        ({}, None),
+    ],
+)
+def test_http_single_download_part_file_validator(mocker, tmp_path, headers, validator):
+    (tmp_path / "file.txt.part.validator").write_text("stale")
+    response = _range_response(mocker, 200)
+    response.headers = headers
+    response.iter_content.side_effect = requests.exceptions.ConnectionError
+    mocker.patch("requests.get", return_value=response)
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        http_single_download("https://example.com/file.txt", tmp_path)
+
+    validator_filepath = tmp_path / "file.txt.part.validator"
+    if validator is None:
+        assert not validator_filepath.exists()
+    else:
+        assert validator_filepath.read_text() == validator
+
+
+@pytest.mark.parametrize(
+    "response_args, expected",
+    [
+        ((206, [b" data"], "bytes 5-9/10"), b"dummy data"),
+        # The server ignores the Range header, or the remote file changed
+        ((200, [b"other data"]), b"other data"),
+        # The partial file is already complete
+        ((416, [], "bytes */5"), b"dummy"),
+    ],
+)
+def test_http_single_download_resume(mocker, tmp_path, response_args, expected):
+    (tmp_path / "file.txt.part").write_bytes(b"dummy")
+    (tmp_path / "file.txt.part.validator").write_text('"v1"')
+    mock_get = mocker.patch(
+        "requests.get", return_value=_range_response(mocker, *response_args)
+    )
+
+    result_path = http_single_download("https://example.com/file.txt", tmp_path)
+
+    assert mock_get.call_args.kwargs["headers"] == {
+        "Range": "bytes=5-",
+        "If-Range": '"v1"',
+    }
+    assert result_path == str(tmp_path / "file.txt")
+    assert (tmp_path / "file.txt").read_bytes() == expected
+    assert not (tmp_path / "file.txt.part").exists()
+    assert not (tmp_path / "file.txt.part.validator").exists()
+
+
+@pytest.mark.parametrize("part, validator", [(b"dummy", None), (b"", '"v1"')])
+def test_http_single_download_resume_restart(mocker, tmp_path, part, validator):
+    (tmp_path / "file.txt.part").write_bytes(part)
+    if validator is not None:
+        (tmp_path / "file.txt.part.validator").write_text(validator)
+    mock_get = mocker.patch(
+        "requests.get", return_value=_range_response(mocker, 200, [b"other data"])
+    )
+
+    http_single_download("https://example.com/file.txt", tmp_path)
+
+    assert mock_get.call_args.kwargs["headers"] == {}
+    assert (tmp_path / "file.txt").read_bytes() == b"other data"
+
+
+@pytest.mark.parametrize(
+    "response_args",
+    [(416, [], "bytes */3"), (416, []), (206, [b"data"], "bytes 0-3/4")],
+)
+def test_http_single_download_resume_invalid_part(mocker, tmp_path, response_args):
+    (tmp_path / "file.txt.part").write_bytes(b"dummy")
+    (tmp_path / "file.txt.part.validator").write_text('"v1"')
+    mocker.patch("requests.get", return_value=_range_response(mocker, *response_args))
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        http_single_download("https://example.com/file.txt", tmp_path)
+
+    assert not (tmp_path / "file.txt").exists()
+    assert not (tmp_path / "file.txt.part").exists()
+    assert not (tmp_path / "file.txt.part.validator").exists()
+
+
+def _fake_range_server(mocker, data: bytes, fail_range: str = None):
+    def fake_get(url, headers, **kwargs):
+        start, end = map(int, headers["Range"].removeprefix("bytes=").split("-"))
+        if headers["Range"] == fail_range:
+            return _range_response(mocker, 503)
+        return _range_response(
+            mocker,
+            206,
+            [data[start:][: end - start + 1]],
+            f"bytes {start}-{end}/{len(data)}",
+        )
+
+    return fake_get
+
+
+@pytest.mark.parametrize("segments", [2, 3, 20])
+def test_http_single_download_segments(mocker, tmp_path, segments):
+    data = b"0123456789"
+    head_response = _range_response(mocker, 200)
+    head_response.headers = {"Accept-Ranges": "bytes", "Content-Length": "10"}
+    mock_head = mocker.patch("requests.head", return_value=head_response)
+    mock_get = mocker.patch(
+        "requests.get", side_effect=_fake_range_server(mocker, data)
+    )
+
+    with metrics.collect() as download_metrics:
+        result_path = http_single_download(
+            "https://example.com/file.txt", tmp_path, segments=segments
+        )
+
+    assert result_path == str(tmp_path / "file.txt")
+    assert (tmp_path / "file.txt").read_bytes() == data
+    assert download_metrics.counters[metrics.BYTES] == len(data)
+    assert not (tmp_path / "file.txt.part").exists()
+    mock_head.assert_called_once()
+    assert mock_get.call_count == min(segments, len(data))
+
+
+def test_http_single_download_segments_no_ranges(mocker, tmp_path):
+    head_response = _range_response(mocker, 200)
+    head_response.headers = {"Content-Length": "10"}
+    mocker.patch("requests.head", return_value=head_response)
+    mock_get = mocker.patch(
+        "requests.get", return_value=_range_response(mocker, 200, [b"0123456789"])
+    )
+
+    http_single_download("https://example.com/file.txt", tmp_path, segments=4)
+
+    assert (tmp_path / "file.txt").read_bytes() == b"0123456789"
+    assert mock_get.call_args.kwargs["headers"] == {}
+
+
+def test_http_single_download_segments_resume_part(mocker, tmp_path):
+    (tmp_path / "file.txt.part").write_bytes(b"01234")
+    (tmp_path / "file.txt.part.validator").write_text(LAST_MODIFIED)
+    mock_head = mocker.patch("requests.head")
+    mocker.patch(
+        "requests.get",
+        return_value=_range_response(mocker, 206, [b"56789"], "bytes 5-9/10"),
+    )
+
+    http_single_download("https://example.com/file.txt", tmp_path, segments=4)
+
+    assert (tmp_path / "file.txt").read_bytes() == b"0123456789"
+    mock_head.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "fake_get",
+    [
+        # One of the segments fails
+        lambda mocker: _fake_range_server(mocker, b"0123456789", "bytes=5-9"),
+        # The server sends the whole file, or the file changed (If-Range)
+        lambda mocker: lambda *_, **__: _range_response(mocker, 200, [b"0123456789"]),
+        # The server sends a truncated segment
+        lambda mocker: lambda *_, **__: _range_response(
+            mocker, 206, [b"01"], "bytes 0-4/10"
+        ),
+    ],
+)
+def test_http_single_download_segments_error(mocker, tmp_path, fake_get):
+    head_response = _range_response(mocker, 200)
+    head_response.headers = {"Accept-Ranges": "bytes", "Content-Length": "10"}
+    session = mocker.Mock()
+    session.head.return_value = head_response
+    session.get.side_effect = fake_get(mocker)
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        http_single_download(
+            "https://example.com/file.txt", tmp_path, segments=2, session=session
+        )
+
+    assert not (tmp_path / "file.txt").exists()
+    assert not (tmp_path / "file.txt.part").exists()
+
+
+def test_http_single_download_last_modified(mocker, tmp_path):
+    response = _range_response(mocker, 200, [b"0123456789"])
+    response.headers = {"Last-Modified": LAST_MODIFIED}
+    mocker.patch("requests.get", return_value=response)
+
+    result_path = http_single_download("https://example.com/file.txt", tmp_path)
+
+    assert os.stat(result_path).st_mtime == LAST_MODIFIED_TIMESTAMP
+
+
+def test_http_single_download_segments_if_range(mocker, tmp_path):
+    head_response = _range_response(mocker, 200)
+    head_response.headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Length": "10",
+        "ETag": '"v1"',
+    }
+    mocker.patch("requests.head", return_value=head_response)
+    mock_get = mocker.patch(
+        "requests.get", side_effect=_fake_range_server(mocker, b"0123456789")
+    )
+
+    http_single_download("https://example.com/file.txt", tmp_path, segments=2)
+
+    assert [c.kwargs["headers"]["If-Range"] for c in mock_get.call_args_list] == [
+        '"v1"',
+        '"v1"',
+    ]
+
+
+def test_http_single_download_segments_last_modified(mocker, tmp_path):
+    head_response = _range_response(mocker, 200)
+    head_response.headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Length": "10",
+        "Last-Modified": LAST_MODIFIED,
+    }
+    mocker.patch("requests.head", return_value=head_response)
+    mocker.patch("requests.get", side_effect=_fake_range_server(mocker, b"0123456789"))
+
+    result_path = http_single_download(
+        "https://example.com/file.txt", tmp_path, segments=2
+    )
+
+    assert os.stat(result_path).st_mtime == LAST_MODIFIED_TIMESTAMP
+
+
+@pytest.mark.parametrize(
+    "remote_headers, downloaded",
+    [
+        ({"Content-Length": "5", "Last-Modified": LAST_MODIFIED}, False),
+        ({}, False),
+        # Invalid dates are ignored
+        ({"Content-Length": "5", "Last-Modified": "yesterday"}, False),
+        ({"Content-Length": "7", "Last-Modified": LAST_MODIFIED}, True),
+        (
+            {"Content-Length": "5", "Last-Modified": "Wed, 01 Jan 2031 00:00:00 GMT"},
+            True,
+        ),
+    ],
+)
+def test_http_single_download_incremental(mocker, tmp_path, remote_headers, downloaded):
+    local_filepath = tmp_path / "file.txt"
+    local_filepath.write_bytes(b"dummy")
+    os.utime(local_filepath, (LAST_MODIFIED_TIMESTAMP, LAST_MODIFIED_TIMESTAMP))
+
+    head_response = _range_response(mocker, 200)
+    head_response.headers = remote_headers
+    mock_head = mocker.patch("requests.head", return_value=head_response)
+    mocker.patch(
+        "requests.get", return_value=_range_response(mocker, 200, [b"updated"])
+    )
+
+    result_path = http_single_download(
+        "https://example.com/file.txt", tmp_path, incremental=True
+    )
+
+    mock_head.assert_called_once()
+    assert (result_path is not None) == downloaded
+    assert local_filepath.read_bytes() == (b"updated" if downloaded else b"dummy")
+
+
+def test_http_single_download_incremental_segments(mocker, tmp_path):
+    (tmp_path / "file.txt").write_bytes(b"dummy")
+    head_response = _range_response(mocker, 200)
+    head_response.headers = {"Accept-Ranges": "bytes", "Content-Length": "10"}
+    session = mocker.Mock()
+    session.head.return_value = head_response
+    session.get.side_effect = _fake_range_server(mocker, b"0123456789")
+
+    http_single_download(
+        "https://example.com/file.txt",
+        tmp_path,
+        segments=2,
+        incremental=True,
+        session=session,
+    )
+
+    assert (tmp_path / "file.txt").read_bytes() == b"0123456789"
+    session.head.assert_called_once()
+
+
+def test_local_file_is_up_to_date(tmp_path):
+    path = tmp_path / "file.txt"
+    path.write_bytes(b"0" * 1000)
+    os.utime(path, (LAST_MODIFIED_TIMESTAMP, LAST_MODIFIED_TIMESTAMP))
+
+    assert local_file_is_up_to_date(path)
+    assert local_file_is_up_to_date(path, 1000, LAST_MODIFIED_TIMESTAMP)
+    assert local_file_is_up_to_date(str(path), remote_mtime=LAST_MODIFIED_TIMESTAMP - 1)
+    assert not local_file_is_up_to_date(path, remote_mtime=LAST_MODIFIED_TIMESTAMP + 1)
+    assert not local_file_is_up_to_date(path, 1001)
+    assert local_file_is_up_to_date(path, 1001, rel_tol=1e-3)
+
+
+def _sha256_record(data, name="file.txt"):
+    return f"{hashlib.sha256(data).hexdigest()}  {name}\n"
+
+
+@pytest.mark.parametrize(
+    "part, response_args",
+    [
+        (None, (200, [b"01234", b"56789"])),
+        (b"01234", (206, [b"567", b"89"], "bytes 5-9/10")),
+        (b"0123456789", (416, [], "bytes */10")),
+    ],
+)
+def test_http_single_download_checksum(mocker, tmp_path, part, response_args):
+    if part is not None:
+        (tmp_path / "file.txt.part").write_bytes(part)
+        (tmp_path / "file.txt.part.validator").write_text('"v1"')
+    mocker.patch("requests.get", return_value=_range_response(mocker, *response_args))
+
+    result_path = http_single_download(
+        "https://example.com/file.txt", tmp_path, checksum="sha256"
+    )
+
+    assert result_path == str(tmp_path / "file.txt")
+    assert result_path.digest == hashlib.sha256(b"0123456789").hexdigest()
+    assert (tmp_path / "file.txt.sha256").read_text() == _sha256_record(b"0123456789")
+
+
+def test_http_single_download_segments_checksum(mocker, tmp_path):
+    head_response = _range_response(mocker, 200)
+    head_response.headers = {"Accept-Ranges": "bytes", "Content-Length": "10"}
+    mocker.patch("requests.head", return_value=head_response)
+    mocker.patch("requests.get", side_effect=_fake_range_server(mocker, b"0123456789"))
+
+    result_path = http_single_download(
+        "https://example.com/file.txt", tmp_path, segments=3, checksum="md5"
+    )
+
+    digest = hashlib.md5(b"0123456789").hexdigest()
+    assert result_path.digest == digest
+    assert (tmp_path / "file.txt.md5").read_text() == f"{digest}  file.txt\n"
+
+
+def test_http_single_download_no_checksum(mocker, tmp_path):
+    mocker.patch("requests.get", return_value=_range_response(mocker, 200, [b"01"]))
+
+    result_path = http_single_download("https://example.com/file.txt", tmp_path)
+
+    assert result_path.digest is None
+    assert not list(tmp_path.glob("*.sha256"))
+
+
+# Algorithms which may be available, but not on every platform, are refused as
+# well, so that a checksum can be verified anywhere
+@pytest.mark.parametrize("checksum", ["crc32", "shake_128", "ripemd160"])
+def test_http_single_download_bad_checksum(mocker, tmp_path, checksum):
+    mock_get = mocker.patch("requests.get")
+
+    with pytest.raises(ValueError, match="Unsupported checksum algorithm"):
+        http_single_download(
+            "https://example.com/file.txt", tmp_path, checksum=checksum
+        )
+
+    with pytest.raises(ValueError, match="Unsupported checksum algorithm"):
+        list(
+            http_bulk_download(
+                ["https://example.com/file.txt"], tmp_path, checksum=checksum
+            )
+        )
+
+    with pytest.raises(ValueError, match="Unsupported checksum algorithm"):
+        list(
+            http_bulk_download_parallel(
+                ["https://example.com/file.txt"], tmp_path, checksum=checksum
+            )
+        )
+
+    mock_get.assert_not_called()
+
+
+def test_url_filename():
+    assert url_filename("https://x.com/fileServer/a.nc") == "a.nc"
+
+    # The subsets are stored apart from the whole file and from each other
+    subset = url_filename("https://x.com/ncss/a.nc?var=ssha&accept=netcdf4")
+    assert subset == "a.d1ac12f6.nc"
+    assert url_filename("https://x.com/ncss/a.nc?var=time&accept=netcdf4") not in {
+        subset,
+        "a.nc",
+    }
+
+
+def test_create_session():
+    session = create_session(pool_size=8, username="user", password="pass")
+
+    assert session.auth == ("user", "pass")
+    adapter = session.get_adapter("https://tds-odatis.aviso.altimetry.fr/thredds")
+    assert adapter._pool_maxsize == 8
+
+    session = create_session()
+    assert session.auth == ("testuser", "testpass")
+
+
 def test_http_single_download_error(mocker):
     bad_url = "https://bad_url.com/file.txt"
 
@@ -66,6 +536,32 @@ def test_http_single_download_error(mocker):
         http_single_download(bad_url, "/tmp_path")
 
 
+@pytest.mark.parametrize("chunk_size", [0, -1, MAX_CHUNK_SIZE + 1])
+def test_http_single_download_bad_chunk_size(mocker, tmp_path, chunk_size):
+    mock_get = mocker.patch("requests.get")
+
+    with pytest.raises(ValueError, match="Invalid chunk size"):
+        http_single_download(
+            "https://example.com/file.txt", tmp_path, chunk_size=chunk_size
+        )
+
+    with pytest.raises(ValueError, match="Invalid chunk size"):
+        list(
+            http_bulk_download(
+                ["https://example.com/file.txt"], tmp_path, chunk_size=chunk_size
+            )
+        )
+
+    with pytest.raises(ValueError, match="Invalid chunk size"):
+        list(
+            http_bulk_download_parallel(
+                ["https://example.com/file.txt"], tmp_path, chunk_size=chunk_size
+            )
+        )
+
+    mock_get.assert_not_called()
+
+
 def test_http_single_download_with_retries_success(mocker):
 
     url = "https://example.com/file.txt"
@@ -80,10 +576,24 @@ def test_http_single_download_with_retries_success(mocker):
         str(expected_path),
     ]
 
-    result_path = http_single_download_with_retries(url, tmp_path, retries=2, backoff=0)
+    with metrics.collect() as download_metrics:
+        result_path = http_single_download_with_retries(
+            url, tmp_path, retries=2, backoff=0
+        )
 
     assert result_path == str(expected_path)
     assert mock_download.call_count == 2
+    assert download_metrics.counters[metrics.RETRIES] == 1
+    assert download_metrics.counters[metrics.FILES] == 1
+    assert download_metrics.histograms[metrics.TRANSFER].count == 1
+
+    # Skipped downloads are not transfers
+    mock_download.side_effect = None
+    mock_download.return_value = None
+    with metrics.collect() as download_metrics:
+        assert http_single_download_with_retries(url, tmp_path) is None
+    assert download_metrics.counters[metrics.FILES] == 0
+    assert download_metrics.histograms[metrics.TRANSFER].count == 0
 
 
 def test_http_single_download_with_retries_backoff_timing(mocker, caplog):
@@ -94,13 +604,18 @@ def test_http_single_download_with_retries_backoff_timing(mocker, caplog):
     mock_download.side_effect = requests.exceptions.RequestException("fail")
 
     mock_sleep = mocker.patch("altimetry_downloader_aviso.tds_client.time.sleep")
+    # Draw the longest waiting time
+    mock_uniform = mocker.patch(
+        "altimetry_downloader_aviso.retry.random.uniform", side_effect=lambda a, b: b
+    )
 
     with pytest.raises(requests.exceptions.RequestException):
         with caplog.at_level(logging.DEBUG):
             http_single_download_with_retries(url, "/tmp_path", retries=3, backoff=2)
 
     assert mock_sleep.call_count == 2
-    mock_sleep.assert_has_calls([mocker.call(2), mocker.call(4)])
+    mock_sleep.assert_has_calls([mocker.call(6), mocker.call(18)])
+    mock_uniform.assert_has_calls([mocker.call(2, 6), mocker.call(2, 18)])
 
 
 def test_http_single_download_with_retries_fail_all(mocker):
@@ -110,8 +625,108 @@ def test_http_single_download_with_retries_fail_all(mocker):
         "altimetry_downloader_aviso.tds_client.http_single_download",
         side_effect=requests.exceptions.RequestException("Network fail"),
     )
+    with metrics.collect() as download_metrics:
+        with pytest.raises(requests.exceptions.RequestException):
+            http_single_download_with_retries(
+                bad_url, "/tmp_path", retries=3, backoff=0
+            )
+
+    assert download_metrics.counters[metrics.RETRIES] == 2
+    assert download_metrics.counters[metrics.FAILURES] == 1
+
+
+def _http_error(mocker, status_code, headers=None):
+    return requests.exceptions.HTTPError(
+        f"{status_code} Error",
+        response=mocker.Mock(status_code=status_code, headers=headers or {}),
+    )
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        lambda mocker: _http_error(mocker, 404),
+        lambda mocker: _http_error(mocker, 401),
+        lambda mocker: requests.exceptions.MissingSchema("No scheme"),
+    ],
+)
+def test_http_single_download_with_retries_not_retryable(mocker, error):
+    mock_download = mocker.patch(
+        "altimetry_downloader_aviso.tds_client.http_single_download",
+        side_effect=error(mocker),
+    )
+    mock_sleep = mocker.patch("altimetry_downloader_aviso.tds_client.time.sleep")
+
     with pytest.raises(requests.exceptions.RequestException):
-        http_single_download_with_retries(bad_url, "/tmp_path", retries=3, backoff=0)
+        http_single_download_with_retries("https://x.com/a.nc", "/tmp", retries=3)
+
+    assert mock_download.call_count == 1
+    mock_sleep.assert_not_called()
+
+
+def test_http_single_download_with_retries_retry_after(mocker):
+    mocker.patch(
+        "altimetry_downloader_aviso.tds_client.http_single_download",
+        side_effect=[
+            _http_error(mocker, 429, {"Retry-After": "20"}),
+            _http_error(mocker, 503, {"Retry-After": "1000"}),
+            "/tmp/a.nc",
+        ],
+    )
+    mocker.patch(
+        "altimetry_downloader_aviso.retry.random.uniform", side_effect=lambda a, b: a
+    )
+    mock_sleep = mocker.patch("altimetry_downloader_aviso.tds_client.time.sleep")
+    circuit_breaker = CircuitBreaker()
+    pause = mocker.spy(circuit_breaker, "pause")
+    mocker.patch.object(circuit_breaker, "wait")
+
+    result = http_single_download_with_retries(
+        "https://x.com/a.nc", "/tmp", 3, 1, circuit_breaker=circuit_breaker
+    )
+
+    assert result == "/tmp/a.nc"
+    mock_sleep.assert_has_calls([mocker.call(20), mocker.call(MAX_BACKOFF)])
+    assert pause.call_args_list == [
+        mocker.call("https://x.com/a.nc", 20),
+        mocker.call("https://x.com/a.nc", MAX_BACKOFF),
+    ]
+    assert circuit_breaker.wait.call_count == 3
+
+
+def test_http_single_download_with_retries_breaker(mocker):
+    mocker.patch(
+        "altimetry_downloader_aviso.tds_client.http_single_download",
+        side_effect=[
+            requests.exceptions.ConnectionError("Connection refused"),
+            "/tmp/a.nc",
+        ],
+    )
+    circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+
+    start = time.monotonic()
+    result = http_single_download_with_retries(
+        "https://x.com/a.nc", "/tmp", 2, 0, circuit_breaker=circuit_breaker
+    )
+
+    assert result == "/tmp/a.nc"
+    # The retry waited for the circuit to close
+    assert time.monotonic() - start >= 0.05
+
+
+def test_http_bulk_download_parallel_circuit_breaker(mocker):
+    mock_retry = mocker.patch(
+        "altimetry_downloader_aviso.tds_client.http_single_download_with_retries"
+    )
+    mock_retry.side_effect = lambda url, *_: f"/tmp/{url.split('/')[-1]}"
+
+    urls = ["https://x.com/a.txt", "https://x.com/b.txt"]
+    list(http_bulk_download_parallel(urls, "/tmp"))
+    list(http_bulk_download(urls, "/tmp"))
+
+    breakers = {c.args[-2] for c in mock_retry.call_args_list}
+    assert len(breakers) == 2
+    assert all(isinstance(b, CircuitBreaker) for b in breakers)
 
 
 def test_http_bulk_download_success_and_skip_fail(mocker):
@@ -126,8 +741,9 @@ def test_http_bulk_download_success_and_skip_fail(mocker):
 
     urls = ["https://a.com/1", "https://a.com/2", "https://a.com/3"]
 
+    on_failure = mocker.Mock()
     with pytest.warns(UserWarning) as record:
-        paths = list(http_bulk_download(urls, "/tmp"))
+        paths = list(http_bulk_download(urls, "/tmp", on_failure=on_failure))
 
     print(paths)
     assert paths == ["/tmp/file1.txt", "/tmp/file3.txt"]
@@ -135,6 +751,8 @@ def test_http_bulk_download_success_and_skip_fail(mocker):
 
     assert len(record) == 1
     assert "Failed to download https://a.com/2" in str(record[0].message)
+    on_failure.assert_called_once()
+    assert on_failure.call_args.args[0] == "https://a.com/2"
 
 
 def test_http_bulk_download_all_fail(mocker):
@@ -182,10 +800,16 @@ def test_http_bulk_download_parallel_partial_fail(mocker):
     )
     urls = ["https://x.com/ok1.txt", "https://x.com/fail.txt", "https://x.com/ok2.txt"]
 
+    on_failure = mocker.Mock()
     with pytest.warns(UserWarning) as record:
         results = list(
             http_bulk_download_parallel(
-                urls, "/tmp", retries=1, backoff=0, max_workers=3
+                urls,
+                "/tmp",
+                retries=1,
+                backoff=0,
+                max_workers=3,
+                on_failure=on_failure,
             )
         )
 
@@ -193,3 +817,268 @@ def test_http_bulk_download_parallel_partial_fail(mocker):
 
     assert len(record) == 1
     assert "Failed to download https://x.com/fail.txt" in str(record[0].message)
+    on_failure.assert_called_once()
+    assert on_failure.call_args.args[0] == "https://x.com/fail.txt"
+
+
+def test_http_bulk_download_shared_session(mocker):
+    mock_retry = mocker.patch(
+        "altimetry_downloader_aviso.tds_client.http_single_download_with_retries"
+    )
+    mock_retry.side_effect = lambda url, *_: f"/tmp/{url.split('/')[-1]}"
+    mock_close = mocker.patch("requests.Session.close")
+
+    urls = ["https://x.com/a.txt", "https://x.com/b.txt"]
+    results = list(http_bulk_download(urls, "/tmp"))
+
+    assert results == ["/tmp/a.txt", "/tmp/b.txt"]
+    sessions = {c.args[-1] for c in mock_retry.call_args_list}
+    assert len(sessions) == 1
+    assert isinstance(sessions.pop(), requests.Session)
+    mock_close.assert_called_once()
+
+
+def test_http_bulk_download_parallel_shared_session(mocker):
+    mock_retry = mocker.patch(
+        "altimetry_downloader_aviso.tds_client.http_single_download_with_retries"
+    )
+    mock_retry.side_effect = lambda url, *_: f"/tmp/{url.split('/')[-1]}"
+    mock_create = mocker.patch(
+        "altimetry_downloader_aviso.tds_client.create_session",
+        wraps=create_session,
+    )
+
+    urls = ["https://x.com/a.txt", "https://x.com/b.txt", "https://x.com/c.txt"]
+    list(http_bulk_download_parallel(urls, "/tmp", max_workers=3))
+
+    mock_create.assert_called_once_with(3, "testuser", "testpass")
+    sessions = {c.args[-1] for c in mock_retry.call_args_list}
+    assert len(sessions) == 1
+
+    list(http_bulk_download_parallel(urls, "/tmp", max_workers=3, segments=2))
+    mock_create.assert_called_with(6, "testuser", "testpass")
+
+
+def test_http_bulk_download_given_session(mocker):
+    mock_retry = mocker.patch(
+        "altimetry_downloader_aviso.tds_client.http_single_download_with_retries"
+    )
+    mock_retry.side_effect = lambda url, *_: f"/tmp/{url.split('/')[-1]}"
+    session = mocker.Mock()
+
+    urls = ["https://x.com/a.txt", "https://x.com/b.txt"]
+    list(http_bulk_download(urls, "/tmp", session=session))
+    list(http_bulk_download_parallel(urls, "/tmp", session=session))
+
+    assert all(c.args[-1] is session for c in mock_retry.call_args_list)
+    session.close.assert_not_called()
+
+
+def test_http_bulk_download_parallel_lazy(mocker):
+    mock_retry = mocker.patch(
+        "altimetry_downloader_aviso.tds_client.http_single_download_with_retries"
+    )
+    mock_retry.side_effect = lambda url, *_: f"/tmp/{url.split('/')[-1]}"
+    consumed = []
+
+    def urls():
+        for i in range(100):
+            consumed.append(i)
+            yield f"https://x.com/{i}.txt"
+
+    downloads = http_bulk_download_parallel(
+        urls(), "/tmp", max_workers=2, max_in_flight=3
+    )
+    next(downloads)
+    assert len(consumed) == 3
+
+    assert len(list(downloads)) == 99
+    assert len(consumed) == 100
+
+
+def test_http_bulk_download_parallel_early_stop(mocker):
+    mock_retry = mocker.patch(
+        "altimetry_downloader_aviso.tds_client.http_single_download_with_retries"
+    )
+
+    def slow_retry(url, *_):
+        if not url.endswith("/0.txt"):
+            time.sleep(0.05)
+        return f"/tmp/{url.split('/')[-1]}"
+
+    mock_retry.side_effect = slow_retry
+    urls = [f"https://x.com/{i}.txt" for i in range(10)]
+
+    downloads = http_bulk_download_parallel(
+        urls, "/tmp", max_workers=1, max_in_flight=5
+    )
+    next(downloads)
+    downloads.close()
+
+    # Queued downloads are cancelled
+    assert mock_retry.call_count < 5
+
+
+def test_http_bulk_download_parallel_adaptive(mocker, tmp_path):
+    lock = threading.Lock()
+    in_flight = [0, 0]
+
+    def fake_retry(url, *_):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+        time.sleep(0.01)
+        with lock:
+            in_flight[0] -= 1
+
+        name = url.split("/")[-1]
+        if name in ("3.txt", "4.txt"):
+            status_code = 503 if name == "3.txt" else 404
+            raise requests.exceptions.HTTPError(
+                f"{status_code} Error", response=mocker.Mock(status_code=status_code)
+            )
+        path = tmp_path / name
+        path.write_bytes(b"0" * 100)
+        return str(path)
+
+    mocker.patch(
+        "altimetry_downloader_aviso.tds_client.http_single_download_with_retries",
+        side_effect=fake_retry,
+    )
+    record_success = mocker.spy(AdaptiveConcurrency, "record_success")
+    record_failure = mocker.spy(AdaptiveConcurrency, "record_failure")
+    levels = []
+
+    urls = [f"https://x.com/{i}.txt" for i in range(20)]
+    with pytest.warns(UserWarning, match="Failed to download"):
+        results = list(
+            http_bulk_download_parallel(
+                urls,
+                tmp_path,
+                max_workers=4,
+                adaptive=True,
+                on_concurrency_change=levels.append,
+            )
+        )
+
+    assert len(results) == 18
+    assert record_success.call_count == 18
+    assert sorted(c.args[1] for c in record_failure.call_args_list) == [404, 503]
+    assert in_flight[1] <= 4
+    # The server error decreased the concurrency
+    assert any(b < a for a, b in zip([2] + levels, levels))
+
+
+def test_http_bulk_download_parallel_bad_max_in_flight():
+    with pytest.raises(ValueError, match="max_in_flight must be strictly positive"):
+        list(
+            http_bulk_download_parallel(
+                ["https://x.com/a.txt"], "/tmp", max_in_flight=0
+            )
+        )
+
+
+def _fetch_response(mocker, chunks, content_length=None):
+    response = mocker.Mock()
+    response.headers = (
+        {"Content-Length": str(content_length)} if content_length is not None else {}
+    )
+    response.iter_content.return_value = list(chunks)
+    return response
+
+
+@pytest.mark.parametrize("content_length", [10, None, 5])
+def test_http_fetch(mocker, content_length):
+    response = _fetch_response(mocker, [b"dummy", b" data"], content_length)
+    mocker.patch("requests.get", return_value=response)
+    budget = ByteBudget(100)
+
+    with metrics.collect() as download_metrics:
+        content = http_fetch("https://x.com/file.nc", "user", "pass", budget=budget)
+
+    assert isinstance(content, memoryview)
+    assert content == b"dummy data"
+    assert budget.used == 10
+    assert download_metrics.counters[metrics.BYTES] == 10
+    response.close.assert_called()
+
+
+def test_http_fetch_session(mock_session_get):
+    session = create_session(username="user", password="pass")
+    assert http_fetch("https://x.com/file.nc", session=session) == (
+        b"fake file contents"
+    )
+    mock_session_get.assert_called_once()
+
+
+def test_http_fetch_truncated(mocker):
+    response = _fetch_response(mocker, [b"dummy"], 10)
+    mocker.patch("requests.get", return_value=response)
+    budget = ByteBudget(100)
+
+    with pytest.raises(requests.HTTPError, match="Received 5 bytes instead of 10"):
+        http_fetch("https://x.com/file.nc", "user", "pass", budget=budget)
+    assert budget.used == 0
+
+
+def test_http_fetch_bad_chunk_size():
+    with pytest.raises(ValueError):
+        http_fetch("https://x.com/file.nc", chunk_size=0)
+
+
+def _fake_fetch_get(mocker, sizes):
+    def get(url, **kwargs):
+        size = sizes[url.split("/")[-1]]
+        if size is None:
+            raise requests.exceptions.HTTPError(
+                "404 Error", response=mocker.Mock(status_code=404)
+            )
+        return _fetch_response(mocker, [b"0" * size], size)
+
+    return mocker.patch("requests.Session.get", side_effect=get)
+
+
+def test_http_bulk_fetch(mocker):
+    _fake_fetch_get(mocker, {"a.nc": 10, "b.nc": None, "c.nc": 30})
+    urls = [f"https://x.com/{name}" for name in ("a.nc", "b.nc", "c.nc")]
+
+    with pytest.warns(UserWarning, match="Failed to download"):
+        results = dict(http_bulk_fetch(urls, retries=1, max_workers=2))
+
+    assert {url.split("/")[-1]: len(content) for url, content in results.items()} == {
+        "a.nc": 10,
+        "c.nc": 30,
+    }
+
+
+def test_http_bulk_fetch_budget(mocker):
+    sizes = {f"{i}.nc": 40 for i in range(10)}
+    get = _fake_fetch_get(mocker, sizes)
+    urls = [f"https://x.com/{name}" for name in sizes]
+    held = []
+
+    def acquire(self, size, block=True):
+        original_acquire(self, size, block)
+        held.append(self.used)
+
+    original_acquire = ByteBudget.acquire
+    mocker.patch.object(ByteBudget, "acquire", acquire)
+
+    for url, content in http_bulk_fetch(urls, max_workers=4, max_bytes_in_flight=100):
+        assert len(content) == 40
+
+    assert get.call_count == 10
+    assert max(held) <= 100
+
+
+def test_http_bulk_fetch_early_stop(mocker):
+    sizes = {f"{i}.nc": 40 for i in range(10)}
+    get = _fake_fetch_get(mocker, sizes)
+    urls = [f"https://x.com/{name}" for name in sizes]
+
+    fetches = http_bulk_fetch(urls, max_workers=2, max_bytes_in_flight=50)
+    next(fetches)
+    # The workers blocked on the budget are released
+    fetches.close()
+
+    assert get.call_count < 10